@@ -13,7 +13,7 @@ db = SQLAlchemy()
 bcrypt = Bcrypt()
 jwt = JWTManager()
 
-def create_app():
+def create_app(test_config=None):
     app = Flask(__name__)
 
     # Конфигурация
@@ -22,12 +22,59 @@ def create_app():
     app.config['SECRET_KEY'] = 'supersecretkey'
     app.config['JWT_SECRET_KEY'] = 'your_jwt_secret_key'
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = 86400  # Токен действителен 24 часа
+    app.config['REVOCATION_SYNC_INTERVAL'] = 5  # Как часто процесс подтягивает новые отзывы токенов, с
+    app.config['SUGGEST_REFRESH_INTERVAL'] = 300  # Период полной перестройки индекса автодополнения, с
+    app.config['FACETS_REFRESH_INTERVAL'] = 300  # Период полной перестройки битовых индексов фасетов каталога, с
+    app.config['RECOMMENDATIONS_TOP_K'] = 20  # Сколько похожих курсов хранить для каждого курса
+    app.config['RECOMMENDATIONS_USE_RATINGS'] = False  # Вес записи на курс - оценка из отзыва / 3 (и при перестройке, и при обновлениях)
+    app.config['LEADERBOARD_REFRESH_INTERVAL'] = 300  # Как часто перечитывать рейтинг курса из таблицы, с
+    app.config['LEADERBOARD_CACHE_COURSES'] = 256  # Сколько рейтингов курсов держать в памяти процесса
+    app.config['LEADERBOARD_TOP_K'] = 100  # Сколько лучших студентов курса держать в памяти (предел limit)
+    app.config['ANALYTICS_CACHE_TTL'] = 60  # Как долго переиспользовать загруженные в NumPy оценки для статистики, с
+    app.config['USER_STATE_CACHE_TTL'] = 30  # Как долго кешировать роль пользователя для проверки прав, с
+    app.config['BCRYPT_LOG_ROUNDS'] = 12  # Стоимость bcrypt (подбирается командой flask calibrate-bcrypt)
+    app.config['PASSWORD_HASH_WORKERS'] = 4  # Сколько паролей хешируется одновременно
+    app.config['PASSWORD_HASH_QUEUE_SIZE'] = 64  # Сколько запросов может ждать своей очереди на хеширование
+    app.config['PASSWORD_HASH_QUEUE_TIMEOUT'] = 5.0  # Сколько ждать места в очереди, прежде чем ответить 503
+    app.config['TEXT_COMPRESSION'] = 'zlib'  # Сжатие текстов модулей и уведомлений: zlib, zstd (нужен zstandard) или none
     app.config['UPLOAD_FOLDER'] = 'uploads'  # Папка для загрузки файлов
+    app.config['EXPORT_FOLDER'] = 'exports'  # Каталог колоночной выгрузки по умолчанию (flask export-columnar)
+    app.config['UPLOAD_CHUNK_MAX_SIZE'] = 8 * 1024 * 1024  # Максимальный размер части при загрузке по частям
+    app.config['PREVIEW_WORKERS'] = 2  # Количество процессов для построения превью вложений
+    app.config['MODULE_STORAGE_QUOTA'] = None  # Квота вложений модуля в байтах (None - без ограничений)
+    app.config['COURSE_STORAGE_QUOTA'] = None  # Квота вложений курса в байтах (None - без ограничений)
+    app.config['UPLOAD_SESSION_TTL'] = 86400  # Время жизни незавершенной загрузки по частям, с
+    app.config['PROFILING_ENABLED'] = False  # Профилирование запросов: заголовок Server-Timing и журнал <app>.profiling
+    app.config['PROFILING_SAMPLE_RATE'] = 1.0  # Доля профилируемых запросов (0..1)
+    app.config['PROFILING_SERVER_TIMING'] = True  # Отдавать ли замеры клиенту в заголовке Server-Timing
+    app.config['METRICS_ENABLED'] = True  # Сбор метрик процесса в формате Prometheus
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')  # Токен сборщика для GET /metrics (Authorization: Bearer ...; не задан - 401)
+    app.config['METRICS_DIR'] = None  # Каталог файлов метрик процессов для pre-fork воркеров (None - один процесс)
+    app.config['METRICS_FLUSH_INTERVAL'] = 5  # Как часто процесс сохраняет свои метрики в METRICS_DIR, с
+    app.config['SLOW_QUERY_THRESHOLD_MS'] = 500  # Порог журнала медленных SQL-запросов, мс (None - журнал выключен)
+    app.config['SLOW_QUERY_LOG'] = 'slow_queries.log'  # Файл журнала в instance-каталоге
+    app.config['SLOW_QUERY_LOG_MAX_BYTES'] = 10 * 1024 * 1024  # Размер файла журнала до ротации
+    app.config['SLOW_QUERY_LOG_BACKUPS'] = 5  # Сколько старых файлов журнала хранить
+    app.config['SLOW_QUERY_EXPLAIN'] = True  # Сохранять ли EXPLAIN QUERY PLAN медленного запроса
+    app.config['ORPHAN_SWEEP_INTERVAL'] = 0  # Период фоновой очистки файлов-сирот, с (0 - только flask sweep-uploads)
+
+    # Переопределение настроек (тесты: отдельная база, каталоги и дешевый bcrypt)
+    if test_config is not None:
+        app.config.update(test_config)
 
     # Инициализация
     db.init_app(app)
     bcrypt.init_app(app)
     jwt.init_app(app)
+    from .passwords import password_hasher
+    from . import revocation, profiling, metrics, slowlog, cohorts, storage
+    password_hasher.init_app(app)
+    revocation.init_app(app)
+    profiling.init_app(app)
+    metrics.init_app(app)
+    slowlog.init_app(app)
+    cohorts.init_app(app)  # Колонка enrollments.milestone в базах, созданных до когорт
+    storage.init_app(app)  # Колонки attachments и таблицы хранилища blobs в старых базах
     migrate = Migrate(app, db)
     CORS(app)  # Включаем поддержку CORS для всех маршрутов
 
@@ -36,11 +83,31 @@ def create_app():
     from .courses import course_bp
     from .notifications import notification_bp
     from .attachments import attachment_bp
+    from .search import search_bp
+    from .recommendations import recommendation_bp
+    from .leaderboards import leaderboard_bp
+    from .gradebook import gradebook_bp
+    from .analytics import analytics_bp
+    from .rollups import rollup_bp
+    from .cohorts import cohort_bp
+    from .sketches import sketch_bp
+    from .export import export_bp
+    from .slowlog import slowlog_bp
 
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(course_bp, url_prefix='/api')
     app.register_blueprint(notification_bp, url_prefix='/api')
     app.register_blueprint(attachment_bp, url_prefix='/api')
+    app.register_blueprint(search_bp, url_prefix='/api')
+    app.register_blueprint(recommendation_bp, url_prefix='/api')
+    app.register_blueprint(leaderboard_bp, url_prefix='/api')
+    app.register_blueprint(gradebook_bp, url_prefix='/api')
+    app.register_blueprint(analytics_bp, url_prefix='/api')
+    app.register_blueprint(rollup_bp, url_prefix='/api')
+    app.register_blueprint(cohort_bp, url_prefix='/api')
+    app.register_blueprint(sketch_bp, url_prefix='/api')
+    app.register_blueprint(export_bp, url_prefix='/api')
+    app.register_blueprint(slowlog_bp, url_prefix='/api')
 
     # Добавляем обработку ошибок
     @app.errorhandler(404)
@@ -57,6 +124,7 @@ def create_app():
     def init_db_command():
         """Инициализация базы данных."""
         from .models import create_triggers
+        from .search import create_search_index
         
         # Убедимся, что instance директория существует
         os.makedirs(os.path.join(app.root_path, '..', 'instance'), exist_ok=True)
@@ -66,11 +134,46 @@ def create_app():
         
         # Создание триггеров
         try:
+            create_search_index()
             create_triggers()
             click.echo('База данных и триггеры успешно инициализированы.')
         except Exception as e:
             click.echo(f'Ошибка при создании триггеров: {e}')
     
     app.cli.add_command(init_db_command)
+
+    from .storage import dedupe_uploads_command, rebuild_storage_usage_command
+    from .previews import generate_previews_command
+    from .passwords import calibrate_bcrypt_command
+    from .revocation import prune_revoked_tokens_command
+    from .search import rebuild_search_index_command
+    from .recommendations import rebuild_recommendations_command
+    from .leaderboards import rebuild_leaderboards_command
+    from .textstore import migrate_text_columns_command
+    from .rendering import prerender_modules_command
+    from .rollups import backfill_activity_rollups_command
+    from .cohorts import rebuild_cohorts_command
+    from .reports import create_missing_indexes_command
+    from .sketches import rebuild_activity_sketches_command
+    from .export import export_columnar_command
+    from .sweeper import sweep_uploads_command, start_sweeper
+    app.cli.add_command(dedupe_uploads_command)
+    app.cli.add_command(rebuild_storage_usage_command)
+    app.cli.add_command(generate_previews_command)
+    app.cli.add_command(sweep_uploads_command)
+    app.cli.add_command(calibrate_bcrypt_command)
+    app.cli.add_command(prune_revoked_tokens_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(rebuild_recommendations_command)
+    app.cli.add_command(rebuild_leaderboards_command)
+    app.cli.add_command(migrate_text_columns_command)
+    app.cli.add_command(prerender_modules_command)
+    app.cli.add_command(backfill_activity_rollups_command)
+    app.cli.add_command(rebuild_cohorts_command)
+    app.cli.add_command(create_missing_indexes_command)
+    app.cli.add_command(rebuild_activity_sketches_command)
+    app.cli.add_command(export_columnar_command)
+
+    start_sweeper(app)  # Фоновая очистка стартует с первым HTTP-запросом
     
     return app
@@ -0,0 +1,241 @@
+import threading
+import time
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required
+from sqlalchemy import text
+from .models import db
+from .reports import ReportWindow
+from . import metrics
+
+try:
+    import numpy as np
+except ImportError:  # NumPy не установлен - эндпоинты распределений недоступны
+    np = None
+
+analytics_bp = Blueprint('analytics', __name__)
+
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+MAX_GRADE = 5.0
+GRADE_BINS = 10                                  # корзины гистограммы по 0.5 балла
+PROGRESS_THRESHOLDS = tuple(range(0, 101, 10))   # точки кривой завершения, %
+
+# Размер порции при чтении строк из БД
+_FETCH_SIZE = 100000
+
+def _stream_columns(sql, dtypes, params=None):
+    """Прочитать результат запроса в массивы NumPy за один проход порциями"""
+    result = db.session.execute(text(sql), params or {})
+    chunks = []
+    while True:
+        rows = result.fetchmany(_FETCH_SIZE)
+        if not rows:
+            break
+        # Строки SQLAlchemy NumPy разбирает поэлементно, кортежи - на порядок быстрее
+        chunks.append(np.array([tuple(row) for row in rows], dtype=np.float64).reshape(len(rows), len(dtypes)))
+    if not chunks:
+        return [np.empty(0, dtype) for dtype in dtypes]
+    data = np.concatenate(chunks)
+    return [data[:, i].astype(dtype) for i, dtype in enumerate(dtypes)]
+
+def group_stats(keys, values):
+    """Векторизованная статистика values по группам keys.
+
+    Одна сортировка по (ключ, значение); суммы - np.add.reduceat по границам
+    групп, квантили - линейная интерполяция по отсортированным значениям
+    внутри группы, гистограмма - np.bincount по (группа, корзина).
+    """
+    if not len(keys):
+        return {'groups': keys, 'count': keys}
+
+    # Сортировка по (ключ, значение) одним argsort составного ключа: шаг между
+    # ключами больше разброса значений, поэтому группы не перемешиваются
+    offset = values.min()
+    step = float(values.max() - offset) + 1.0
+    order = np.argsort(keys * step + (values - offset))
+    keys, values = keys[order], values[order]
+
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    counts = np.diff(np.append(starts, len(keys)))
+    groups = keys[starts]
+
+    means = np.add.reduceat(values, starts) / counts
+    squares = np.add.reduceat(values * values, starts) / counts
+    stds = np.sqrt(np.maximum(squares - means * means, 0.0))
+
+    quantiles = {}
+    for q in QUANTILES:
+        position = starts + q * (counts - 1)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        quantiles[q] = values[low] + (values[high] - values[low]) * (position - low)
+
+    bins = np.clip((values / MAX_GRADE * GRADE_BINS).astype(np.int64), 0, GRADE_BINS - 1)
+    group_index = np.repeat(np.arange(len(groups)), counts)
+    histogram = np.bincount(
+        group_index * GRADE_BINS + bins, minlength=len(groups) * GRADE_BINS
+    ).reshape(len(groups), GRADE_BINS)
+
+    return {
+        'groups': groups,
+        'count': counts,
+        'mean': means,
+        'std': stds,
+        'min': values[starts],
+        'max': values[starts + counts - 1],
+        'quantiles': quantiles,
+        'histogram': histogram,
+    }
+
+def completion_curves(keys, progress):
+    """Доля записей с прогрессом не ниже каждого порога, по группам"""
+    groups, group_index = np.unique(keys, return_inverse=True)
+    thresholds = np.asarray(PROGRESS_THRESHOLDS, dtype=np.float64)
+    # Номер последнего пройденного порога для каждой записи
+    reached = np.searchsorted(thresholds, progress, side='right') - 1
+    counts = np.bincount(
+        group_index * len(thresholds) + np.clip(reached, 0, None), minlength=len(groups) * len(thresholds)
+    ).reshape(len(groups), len(thresholds))
+    at_least = np.cumsum(counts[:, ::-1], axis=1)[:, ::-1]
+    totals = at_least[:, 0:1]
+    return groups, at_least / np.maximum(totals, 1)
+
+def _stats_json(stats, i):
+    return {
+        'count': int(stats['count'][i]),
+        'mean': round(float(stats['mean'][i]), 4),
+        'std': round(float(stats['std'][i]), 4),
+        'min': float(stats['min'][i]),
+        'max': float(stats['max'][i]),
+        'quantiles': {f'p{int(q * 100)}': round(float(values[i]), 4) for q, values in stats['quantiles'].items()},
+        'histogram': stats['histogram'][i].tolist(),
+    }
+
+class AnalyticsSnapshot:
+    """Оценки и прогресс в массивах NumPy и рассчитанные по ним распределения.
+
+    Загружается одним потоковым проходом по assessments и enrollments и
+    переиспользуется ANALYTICS_CACHE_TTL секунд. Снимок за период (window)
+    читает только строки периода по индексам дат и не кэшируется.
+    """
+
+    def __init__(self, window=None):
+        window = window or ReportWindow()
+        params = {}
+        self.grade_user, self.grade_module, self.grade_course, self.grade = _stream_columns(f"""
+            SELECT a.user_id, a.module_id, m.course_id, a.grade
+            FROM assessments a JOIN modules m ON m.id = a.module_id
+            WHERE 1 = 1{window.sql('a.assessment_date', params, 'm.course_id')}
+        """, (np.int64, np.int64, np.int64, np.float64), params)
+        params = {}
+        self.enrollment_course, self.progress = _stream_columns(f"""
+            SELECT course_id, COALESCE(progress, 0) FROM enrollments
+            WHERE 1 = 1{window.sql('enrollment_date', params, 'course_id')}
+        """, (np.int64, np.float64), params)
+
+        self.modules = group_stats(self.grade_module, self.grade)
+        self.courses = group_stats(self.grade_course, self.grade)
+        # Курс каждого модуля (модуль принадлежит одному курсу)
+        module_ids, first = np.unique(self.grade_module, return_index=True)
+        self.module_course = dict(zip(module_ids.tolist(), self.grade_course[first].tolist()))
+        self.curve_courses, self.curves = completion_curves(self.enrollment_course, self.progress)
+        self.built_at = time.monotonic()
+
+    def module_distributions(self, course_id=None):
+        stats = self.modules
+        result = []
+        for i, module_id in enumerate(stats['groups'].tolist()):
+            owner = self.module_course.get(module_id)
+            if course_id is not None and owner != course_id:
+                continue
+            result.append({'module_id': module_id, 'course_id': owner, **_stats_json(stats, i)})
+        return result
+
+    def course_distributions(self, course_id=None):
+        curves = dict(zip(self.curve_courses.tolist(), self.curves))
+        stats = self.courses
+        result = []
+        for i, group in enumerate(stats['groups'].tolist()):
+            if course_id is not None and group != course_id:
+                continue
+            item = {'course_id': group, **_stats_json(stats, i)}
+            curve = curves.get(group)
+            item['completion_curve'] = [
+                {'progress': threshold, 'share': round(float(share), 4)}
+                for threshold, share in zip(PROGRESS_THRESHOLDS, curve)
+            ] if curve is not None else []
+            result.append(item)
+        return result
+
+    def student_scores(self, course_id):
+        """Средняя оценка каждого студента курса и ее z-оценка среди студентов курса"""
+        mask = self.grade_course == course_id
+        users, inverse = np.unique(self.grade_user[mask], return_inverse=True)
+        if not len(users):
+            return []
+        counts = np.bincount(inverse)
+        means = np.bincount(inverse, weights=self.grade[mask]) / counts
+        spread = means.std()
+        z = (means - means.mean()) / spread if spread > 0 else np.zeros_like(means)
+        order = np.argsort(-means, kind='stable')
+        return [{
+            'user_id': int(users[i]),
+            'assessments': int(counts[i]),
+            'average_grade': round(float(means[i]), 4),
+            'z_score': round(float(z[i]), 4)
+        } for i in order]
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+def get_snapshot(window=None):
+    """Общий кэшированный снимок или, для периода from/to, отдельный снимок периода"""
+    global _snapshot
+    if window is not None and window.bounded:
+        return AnalyticsSnapshot(window)
+    ttl = current_app.config.get('ANALYTICS_CACHE_TTL', 60)
+    with _snapshot_lock:
+        fresh = _snapshot is not None and time.monotonic() - _snapshot.built_at <= ttl
+        metrics.cache_hit('analytics_snapshot', fresh)
+        if not fresh:
+            _snapshot = AnalyticsSnapshot()
+        return _snapshot
+
+def _unavailable():
+    return jsonify({'message': 'Для статистики распределений нужен numpy'}), 503
+
+# Распределение оценок по модулям
+@analytics_bp.route('/statistics/distributions/modules', methods=['GET'])
+@jwt_required()
+def get_module_distributions():
+    if np is None:
+        return _unavailable()
+    try:
+        window = ReportWindow.from_args(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    return jsonify(get_snapshot(window).module_distributions(window.course_id))
+
+# Распределение оценок и кривая завершения по курсам
+@analytics_bp.route('/statistics/distributions/courses', methods=['GET'])
+@jwt_required()
+def get_course_distributions():
+    if np is None:
+        return _unavailable()
+    try:
+        window = ReportWindow.from_args(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    return jsonify(get_snapshot(window).course_distributions(window.course_id))
+
+# Средние оценки студентов курса и их z-оценки
+@analytics_bp.route('/statistics/distributions/courses/<int:course_id>/students', methods=['GET'])
+@jwt_required()
+def get_student_scores(course_id):
+    if np is None:
+        return _unavailable()
+    try:
+        window = ReportWindow.from_args(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    window.course_id = course_id
+    return jsonify(get_snapshot(window).student_scores(course_id))
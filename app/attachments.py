@@ -1,9 +1,13 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, send_file, url_for
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
+import hashlib
 import os
-from datetime import datetime
-from .models import db, Module, Attachment, Notification
+import uuid
+from .models import db, Module, Attachment, Notification, UploadSession, StorageUsage, ActivityRollup
+from . import storage, previews
+from .facets import facet_index
+from .reports import ReportWindow
 
 attachment_bp = Blueprint('attachments', __name__)
 
@@ -13,6 +17,11 @@ ALLOWED_EXTENSIONS = {'txt', 'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx',
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _preview_url(attachment):
+    if not attachment.preview_path:
+        return None
+    return url_for('attachments.get_attachment_preview', attachment_id=attachment.id)
+
 # Получение вложений для модуля
 @attachment_bp.route('/modules/<int:module_id>/attachments', methods=['GET'])
 def get_module_attachments(module_id):
@@ -24,6 +33,7 @@ def get_module_attachments(module_id):
         'file_path': attachment.file_path,
         'file_type': attachment.file_type,
         'file_size': attachment.file_size,
+        'preview_url': _preview_url(attachment),
         'uploaded_at': attachment.uploaded_at.isoformat()
     } for attachment in attachments]
 
@@ -41,6 +51,7 @@ def get_course_attachments(course_id):
         'file_path': attachment.file_path,
         'file_type': attachment.file_type,
         'file_size': attachment.file_size,
+        'preview_url': _preview_url(attachment),
         'uploaded_at': attachment.uploaded_at.isoformat()
     } for attachment in attachments]
 
@@ -63,34 +74,44 @@ def upload_attachment(module_id):
     if not allowed_file(file.filename):
         return jsonify({'message': 'Недопустимый тип файла'}), 400
 
-    # Создание директории для загрузки, если ее нет
-    upload_dir = os.path.join(current_app.config.get('UPLOAD_FOLDER', 'uploads'), f'module_{module_id}')
-    os.makedirs(upload_dir, exist_ok=True)
-
-    # Сохранение файла
+    # Потоковая запись во временный файл с вычислением sha256
     filename = secure_filename(file.filename)
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    unique_filename = f"{timestamp}_{filename}"
-    file_path = os.path.join(upload_dir, unique_filename)
-    file.save(file_path)
+    tmp_path, digest, file_size = storage.stream_to_temp(file.stream)
 
-    # Определение типа файла и размера
-    file_type = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
-    file_size = os.path.getsize(file_path)
+    return _save_attachment(module, filename, tmp_path, digest, file_size)
 
-    # Относительный путь для сохранения в базе данных
-    relative_path = os.path.join(f'module_{module_id}', unique_filename)
+def _save_attachment(module, filename, tmp_path, digest, file_size, upload_session=None):
+    """Поместить загруженный файл в хранилище, создать запись и уведомления.
+
+    Для загрузки по частям (upload_session) при превышении квоты сессия и
+    временный файл сохраняются: освободив место, клиент может повторить
+    завершение. При ошибке сессия удаляется вместе с файлом.
+    """
+    quota_error = storage.check_quota(module, file_size)
+    if quota_error:
+        if upload_session is None:
+            os.remove(tmp_path)
+        return jsonify({'message': quota_error}), 413
+
+    # Определение типа файла
+    file_type = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
 
     # Создание записи в базе данных
     try:
+        # Одинаковое содержимое хранится на диске один раз
+        relative_path = storage.store_file(tmp_path, digest, file_size)
+
         attachment = Attachment(
-            module_id=module_id,
+            module_id=module.id,
             filename=filename,
             file_path=relative_path,
             file_type=file_type,
-            file_size=file_size
+            file_size=file_size,
+            content_hash=digest
         )
         db.session.add(attachment)
+        storage.account_usage(module, file_size, 1)
+        ActivityRollup.record('upload', module.course_id)
 
         # Создание уведомлений для всех пользователей, зарегистрированных на курс
         from .models import Enrollment, Notification
@@ -104,18 +125,238 @@ def upload_attachment(module_id):
             )
             db.session.add(notification)
 
-        db.session.commit()
+        if upload_session is not None:
+            db.session.delete(upload_session)
 
-        return jsonify({
-            'message': 'Файл успешно загружен',
-            'attachment_id': attachment.id,
-            'filename': filename,
-            'file_path': relative_path
-        }), 201
+        db.session.commit()
+        facet_index.add_attachments(module.course_id, 1)
+        attachment_id = attachment.id
     except Exception as e:
         db.session.rollback()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if upload_session is not None:
+            # Без временного файла сессию не завершить - клиент начинает загрузку заново
+            db.session.delete(upload_session)
+            db.session.commit()
         return jsonify({'message': f'Ошибка при загрузке файла: {str(e)}'}), 500
 
+    # Превью строится в фоне; если оно уже есть у такого же содержимого - сразу отмечаем.
+    # Вложение уже сохранено, поэтому сбой постановки в очередь только журналируется.
+    try:
+        if previews.schedule_preview(attachment):
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning('Не удалось поставить в очередь превью вложения %s: %s', attachment_id, e)
+
+    return jsonify({
+        'message': 'Файл успешно загружен',
+        'attachment_id': attachment_id,
+        'filename': filename,
+        'file_path': relative_path
+    }), 201
+
+# ========== Возобновляемая загрузка по частям ==========
+
+# Текущие хеши незавершенных загрузок этого процесса: upload_id -> (offset, sha256).
+# Если очередную часть принял другой процесс, хеш пересчитывается при завершении.
+_upload_hashers = {}
+
+def prune_upload_hashers(active_ids):
+    """Забыть хеши загрузок, сессий которых больше нет (просрочены или завершены другим процессом)"""
+    for upload_id in list(_upload_hashers):
+        if upload_id not in active_ids:
+            _upload_hashers.pop(upload_id, None)
+
+def _get_upload_session(upload_id):
+    current_user = get_jwt_identity()
+    upload = UploadSession.query.get_or_404(upload_id)
+    if upload.user_id != current_user['id']:
+        return None
+    return upload
+
+# Создание сессии загрузки
+@attachment_bp.route('/modules/<int:module_id>/uploads', methods=['POST'])
+@jwt_required()
+def create_upload_session(module_id):
+    module = Module.query.get_or_404(module_id)  # Проверка существования модуля
+    current_user = get_jwt_identity()
+    data = request.get_json()
+
+    filename = secure_filename(data.get('filename') or '')
+    total_size = data.get('total_size')
+
+    if not filename:
+        return jsonify({'message': 'Не выбран файл'}), 400
+
+    if not allowed_file(filename):
+        return jsonify({'message': 'Недопустимый тип файла'}), 400
+
+    if total_size is not None and (not isinstance(total_size, int) or total_size < 0):
+        return jsonify({'message': 'Некорректный размер файла'}), 400
+
+    if total_size is not None:
+        # Ранний отказ, чтобы клиент не передавал файл, который не поместится
+        quota_error = storage.check_quota(module, total_size)
+        if quota_error:
+            return jsonify({'message': quota_error}), 413
+
+    upload = UploadSession(
+        id=uuid.uuid4().hex,
+        module_id=module_id,
+        user_id=current_user['id'],
+        filename=filename,
+        total_size=total_size,
+        received_size=0
+    )
+    storage.temp_dir()
+    open(storage.absolute_path(upload.temp_path), 'wb').close()
+    _upload_hashers[upload.id] = (0, hashlib.sha256())
+
+    db.session.add(upload)
+    db.session.commit()
+
+    return jsonify({
+        'upload_id': upload.id,
+        'offset': 0,
+        'max_chunk_size': current_app.config.get('UPLOAD_CHUNK_MAX_SIZE', 8 * 1024 * 1024)
+    }), 201
+
+# Состояние сессии загрузки (для возобновления после обрыва)
+@attachment_bp.route('/uploads/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_upload_session(upload_id):
+    upload = _get_upload_session(upload_id)
+    if upload is None:
+        return jsonify({'message': 'Нет доступа к этой загрузке'}), 403
+
+    return jsonify({
+        'upload_id': upload.id,
+        'filename': upload.filename,
+        'offset': upload.received_size,
+        'total_size': upload.total_size
+    })
+
+# Прием очередной части файла: PUT /uploads/<id>?offset=N, тело - байты части
+@attachment_bp.route('/uploads/<upload_id>', methods=['PUT'])
+@jwt_required()
+def upload_chunk(upload_id):
+    upload = _get_upload_session(upload_id)
+    if upload is None:
+        return jsonify({'message': 'Нет доступа к этой загрузке'}), 403
+
+    offset = request.args.get('offset', type=int)
+    if offset != upload.received_size:
+        # Клиент должен продолжить с последнего подтвержденного смещения
+        return jsonify({'message': 'Неверное смещение части', 'offset': upload.received_size}), 409
+
+    max_chunk_size = current_app.config.get('UPLOAD_CHUNK_MAX_SIZE', 8 * 1024 * 1024)
+    if request.content_length is None or request.content_length > max_chunk_size:
+        return jsonify({'message': f'Размер части должен быть указан и не превышать {max_chunk_size} байт'}), 413
+
+    if upload.total_size is not None and offset + request.content_length > upload.total_size:
+        return jsonify({'message': 'Часть выходит за пределы объявленного размера файла'}), 400
+
+    cached = _upload_hashers.get(upload.id)
+    file_hasher = cached[1].copy() if cached and cached[0] == offset else None
+    chunk_hasher = hashlib.sha256()
+    written = 0
+
+    # Часть читается из потока блоками, поэтому память не зависит от ее размера
+    temp_path = storage.absolute_path(upload.temp_path)
+    with open(temp_path, 'r+b') as out:
+        out.seek(offset)
+        while True:
+            block = request.stream.read(storage.CHUNK_SIZE)
+            if not block:
+                break
+            out.write(block)
+            chunk_hasher.update(block)
+            if file_hasher is not None:
+                file_hasher.update(block)
+            written += len(block)
+
+        expected = request.headers.get('X-Chunk-SHA256')
+        if written != request.content_length or (expected and expected.lower() != chunk_hasher.hexdigest()):
+            # Поврежденная или оборванная часть отбрасывается
+            out.truncate(offset)
+            return jsonify({'message': 'Контрольная сумма части не совпадает', 'offset': offset}), 400
+
+        out.truncate(offset + written)
+
+    upload.received_size = offset + written
+    db.session.commit()
+
+    if file_hasher is not None:
+        _upload_hashers[upload.id] = (upload.received_size, file_hasher)
+    else:
+        _upload_hashers.pop(upload.id, None)
+
+    return jsonify({'offset': upload.received_size, 'chunk_sha256': chunk_hasher.hexdigest()})
+
+# Завершение загрузки: файл атомарно переносится в хранилище
+@attachment_bp.route('/uploads/<upload_id>/finalize', methods=['POST'])
+@jwt_required()
+def finalize_upload(upload_id):
+    upload = _get_upload_session(upload_id)
+    if upload is None:
+        return jsonify({'message': 'Нет доступа к этой загрузке'}), 403
+
+    if upload.total_size is not None and upload.received_size != upload.total_size:
+        return jsonify({'message': 'Файл загружен не полностью', 'offset': upload.received_size}), 409
+
+    temp_path = storage.absolute_path(upload.temp_path)
+    if not os.path.exists(temp_path):
+        _upload_hashers.pop(upload.id, None)
+        db.session.delete(upload)
+        db.session.commit()
+        return jsonify({'message': 'Временный файл загрузки не найден, начните загрузку заново'}), 410
+
+    cached = _upload_hashers.pop(upload.id, None)
+    if cached and cached[0] == upload.received_size:
+        digest = cached[1].hexdigest()
+    else:
+        digest = storage.hash_file(temp_path)
+
+    expected = (request.get_json(silent=True) or {}).get('sha256')
+    if expected and expected.lower() != digest:
+        return jsonify({'message': 'Контрольная сумма файла не совпадает'}), 400
+
+    return _save_attachment(upload.module, upload.filename, temp_path, digest,
+                            upload.received_size, upload_session=upload)
+
+# Отмена загрузки
+@attachment_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def abort_upload(upload_id):
+    upload = _get_upload_session(upload_id)
+    if upload is None:
+        return jsonify({'message': 'Нет доступа к этой загрузке'}), 403
+
+    temp_path = storage.absolute_path(upload.temp_path)
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    _upload_hashers.pop(upload.id, None)
+
+    db.session.delete(upload)
+    db.session.commit()
+
+    return jsonify({'message': 'Загрузка отменена'})
+
+# Получение превью вложения
+@attachment_bp.route('/attachments/<int:attachment_id>/preview', methods=['GET'])
+def get_attachment_preview(attachment_id):
+    attachment = Attachment.query.get_or_404(attachment_id)
+    if not attachment.preview_path:
+        return jsonify({'message': 'Превью еще не готово'}), 404
+
+    response = send_file(os.path.abspath(storage.absolute_path(attachment.preview_path)), mimetype='image/png')
+    # Превью адресовано содержимым и не меняется
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400
+    return response
+
 # Удаление вложения
 @attachment_bp.route('/attachments/<int:attachment_id>', methods=['DELETE'])
 @jwt_required()
@@ -123,14 +364,28 @@ def delete_attachment(attachment_id):
     attachment = Attachment.query.get_or_404(attachment_id)
 
     try:
-        # Удаление файла с диска
-        file_path = os.path.join(current_app.config.get('UPLOAD_FOLDER', 'uploads'), attachment.file_path)
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        content_hash = attachment.content_hash
+        course_id = attachment.module.course_id
+        storage.account_usage(attachment.module, -(attachment.file_size or 0), -1)
+        if attachment.uploaded_at is not None:
+            ActivityRollup.record('upload', course_id, attachment.uploaded_at, -1)
 
         # Удаление записи из базы данных
         db.session.delete(attachment)
+        db.session.flush()
+
+        # Файл удаляется только вместе с последней ссылкой на blob и только после коммита
+        released = storage.release_reference(content_hash) if content_hash else False
+        legacy_path = None if content_hash else storage.absolute_path(attachment.file_path)
+
         db.session.commit()
+        facet_index.add_attachments(course_id, -1)
+
+        if released:
+            storage.remove_unreferenced_blob(content_hash)
+        elif legacy_path and os.path.exists(legacy_path):
+            # Вложение загружено до перехода на хранилище blobs
+            os.remove(legacy_path)
 
         return jsonify({'message': 'Вложение успешно удалено'})
     except Exception as e:
@@ -141,26 +396,40 @@ def delete_attachment(attachment_id):
 @attachment_bp.route('/modules/attachment-statistics', methods=['GET'])
 @jwt_required()
 def get_module_attachment_statistics():
-    # Запрос с вычисляемыми полями:
-    # 1. Количество вложений
-    # 2. Суммарный размер вложений
-    # 3. Средний размер вложения
+    try:
+        window = ReportWindow.from_args(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    if window.bounded:
+        # За период агрегируются только вложения, загруженные в нем (индекс по uploaded_at)
+        totals = db.session.query(
+            Attachment.module_id,
+            db.func.count(Attachment.id).label('file_count'),
+            db.func.coalesce(db.func.sum(Attachment.file_size), 0).label('total_bytes')
+        ).filter(
+            *window.conditions(Attachment.uploaded_at)
+        ).group_by(Attachment.module_id).subquery()
+        count_column, size_column = totals.c.file_count, totals.c.total_bytes
+        join = (totals, totals.c.module_id == Module.id)
+    else:
+        # Счетчики поддерживаются при загрузке и удалении (см. storage.account_usage),
+        # поэтому агрегировать всю таблицу attachments не нужно
+        count_column, size_column = StorageUsage.file_count, StorageUsage.total_bytes
+        join = (StorageUsage, db.and_(StorageUsage.scope == 'module', StorageUsage.scope_id == Module.id))
 
     module_stats = db.session.query(
         Module.id.label('module_id'),
         Module.title.label('module_title'),
-        db.func.count(Attachment.id).label('attachment_count'),
-        db.func.sum(Attachment.file_size).label('total_size'),
-        (db.func.sum(Attachment.file_size) / (1024.0 * 1024.0)).label('total_size_mb'),
-        (db.func.avg(Attachment.file_size) / 1024.0).label('avg_size_kb')
-    ).outerjoin(
-        Attachment, Module.id == Attachment.module_id
-    ).group_by(
-        Module.id, Module.title
-    ).having(
-        db.func.count(Attachment.id) > 0
+        count_column.label('attachment_count'),
+        size_column.label('total_size')
+    ).join(
+        *join
+    ).filter(
+        count_column > 0,
+        *window.conditions(None, Module.course_id)
     ).order_by(
-        db.func.count(Attachment.id).desc()
+        count_column.desc()
     ).all()
 
     result = [{
@@ -168,8 +437,8 @@ def get_module_attachment_statistics():
         'module_title': stat.module_title,
         'attachment_count': stat.attachment_count,
         'total_size': stat.total_size,
-        'total_size_mb': round(float(stat.total_size_mb), 2) if stat.total_size_mb else 0,
-        'avg_size_kb': round(float(stat.avg_size_kb), 2) if stat.avg_size_kb else 0
+        'total_size_mb': round(stat.total_size / (1024.0 * 1024.0), 2),
+        'avg_size_kb': round(stat.total_size / stat.attachment_count / 1024.0, 2)
     } for stat in module_stats]
 
     return jsonify(result)
@@ -1,10 +1,18 @@
 from flask import Blueprint, request, jsonify
 from .models import db, User
-from . import bcrypt
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from .passwords import password_hasher, PasswordHasherBusy
+from .authz import token_claims, current_user_state, user_state_cache, require_role
+from .revocation import blocklist
+from datetime import datetime
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
 
 auth_bp = Blueprint('auth', __name__)
 
+def _busy_response():
+    response = jsonify({'message': 'Server is busy, please retry'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 # Регистрация нового пользователя
 @auth_bp.route('/register', methods=['POST'])
 def register():
@@ -16,7 +24,11 @@ def register():
     if not name or not email or not password:
         return jsonify({'message': 'Missing required fields'}), 400
 
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    try:
+        hashed_password = password_hasher.hash(password)
+    except PasswordHasherBusy:
+        return _busy_response()
+
     user = User(name=name, email=email, password_hash=hashed_password)
     db.session.add(user)
     db.session.commit()
@@ -34,8 +46,24 @@ def login():
         return jsonify({'message': 'Missing required fields'}), 400
 
     user = User.query.filter_by(email=email).first()
-    if user and bcrypt.check_password_hash(user.password_hash, password):
-        access_token = create_access_token(identity={'id': user.id, 'email': user.email})
+    try:
+        valid = user is not None and password_hasher.verify(user.password_hash, password)
+    except PasswordHasherBusy:
+        return _busy_response()
+
+    if valid and password_hasher.needs_rehash(user.password_hash):
+        # Стоимость bcrypt изменилась - пересчитываем хеш, пока пароль известен
+        try:
+            user.password_hash = password_hasher.hash(password)
+            db.session.commit()
+        except PasswordHasherBusy:
+            pass  # Пересчитаем при следующем входе
+
+    if valid:
+        access_token = create_access_token(
+            identity={'id': user.id, 'email': user.email},
+            additional_claims=token_claims(user)
+        )
         return jsonify({'access_token': access_token}), 200
     return jsonify({'message': 'Invalid credentials'}), 401
 
@@ -44,5 +72,40 @@ def login():
 @jwt_required()
 def profile():
     current_user = get_jwt_identity()
-    user = User.query.get(current_user['id'])
-    return jsonify({'name': user.name, 'email': user.email}), 200
+    state = current_user_state()
+    if state is None:
+        return jsonify({'message': 'User not found'}), 404
+    return jsonify({'name': state.name, 'email': current_user['email'], 'role': state.role}), 200
+
+# Выход: текущий токен больше не принимается
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    claims = get_jwt()
+    blocklist.revoke_token(
+        claims['jti'],
+        user_id=get_jwt_identity()['id'],
+        expires_at=datetime.utcfromtimestamp(claims['exp'])
+    )
+    return jsonify({'message': 'Successfully logged out'}), 200
+
+# Отзыв токена по jti или всех токенов пользователя (только для администраторов)
+@auth_bp.route('/revoke', methods=['POST'])
+@require_role('admin')
+def revoke():
+    data = request.get_json()
+    jti = data.get('jti')
+    user_id = data.get('user_id')
+
+    if jti:
+        blocklist.revoke_token(jti)
+        return jsonify({'message': 'Token revoked'}), 200
+
+    if user_id:
+        if not User.query.get(user_id):
+            return jsonify({'message': f'User {user_id} not found'}), 404
+        blocklist.revoke_user(user_id)
+        user_state_cache.invalidate(user_id)
+        return jsonify({'message': 'All user tokens revoked'}), 200
+
+    return jsonify({'message': 'Missing required field: jti or user_id'}), 400
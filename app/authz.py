@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from flask import current_app, jsonify
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
+from .models import db, User
+from . import metrics
+
+UserState = namedtuple('UserState', ['role', 'name'])
+
+class UserStateCache:
+    """Небольшой LRU-кеш роли и имени пользователя с ограниченным временем жизни.
+
+    Запрос к БД выполняется не чаще раза в USER_STATE_CACHE_TTL секунд на
+    пользователя в каждом процессе, поэтому смена роли вступает в силу быстро,
+    а проверка прав в обычном случае не обращается к базе.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        ttl = current_app.config.get('USER_STATE_CACHE_TTL', 30)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                metrics.cache_hit('user_state', True)
+                return entry[1]
+            self.misses += 1
+        metrics.cache_hit('user_state', False)
+
+        row = db.session.query(User.role, User.name).filter(User.id == user_id).first()
+        state = UserState(row.role, row.name) if row else None
+
+        with self._lock:
+            self._entries[user_id] = (now + ttl, state)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > current_app.config.get('USER_STATE_CACHE_SIZE', 10000):
+                self._entries.popitem(last=False)
+
+        return state
+
+    def invalidate(self, user_id):
+        """Сбросить запись после изменения роли или удаления пользователя"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+user_state_cache = UserStateCache()
+
+def token_claims(user):
+    """Дополнительные claims access-токена"""
+    return {'role': user.role, 'name': user.name}
+
+def current_user_state():
+    """Роль и имя текущего пользователя.
+
+    Claims токена, выпущенного не раньше чем USER_STATE_CACHE_TTL секунд назад,
+    не старее записи кеша, поэтому используются без обращения к кешу и БД.
+    Для более старых токенов состояние берется из кеша.
+    """
+    claims = get_jwt()
+    ttl = current_app.config.get('USER_STATE_CACHE_TTL', 30)
+    if 'role' in claims and time.time() - claims.get('iat', 0) < ttl:
+        return UserState(claims['role'], claims.get('name'))
+    return user_state_cache.get(get_jwt_identity()['id'])
+
+def require_role(*roles, message='Insufficient permissions'):
+    """Декоратор: доступ только для пользователей с одной из указанных ролей"""
+    def decorator(view):
+        @wraps(view)
+        @jwt_required()
+        def wrapper(*args, **kwargs):
+            state = current_user_state()
+            if state is None or state.role not in roles:
+                return jsonify({'message': message}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,203 @@
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+import click
+from flask import Blueprint, request, jsonify
+from flask.cli import with_appcontext
+from flask_jwt_extended import jwt_required
+from sqlalchemy import text, update
+from sqlalchemy.exc import OperationalError
+from .models import db, Module, Enrollment, Assessment, CohortMilestone
+from .reports import parse_date
+
+cohort_bp = Blueprint('cohorts', __name__)
+
+def ensure_milestone_column():
+    """Добавить enrollments.milestone в базу, созданную до появления когорт.
+
+    Модель Enrollment читает эту колонку в каждом запросе, поэтому проверка
+    выполняется при создании приложения. Таблицы еще может не быть (до init-db),
+    а параллельно стартующий воркер может успеть добавить колонку первым.
+    """
+    columns = {row[1] for row in db.session.execute(text('PRAGMA table_info(enrollments)'))}
+    if not columns or 'milestone' in columns:
+        return
+    try:
+        db.session.execute(text('ALTER TABLE enrollments ADD COLUMN milestone INTEGER NOT NULL DEFAULT 0'))
+        db.session.commit()
+    except OperationalError:
+        db.session.rollback()
+
+def init_app(app):
+    with app.app_context():
+        ensure_milestone_column()
+        db.session.remove()
+
+def _cohort_filters():
+    """Общие параметры: course_id и диапазон недель когорт from/to"""
+    start = parse_date(request.args.get('from'), 'from')
+    end = parse_date(request.args.get('to'), 'to')
+    filters = []
+    if start:
+        # Неделя, в которую попадает начало периода, тоже входит в выборку
+        filters.append(CohortMilestone.cohort_week >= start - timedelta(days=start.weekday()))
+    if end:
+        filters.append(CohortMilestone.cohort_week <= end)
+    course_id = request.args.get('course_id', type=int)
+    if course_id is not None:
+        filters.append(CohortMilestone.course_id == course_id)
+    return course_id, filters
+
+def _cohort_sizes(filters):
+    return dict(db.session.query(
+        CohortMilestone.cohort_week, db.func.sum(CohortMilestone.count)
+    ).filter(CohortMilestone.milestone == 0, *filters).group_by(CohortMilestone.cohort_week).all())
+
+def _share(count, size):
+    return round(count / size, 4) if size else 0.0
+
+# Воронка: доля когорты, прошедшая каждый порог прогресса за N недель
+@cohort_bp.route('/statistics/cohorts/funnel', methods=['GET'])
+@jwt_required()
+def get_cohort_funnel():
+    weeks = request.args.get('weeks', type=int)
+    if weeks is not None and weeks < 1:
+        return jsonify({'message': 'weeks must be a positive integer'}), 400
+    try:
+        course_id, filters = _cohort_filters()
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    sizes = _cohort_sizes(filters)
+    query = db.session.query(
+        CohortMilestone.cohort_week, CohortMilestone.milestone, db.func.sum(CohortMilestone.count)
+    ).filter(CohortMilestone.milestone > 0, *filters)
+    if weeks is not None:
+        query = query.filter(CohortMilestone.weeks_since < weeks)
+    reached = defaultdict(dict)
+    for cohort_week, milestone, count in query.group_by(CohortMilestone.cohort_week, CohortMilestone.milestone):
+        reached[cohort_week][milestone] = count
+
+    cohorts = []
+    for cohort_week in sorted(sizes):
+        size = sizes[cohort_week]
+        counts = reached.get(cohort_week, {})
+        cohorts.append({
+            'cohort_week': cohort_week.isoformat(),
+            'size': size,
+            'milestones': [{
+                'milestone': milestone,
+                'count': counts.get(milestone, 0),
+                'share': _share(counts.get(milestone, 0), size)
+            } for milestone in CohortMilestone.MILESTONES]
+        })
+
+    return jsonify({'course_id': course_id, 'weeks': weeks, 'cohorts': cohorts})
+
+# Удержание: доля когорты, прошедшая порог к концу каждой недели после регистрации
+@cohort_bp.route('/statistics/cohorts/retention', methods=['GET'])
+@jwt_required()
+def get_cohort_retention():
+    milestone = request.args.get('milestone', 100, type=int)
+    if milestone not in CohortMilestone.MILESTONES:
+        return jsonify({'message': f'milestone must be one of: {", ".join(map(str, CohortMilestone.MILESTONES))}'}), 400
+    weeks = request.args.get('weeks', 12, type=int)
+    if weeks < 1 or weeks > 104:
+        return jsonify({'message': 'weeks must be between 1 and 104'}), 400
+    try:
+        course_id, filters = _cohort_filters()
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    sizes = _cohort_sizes(filters)
+    crossings = defaultdict(lambda: [0] * weeks)
+    query = db.session.query(
+        CohortMilestone.cohort_week, CohortMilestone.weeks_since, db.func.sum(CohortMilestone.count)
+    ).filter(
+        CohortMilestone.milestone == milestone, CohortMilestone.weeks_since < weeks, *filters
+    ).group_by(CohortMilestone.cohort_week, CohortMilestone.weeks_since)
+    for cohort_week, weeks_since, count in query:
+        crossings[cohort_week][weeks_since] = count
+
+    today = datetime.utcnow().date()
+    rows = []
+    for cohort_week in sorted(sizes):
+        size = sizes[cohort_week]
+        total = 0
+        shares = []
+        for week, count in enumerate(crossings.get(cohort_week, [0] * weeks)):
+            total += count
+            # Недели, которые для когорты еще не начались, не заполняются
+            shares.append(_share(total, size) if cohort_week + timedelta(weeks=week) <= today else None)
+        rows.append({'cohort_week': cohort_week.isoformat(), 'size': size, 'shares': shares})
+
+    return jsonify({'course_id': course_id, 'milestone': milestone, 'weeks': weeks, 'cohorts': rows})
+
+# Пересчет когорт по регистрациям и истории оценок
+@click.command('rebuild-cohorts')
+@click.option('--batch-size', default=5000, show_default=True, help='Количество регистраций в одной порции.')
+@with_appcontext
+def rebuild_cohorts_command(batch_size):
+    """Пересчет таблицы cohort_milestones и достигнутых порогов регистраций.
+
+    Момент прохождения порога восстанавливается по дате k-й оцененной части
+    курса, где k - число модулей, дающее этот порог. У assessments хранится
+    только дата последнего изменения оценки, поэтому после пересчета недели
+    прохождения могут оказаться позже тех, что записываются по ходу работы.
+    """
+    ensure_milestone_column()
+    db.create_all()  # Таблица cohort_milestones
+
+    module_counts = dict(db.session.query(Module.course_id, db.func.count(Module.id)).group_by(Module.course_id))
+    counts = Counter()
+    last_id = 0
+    processed = 0
+    while True:
+        enrollments = db.session.query(
+            Enrollment.id, Enrollment.course_id, Enrollment.progress,
+            Enrollment.enrollment_date, Enrollment.last_accessed
+        ).filter(Enrollment.id > last_id).order_by(Enrollment.id).limit(batch_size).all()
+        if not enrollments:
+            break
+        first_id, last_id = enrollments[0].id, enrollments[-1].id
+
+        # Даты оцененных модулей курса по каждой регистрации, по возрастанию
+        graded = defaultdict(list)
+        rows = db.session.query(Enrollment.id, Assessment.assessment_date).join(
+            Module, Module.course_id == Enrollment.course_id
+        ).join(
+            Assessment, (Assessment.module_id == Module.id) & (Assessment.user_id == Enrollment.user_id)
+        ).filter(
+            Enrollment.id.between(first_id, last_id), Assessment.grade > 0
+        ).order_by(Enrollment.id, Assessment.assessment_date)
+        for enrollment_id, assessment_date in rows:
+            graded[enrollment_id].append(assessment_date)
+
+        milestones = []
+        for enrollment in enrollments:
+            enrolled_at = enrollment.enrollment_date or enrollment.last_accessed
+            cohort_week = CohortMilestone.cohort_of(enrolled_at)
+            counts[cohort_week, enrollment.course_id, 0, 0] += 1
+
+            reached = CohortMilestone.reached(enrollment.progress)
+            total = module_counts.get(enrollment.course_id, 0)
+            dates = graded.get(enrollment.id, [])
+            for milestone in CohortMilestone.MILESTONES:
+                if milestone > reached:
+                    break
+                needed = max(-(-milestone * total // 100), 1)
+                when = dates[needed - 1] if len(dates) >= needed else enrollment.last_accessed or enrolled_at
+                counts[cohort_week, enrollment.course_id, milestone, CohortMilestone.weeks_between(enrolled_at, when)] += 1
+            milestones.append({'id': enrollment.id, 'milestone': reached})
+
+        db.session.execute(update(Enrollment), milestones)
+        db.session.commit()
+        processed += len(enrollments)
+        click.echo(f'Обработано регистраций: {processed} (до id {last_id})')
+
+    CohortMilestone.query.delete()
+    db.session.bulk_insert_mappings(CohortMilestone, [{
+        'cohort_week': cohort_week, 'course_id': course_id,
+        'milestone': milestone, 'weeks_since': weeks_since, 'count': count
+    } for (cohort_week, course_id, milestone, weeks_since), count in counts.items()])
+    db.session.commit()
+    click.echo(f'Когорты пересчитаны: {len(counts)} ячеек.')
@@ -1,6 +1,14 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from .models import db, Course, Module, Enrollment, Assessment, Feedback
+from .models import db, User, Course, Module, Enrollment, Assessment, Feedback, ActivityRollup, CohortMilestone
+from .suggest import title_index
+from .facets import facet_index, FACETS, SORT_KEYS
+from . import recommendations
+from .leaderboards import leaderboards
+from .search import index_module, unindex_module
+from .fieldsets import MODULE_FIELDS, ASSESSMENT_FIELDS, ENROLLMENT_FIELDS
+from . import rendering
+from .reports import ReportWindow
 
 course_bp = Blueprint('courses', __name__)
 
@@ -9,9 +17,50 @@ course_bp = Blueprint('courses', __name__)
 # Получение всех курсов
 @course_bp.route('/courses', methods=['GET'])
 def get_courses():
-    courses = Course.query.all()
-    result = [{'id': course.id, 'title': course.title, 'description': course.description} for course in courses]
-    return jsonify(result)
+    if 'filter' not in request.args and 'sort' not in request.args:
+        courses = Course.query.all()
+        result = [{'id': course.id, 'title': course.title, 'description': course.description} for course in courses]
+        return jsonify(result)
+
+    # Фильтр вида filter=rating:4-5|3-4,has_attachments:true
+    filters = {}
+    for part in filter(None, request.args.get('filter', '').split(',')):
+        facet, _, values = part.partition(':')
+        if facet not in FACETS or not values:
+            return jsonify({'message': f'Unknown filter: {part}. Facets: {", ".join(FACETS)}'}), 400
+        filters.setdefault(facet, set()).update(values.split('|'))
+
+    sort = request.args.get('sort')
+    if sort and sort.lstrip('-') not in SORT_KEYS:
+        return jsonify({'message': f'sort must be one of: {", ".join(SORT_KEYS)} (prefix "-" for descending)'}), 400
+
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+
+    course_ids, counts = facet_index.query(filters, sort)
+    page_ids = course_ids[(page - 1) * per_page:page * per_page]
+
+    courses = {course.id: course for course in db.session.query(
+        Course.id, Course.title, Course.description
+    ).filter(Course.id.in_(page_ids))} if page_ids else {}
+    facts = facet_index.facts_for(page_ids)
+
+    result = [{
+        'id': course_id,
+        'title': courses[course_id].title,
+        'description': courses[course_id].description,
+        'average_rating': facts[course_id].average_rating,
+        'enrollment_count': facts[course_id].enrollment_count,
+        'created_at': facts[course_id].created_at.isoformat() if facts[course_id].created_at else None
+    } for course_id in page_ids if course_id in courses and facts.get(course_id)]
+
+    return jsonify({
+        'items': result,
+        'total': len(course_ids),
+        'facets': counts,
+        'page': page,
+        'per_page': per_page
+    })
 
 # Получение конкретного курса
 @course_bp.route('/courses/<int:course_id>', methods=['GET'])
@@ -48,6 +97,8 @@ def create_course():
     course = Course(title=title, description=description)
     db.session.add(course)
     db.session.commit()
+    title_index.put('course', course.id, course.title, course.id)
+    facet_index.add_course(course)
 
     return jsonify({
         'message': 'Course created successfully',
@@ -68,6 +119,7 @@ def update_course(course_id):
         course.description = data['description']
 
     db.session.commit()
+    title_index.put('course', course.id, course.title, course.id)
 
     return jsonify({'message': 'Course updated successfully'})
 
@@ -76,15 +128,39 @@ def update_course(course_id):
 @jwt_required()
 def delete_course(course_id):
     course = Course.query.get_or_404(course_id)
+    module_ids = [module.id for module in course.modules]
     db.session.delete(course)
     db.session.commit()
 
+    title_index.remove('course', course_id)
+    facet_index.remove_course(course_id)
+    recommendations.forget_course(course_id)
+    leaderboards.forget_course(course_id)
+    for module_id in module_ids:
+        title_index.remove('module', module_id)
+
     return jsonify({'message': 'Course deleted successfully'})
 
+# Автодополнение названий курсов и модулей
+@course_bp.route('/courses/suggest', methods=['GET'])
+def suggest_courses():
+    prefix = request.args.get('prefix', '')
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    kind = request.args.get('type')
+
+    if kind not in (None, 'course', 'module'):
+        return jsonify({'message': 'type must be one of: course, module'}), 400
+
+    return jsonify(title_index.suggest(prefix, limit, kind))
+
 # Получение популярных курсов (реализация запроса 2)
 @course_bp.route('/courses/popular', methods=['GET'])
 def get_popular_courses():
-    popular_courses = Course.get_popular_courses()
+    try:
+        window = ReportWindow.from_args(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    popular_courses = Course.get_popular_courses(window)
 
     result = [{
         'course_id': course.course_id,
@@ -99,7 +175,11 @@ def get_popular_courses():
 @course_bp.route('/courses/statistics', methods=['GET'])
 @jwt_required()
 def get_course_statistics():
-    statistics = Course.get_course_statistics()
+    try:
+        window = ReportWindow.from_args(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    statistics = Course.get_course_statistics(window)
 
     result = [{
         'course_id': stat.course_id,
@@ -117,7 +197,11 @@ def get_course_statistics():
 @course_bp.route('/courses/module-statistics', methods=['GET'])
 @jwt_required()
 def get_course_module_statistics():
-    statistics = Course.get_course_module_statistics()
+    try:
+        window = ReportWindow.from_args(request.args, default_days=365)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    statistics = Course.get_course_module_statistics(window)
 
     result = [{
         'course_id': stat.course_id,
@@ -134,24 +218,43 @@ def get_course_module_statistics():
 # Получение модулей курса
 @course_bp.route('/courses/<int:course_id>/modules', methods=['GET'])
 def get_modules(course_id):
-    modules = Module.query.filter_by(course_id=course_id).all()
-    result = [{
-        'id': module.id,
-        'title': module.title,
-        'content': module.content
-    } for module in modules]
+    # По умолчанию только оглавление: тексты модулей лежат в module_contents
+    try:
+        fields = MODULE_FIELDS.parse(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    if request.args.get('include') == 'content' and 'content' not in fields:
+        fields.append('content')
 
-    return jsonify(result)
+    stmt = MODULE_FIELDS.select(fields).where(Module.course_id == course_id).order_by(Module.id)
+    return jsonify(MODULE_FIELDS.serialize(fields, db.session.execute(stmt)))
 
 # Получение конкретного модуля
 @course_bp.route('/modules/<int:module_id>', methods=['GET'])
 def get_module(module_id):
     module = Module.query.get_or_404(module_id)
+
+    if request.args.get('format') == 'html':
+        # HTML строится при записи модуля; если его нет (модуль создан раньше кеша
+        # или сменилась версия рендерера), он строится здесь и сохраняется UPSERT-ом
+        rendered = rendering.ensure_rendered(module)
+        db.session.commit()
+        response = jsonify({
+            'id': module.id,
+            'course_id': module.course_id,
+            'title': module.title,
+            'html': rendered.html,
+            'content_length': module.content_length
+        })
+        response.set_etag(f'{rendered.content_hash}-{rendered.renderer}')
+        return response.make_conditional(request)
+
     result = {
         'id': module.id,
         'course_id': module.course_id,
         'title': module.title,
-        'content': module.content
+        'content': module.content,
+        'content_length': module.content_length
     }
 
     return jsonify(result)
@@ -171,7 +274,11 @@ def create_module(course_id):
 
     module = Module(course_id=course_id, title=title, content=content)
     db.session.add(module)
+    db.session.flush()
+    index_module(module)
+    rendering.ensure_rendered(module)
     db.session.commit()
+    title_index.put('module', module.id, module.title, module.course_id)
 
     return jsonify({
         'message': 'Module created successfully',
@@ -189,9 +296,16 @@ def update_module(module_id):
         module.title = data['title']
 
     if 'content' in data:
+        old_hash = module.content_hash
         module.content = data['content']
+        if module.content_hash != old_hash:
+            # Готовый HTML прежнего текста больше не нужен, новый строится сразу
+            rendering.release(old_hash)
+            rendering.ensure_rendered(module)
 
+    index_module(module)
     db.session.commit()
+    title_index.put('module', module.id, module.title, module.course_id)
 
     return jsonify({'message': 'Module updated successfully'})
 
@@ -200,8 +314,12 @@ def update_module(module_id):
 @jwt_required()
 def delete_module(module_id):
     module = Module.query.get_or_404(module_id)
+    content_hash = module.content_hash
     db.session.delete(module)
+    unindex_module(module_id)
+    rendering.release(content_hash)
     db.session.commit()
+    title_index.remove('module', module_id)
 
     return jsonify({'message': 'Module deleted successfully'})
 
@@ -230,16 +348,13 @@ def get_user_enrollments():
     current_user = get_jwt_identity()
     user_id = current_user['id']
 
-    enrollments = Enrollment.query.filter_by(user_id=user_id).all()
-    result = [{
-        'id': enrollment.id,
-        'course_id': enrollment.course_id,
-        'course_title': enrollment.course.title,
-        'progress': enrollment.progress,
-        'enrollment_date': enrollment.enrollment_date.isoformat()
-    } for enrollment in enrollments]
+    try:
+        fields = ENROLLMENT_FIELDS.parse(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
 
-    return jsonify(result)
+    stmt = ENROLLMENT_FIELDS.select(fields).where(Enrollment.user_id == user_id).order_by(Enrollment.id)
+    return jsonify(ENROLLMENT_FIELDS.serialize(fields, db.session.execute(stmt)))
 
 # Отмена регистрации на курс
 @course_bp.route('/courses/<int:course_id>/unenroll', methods=['DELETE'])
@@ -252,7 +367,15 @@ def unenroll_course(course_id):
         user_id=user_id, course_id=course_id).first_or_404()
 
     db.session.delete(enrollment)
+    db.session.flush()
+    if enrollment.enrollment_date is not None:
+        ActivityRollup.record('enrollment', course_id, enrollment.enrollment_date, -1)
+        CohortMilestone.record(enrollment, 0, enrollment.enrollment_date, delta=-1)
+    recommendations.record_enrollment(user_id, course_id, -1)
     db.session.commit()
+    title_index.add_enrollments(course_id, -1)
+    facet_index.add_enrollments(course_id, -1)
+    leaderboards.remove_user(user_id, course_id)
 
     return jsonify({'message': 'Successfully unenrolled from the course'})
 
@@ -283,18 +406,13 @@ def get_user_assessments():
     current_user = get_jwt_identity()
     user_id = current_user['id']
 
-    assessments = Assessment.query.filter_by(user_id=user_id).all()
-    result = [{
-        'id': assessment.id,
-        'module_id': assessment.module_id,
-        'module_title': assessment.module.title,
-        'course_id': assessment.module.course_id,
-        'course_title': assessment.module.course.title,
-        'grade': assessment.grade,
-        'assessment_date': assessment.assessment_date.isoformat()
-    } for assessment in assessments]
+    try:
+        fields = ASSESSMENT_FIELDS.parse(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
 
-    return jsonify(result)
+    stmt = ASSESSMENT_FIELDS.select(fields).where(Assessment.user_id == user_id).order_by(Assessment.id)
+    return jsonify(ASSESSMENT_FIELDS.serialize(fields, db.session.execute(stmt)))
 
 # Создание или обновление оценки
 @course_bp.route('/modules/<int:module_id>/assessment', methods=['POST'])
@@ -316,6 +434,7 @@ def save_assessment(module_id):
 
     # Сохранение оценки (также обновляет прогресс пользователя через триггер)
     assessment.save_grade(grade)
+    leaderboards.record_assessment(user_id, assessment.module.course_id)
 
     return jsonify({'message': 'Assessment saved successfully'})
 
@@ -359,15 +478,21 @@ def create_feedback(course_id):
 
     if existing_feedback:
         # Обновляем существующий отзыв
+        old_rating = existing_feedback.rating
         existing_feedback.rating = rating
         existing_feedback.comment = comment
+        recommendations.record_rating(user_id, course_id, old_rating, rating)
         db.session.commit()
+        facet_index.change_rating(course_id, old_rating, rating)
         return jsonify({'message': 'Feedback updated successfully'})
     else:
         # Создаем новый отзыв
         feedback = Feedback(user_id=user_id, course_id=course_id, rating=rating, comment=comment)
         db.session.add(feedback)
+        ActivityRollup.record('feedback', course_id)
+        recommendations.record_rating(user_id, course_id, None, rating)
         db.session.commit()
+        facet_index.change_rating(course_id, None, rating)
         return jsonify({
             'message': 'Feedback created successfully',
             'feedback_id': feedback.id
@@ -386,8 +511,13 @@ def delete_feedback(feedback_id):
     if feedback.user_id != user_id:
         return jsonify({'message': 'Unauthorized to delete this feedback'}), 403
 
+    course_id, rating = feedback.course_id, feedback.rating
     db.session.delete(feedback)
+    if feedback.created_at is not None:
+        ActivityRollup.record('feedback', course_id, feedback.created_at, -1)
+    recommendations.record_rating(user_id, course_id, rating, None)
     db.session.commit()
+    facet_index.change_rating(course_id, rating, None)
 
     return jsonify({'message': 'Feedback deleted successfully'})
 
@@ -397,7 +527,11 @@ def delete_feedback(feedback_id):
 @course_bp.route('/statistics/user-performance', methods=['GET'])
 @jwt_required()
 def get_user_performance_statistics():
-    statistics = User.get_user_performance_statistics()
+    try:
+        window = ReportWindow.from_args(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    statistics = User.get_user_performance_statistics(window)
 
     result = [{
         'user_id': stat.user_id,
@@ -414,7 +548,11 @@ def get_user_performance_statistics():
 @course_bp.route('/statistics/user-activity', methods=['GET'])
 @jwt_required()
 def get_user_activity_statistics():
-    statistics = User.get_user_activity_statistics()
+    try:
+        window = ReportWindow.from_args(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    statistics = User.get_user_activity_statistics(window)
 
     result = [{
         'user_id': stat.user_id,
@@ -432,7 +570,11 @@ def get_user_activity_statistics():
 @course_bp.route('/statistics/active-users', methods=['GET'])
 @jwt_required()
 def get_active_users_with_courses():
-    statistics = User.get_active_users_with_courses()
+    try:
+        window = ReportWindow.from_args(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    statistics = User.get_active_users_with_courses(window)
 
     result = [{
         'user_id': stat.user_id,
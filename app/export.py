@@ -0,0 +1,251 @@
+import json
+import os
+from contextlib import contextmanager
+from datetime import date, datetime
+import click
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from flask.cli import with_appcontext
+from sqlalchemy import select, types
+from .models import (db, User, Course, Module, ModuleContent, Enrollment, Assessment, Feedback,
+                     Attachment, Notification, NotificationMessage)
+from .textstore import decode_text
+from .authz import require_role
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow не установлен - колоночная выгрузка недоступна
+    pa = pq = None
+
+export_bp = Blueprint('export', __name__)
+
+ARROW_STREAM_MIMETYPE = 'application/vnd.apache.arrow.stream'
+STATE_FILE = '_export_state.json'
+
+def _arrow_type(column_type):
+    if isinstance(column_type, types.Boolean):
+        return pa.bool_()
+    if isinstance(column_type, types.Integer):
+        return pa.int64()
+    if isinstance(column_type, types.Float):
+        return pa.float64()
+    if isinstance(column_type, types.DateTime):
+        return pa.timestamp('us')
+    if isinstance(column_type, types.Date):
+        return pa.date32()
+    if isinstance(column_type, types.LargeBinary):
+        return pa.binary()
+    return pa.string()
+
+class ExportTable:
+    """Таблица для выгрузки: колонки, колонка отметки для инкрементальной
+    выгрузки и побочная таблица сжатого текста (см. app/textstore.py)"""
+
+    def __init__(self, model, watermark, exclude=(), text=None):
+        self.model = model
+        self.columns = [column for column in model.__table__.columns if column.name not in exclude]
+        self.watermark = model.__table__.columns[watermark]
+        self.text = text  # (модель побочной таблицы, ее ключ, имя колонки в выгрузке)
+
+    def schema(self):
+        fields = [pa.field(column.name, _arrow_type(column.type)) for column in self.columns]
+        if self.text:
+            fields.append(pa.field(self.text[2], pa.string()))
+        return pa.schema(fields)
+
+    def parse_watermark(self, value):
+        """Отметка из параметра или файла состояния: дата-время ISO или id. Ошибка - ValueError"""
+        if value is None:
+            return None
+        if isinstance(self.watermark.type, types.DateTime):
+            return datetime.fromisoformat(value)
+        return int(value)
+
+    def statement(self, since=None):
+        columns = list(self.columns)
+        source = self.model.__table__
+        if self.text:
+            side, key, _ = self.text
+            columns += [side.codec, side.data]
+            source = source.outerjoin(side.__table__, getattr(side, key) == self.model.id)
+        stmt = select(*columns).select_from(source)
+        if since is not None:
+            stmt = stmt.where(self.watermark > since)
+        return stmt.order_by(self.watermark, self.model.id)
+
+    def batches(self, connection, since=None, batch_size=65536, progress=None):
+        """RecordBatch-и таблицы порциями по batch_size строк.
+
+        progress - словарь, в который записывается наибольшее значение отметки
+        среди выгруженных строк (ключ 'watermark').
+        """
+        schema = self.schema()
+        width = len(self.columns)
+        watermark_index = self.columns.index(self.watermark)
+        result = connection.execute(self.statement(since))
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            arrays = [[row[i] for row in rows] for i in range(width)]
+            if self.text:
+                arrays.append([
+                    decode_text(row[width], row[width + 1]) if row[width] is not None else None
+                    for row in rows
+                ])
+            if progress is not None:
+                marks = [value for value in arrays[watermark_index] if value is not None]
+                if marks:
+                    progress['watermark'] = max(max(marks), progress.get('watermark', marks[0]))
+            yield pa.RecordBatch.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(arrays, schema)],
+                schema=schema
+            )
+
+# Хеши паролей не выгружаются никогда
+EXPORT_TABLES = {
+    'users': ExportTable(User, 'updated_at', exclude=('password_hash',)),
+    'courses': ExportTable(Course, 'updated_at'),
+    'modules': ExportTable(Module, 'updated_at', text=(ModuleContent, 'module_id', 'content')),
+    'enrollments': ExportTable(Enrollment, 'last_accessed'),
+    'assessments': ExportTable(Assessment, 'assessment_date'),
+    'feedbacks': ExportTable(Feedback, 'id'),
+    'attachments': ExportTable(Attachment, 'id'),
+    'notifications': ExportTable(Notification, 'id', text=(NotificationMessage, 'notification_id', 'message')),
+}
+
+@contextmanager
+def read_snapshot():
+    """Отдельное соединение с одной читающей транзакцией.
+
+    Все таблицы читаются из одного снимка базы. В режиме rollback journal
+    транзакция держит разделяемую блокировку, и пишущие запросы ждут ее
+    окончания; в режиме WAL чтение запись не блокирует.
+    """
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql('BEGIN')
+        try:
+            yield connection
+        finally:
+            connection.rollback()
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+def _load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def _save_state(path, state):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+class _ChunkSink:
+    """Файлоподобный объект, копящий записанные байты до выдачи клиенту"""
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+# Потоковая выгрузка таблицы в формате Arrow IPC
+@export_bp.route('/export/<table>', methods=['GET'])
+@require_role('admin', message='Нет прав на выгрузку данных')
+def export_table(table):
+    if pa is None:
+        return jsonify({'message': 'Для выгрузки нужен pyarrow'}), 503
+    spec = EXPORT_TABLES.get(table)
+    if spec is None:
+        return jsonify({'message': f'table must be one of: {", ".join(EXPORT_TABLES)}'}), 404
+    try:
+        since = spec.parse_watermark(request.args.get('since'))
+    except ValueError:
+        kind = 'an ISO datetime' if isinstance(spec.watermark.type, types.DateTime) else 'an integer id'
+        return jsonify({'message': f'since must be {kind} ({spec.watermark.name})'}), 400
+    batch_size = min(max(request.args.get('batch_size', 65536, type=int), 1), 1 << 20)
+
+    def generate():
+        sink = _ChunkSink()
+        with read_snapshot() as connection:
+            with pa.ipc.new_stream(sink, spec.schema()) as writer:
+                yield sink.drain()
+                for batch in spec.batches(connection, since, batch_size):
+                    writer.write_batch(batch)
+                    yield sink.drain()
+        yield sink.drain()
+
+    return Response(stream_with_context(generate()), mimetype=ARROW_STREAM_MIMETYPE, headers={
+        'Content-Disposition': f'attachment; filename={table}.arrows'
+    })
+
+# Выгрузка таблиц в Parquet или Arrow IPC
+@click.command('export-columnar')
+@click.option('--output', 'output_dir', default=None, help='Каталог выгрузки (по умолчанию EXPORT_FOLDER).')
+@click.option('--format', 'file_format', type=click.Choice(['parquet', 'arrow']), default='parquet', show_default=True)
+@click.option('--table', 'tables', multiple=True, type=click.Choice(list(EXPORT_TABLES)), help='Таблица (можно несколько; по умолчанию все).')
+@click.option('--incremental', is_flag=True, help='Только строки с отметкой больше сохраненной в прошлый раз.')
+@click.option('--batch-size', default=65536, show_default=True, help='Строк в одном RecordBatch / группе строк Parquet.')
+@with_appcontext
+def export_columnar_command(output_dir, file_format, tables, incremental, batch_size):
+    """Колоночная выгрузка таблиц из одного снимка базы.
+
+    Память ограничена одним RecordBatch: строки читаются курсором порциями и
+    сразу пишутся в файл. Полная выгрузка пишет <таблица>.<формат>,
+    инкрементальная - <таблица>.<время запуска>.<формат> только с новыми и
+    измененными строками (по updated_at, дате оценки или id) и обновляет
+    отметки в _export_state.json.
+    """
+    if pa is None:
+        raise click.ClickException('Для выгрузки нужен pyarrow')
+    output_dir = output_dir or current_app.config['EXPORT_FOLDER']
+    os.makedirs(output_dir, exist_ok=True)
+    state_path = os.path.join(output_dir, STATE_FILE)
+    state = _load_state(state_path)
+    run_id = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+    extension = 'parquet' if file_format == 'parquet' else 'arrow'
+
+    with read_snapshot() as connection:
+        for name in tables or EXPORT_TABLES:
+            spec = EXPORT_TABLES[name]
+            since = spec.parse_watermark(state.get(name, {}).get('watermark')) if incremental else None
+            filename = f'{name}.{run_id}.{extension}' if incremental else f'{name}.{extension}'
+            path = os.path.join(output_dir, filename)
+            progress, rows = {}, 0
+
+            schema = spec.schema()
+            if file_format == 'parquet':
+                writer = pq.ParquetWriter(path + '.tmp', schema)
+            else:
+                writer = pa.ipc.new_file(path + '.tmp', schema)
+            with writer:
+                for batch in spec.batches(connection, since, batch_size, progress):
+                    if file_format == 'parquet':
+                        writer.write_batch(batch, row_group_size=batch_size)
+                    else:
+                        writer.write_batch(batch)
+                    rows += batch.num_rows
+            os.replace(path + '.tmp', path)
+
+            if 'watermark' in progress:
+                state[name] = {'column': spec.watermark.name, 'watermark': _json_value(progress['watermark'])}
+            click.echo(f'{name}: {rows} строк -> {filename}')
+
+    _save_state(state_path, state)
+    click.echo('Выгрузка завершена.')
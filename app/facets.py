@@ -0,0 +1,233 @@
+import threading
+import time
+from flask import current_app
+from .models import db, Course, Enrollment, Feedback, StorageUsage
+
+# Группы значений фасетов: имя значения -> функция принадлежности
+RATING_BUCKETS = (
+    ('none', lambda r: r is None),
+    ('1-2', lambda r: r is not None and r < 2),
+    ('2-3', lambda r: r is not None and 2 <= r < 3),
+    ('3-4', lambda r: r is not None and 3 <= r < 4),
+    ('4-5', lambda r: r is not None and r >= 4),
+)
+ENROLLMENT_BUCKETS = (
+    ('0', lambda n: n == 0),
+    ('1-9', lambda n: 1 <= n <= 9),
+    ('10-99', lambda n: 10 <= n <= 99),
+    ('100+', lambda n: n >= 100),
+)
+
+FACETS = ('rating', 'enrollments', 'created', 'has_attachments')
+
+SORT_KEYS = {
+    'rating': lambda s: s.average_rating if s.average_rating is not None else -1,
+    'enrollments': lambda s: s.enrollment_count,
+    'created': lambda s: s.created_at,
+}
+# Курсы, для которых ключ равен None, идут в конце при любом направлении сортировки
+
+class CourseFacts:
+    __slots__ = ('rating_sum', 'rating_count', 'enrollment_count', 'attachment_count', 'created_at')
+
+    def __init__(self, created_at):
+        self.rating_sum = 0
+        self.rating_count = 0
+        self.enrollment_count = 0
+        self.attachment_count = 0
+        self.created_at = created_at
+
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.rating_count if self.rating_count else None
+
+    def facet_values(self):
+        rating = self.average_rating
+        return {
+            'rating': next(name for name, test in RATING_BUCKETS if test(rating)),
+            'enrollments': next(name for name, test in ENROLLMENT_BUCKETS if test(self.enrollment_count)),
+            'created': str(self.created_at.year) if self.created_at else 'unknown',
+            'has_attachments': 'true' if self.attachment_count else 'false',
+        }
+
+class FacetIndex:
+    """Битовые индексы фасетов каталога по id курсов.
+
+    Каждому значению фасета соответствует битовая карта (целое Python, бит i -
+    курс с id i). Фильтрация - побитовое И карт, счетчики фасетов - popcount
+    пересечений, поэтому запрос каталога не обращается к feedbacks и enrollments.
+    Изменения применяются инкрементально; раз в FACETS_REFRESH_INTERVAL секунд
+    индекс перестраивается целиком, чтобы учесть изменения из других процессов.
+    """
+
+    def __init__(self):
+        self._facts = {}
+        self._bitmaps = {}
+        self._assigned = {}
+        self._all = 0
+        self._built_at = None
+        self._lock = threading.RLock()
+
+    def build(self):
+        facts = {course_id: CourseFacts(created_at)
+                 for course_id, created_at in db.session.query(Course.id, Course.created_at)}
+
+        ratings = db.session.query(
+            Feedback.course_id, db.func.sum(Feedback.rating), db.func.count(Feedback.id)
+        ).group_by(Feedback.course_id)
+        for course_id, rating_sum, rating_count in ratings:
+            if course_id in facts:
+                facts[course_id].rating_sum = rating_sum
+                facts[course_id].rating_count = rating_count
+
+        enrollments = db.session.query(
+            Enrollment.course_id, db.func.count(Enrollment.id)
+        ).group_by(Enrollment.course_id)
+        for course_id, count in enrollments:
+            if course_id in facts:
+                facts[course_id].enrollment_count = count
+
+        usage = db.session.query(StorageUsage.scope_id, StorageUsage.file_count).filter(
+            StorageUsage.scope == 'course'
+        )
+        for course_id, file_count in usage:
+            if course_id in facts:
+                facts[course_id].attachment_count = file_count
+
+        with self._lock:
+            self._facts = facts
+            self._bitmaps = {}
+            self._assigned = {}
+            self._all = 0
+            for course_id in facts:
+                self._reindex(course_id)
+            self._built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        interval = current_app.config.get('FACETS_REFRESH_INTERVAL', 300)
+        if self._built_at is None or time.monotonic() - self._built_at > interval:
+            self.build()
+
+    def _reindex(self, course_id):
+        """Переложить бит курса в карты, соответствующие его текущим значениям"""
+        bit = 1 << course_id
+        for key in self._assigned.pop(course_id, ()):
+            self._bitmaps[key] &= ~bit
+
+        facts = self._facts.get(course_id)
+        if facts is None:
+            self._all &= ~bit
+            return
+
+        keys = tuple(facts.facet_values().items())
+        for key in keys:
+            self._bitmaps[key] = self._bitmaps.get(key, 0) | bit
+        self._assigned[course_id] = keys
+        self._all |= bit
+
+    def _update(self, course_id, apply):
+        if self._built_at is None:
+            return  # Индекс еще не построен - будет загружен целиком
+        with self._lock:
+            facts = self._facts.get(course_id)
+            if facts is None:
+                return
+            apply(facts)
+            self._reindex(course_id)
+
+    # Инкрементальные изменения
+
+    def add_course(self, course):
+        if self._built_at is None:
+            return
+        with self._lock:
+            self._facts[course.id] = CourseFacts(course.created_at)
+            self._reindex(course.id)
+
+    def remove_course(self, course_id):
+        if self._built_at is None:
+            return
+        with self._lock:
+            self._facts.pop(course_id, None)
+            self._reindex(course_id)
+
+    def change_rating(self, course_id, old_rating, new_rating):
+        """old_rating=None - новый отзыв, new_rating=None - удаленный"""
+        def apply(facts):
+            if old_rating is not None:
+                facts.rating_sum -= old_rating
+                facts.rating_count -= 1
+            if new_rating is not None:
+                facts.rating_sum += new_rating
+                facts.rating_count += 1
+        self._update(course_id, apply)
+
+    def add_enrollments(self, course_id, delta):
+        def apply(facts):
+            facts.enrollment_count = max(facts.enrollment_count + delta, 0)
+        self._update(course_id, apply)
+
+    def add_attachments(self, course_id, delta):
+        def apply(facts):
+            facts.attachment_count = max(facts.attachment_count + delta, 0)
+        self._update(course_id, apply)
+
+    # Запросы
+
+    def _union(self, facet, values):
+        bitmap = 0
+        for value in values:
+            bitmap |= self._bitmaps.get((facet, value), 0)
+        return bitmap
+
+    def query(self, filters, sort=None):
+        """Отфильтровать курсы и посчитать фасеты.
+
+        filters - {фасет: [значения]}: значения одного фасета объединяются по ИЛИ,
+        разные фасеты - по И. Счетчики каждого фасета считаются с учетом
+        фильтров по остальным фасетам, чтобы было видно, сколько курсов
+        даст выбор другого значения.
+        Возвращает (отсортированные id курсов, счетчики фасетов).
+        """
+        self._ensure_fresh()
+
+        with self._lock:
+            selected = {facet: self._union(facet, values) for facet, values in filters.items()}
+
+            result = self._all
+            for bitmap in selected.values():
+                result &= bitmap
+
+            counts = {}
+            for facet in FACETS:
+                others = self._all
+                for other, bitmap in selected.items():
+                    if other != facet:
+                        others &= bitmap
+                counts[facet] = {
+                    value: (bitmap & others).bit_count()
+                    for (name, value), bitmap in self._bitmaps.items()
+                    if name == facet and bitmap & others
+                }
+
+            course_ids = _bits(result)
+            if sort:
+                descending = sort.startswith('-')
+                key = SORT_KEYS[sort.lstrip('-')]
+                values = {course_id: key(self._facts[course_id]) for course_id in course_ids}
+                known = [course_id for course_id in course_ids if values[course_id] is not None]
+                known.sort(key=values.__getitem__, reverse=descending)
+                course_ids = known + [course_id for course_id in course_ids if values[course_id] is None]
+
+        return course_ids, counts
+
+    def facts_for(self, course_ids):
+        with self._lock:
+            return {course_id: self._facts.get(course_id) for course_id in course_ids}
+
+def _bits(bitmap):
+    """Номера установленных битов по возрастанию"""
+    digits = bin(bitmap)[:1:-1]
+    return [position for position, digit in enumerate(digits) if digit == '1']
+
+facet_index = FacetIndex()
@@ -0,0 +1,122 @@
+from sqlalchemy import select
+from .models import Module, ModuleContent, Course, Assessment, Enrollment
+from .textstore import decode_text
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+class Field:
+    """Поле ответа: колонки, которые нужно выбрать, и преобразование их значений"""
+
+    def __init__(self, *columns, convert=None, joins=()):
+        self.columns = columns
+        self.convert = convert
+        self.joins = joins
+
+    def value(self, values):
+        if self.convert is not None:
+            return self.convert(*values)
+        return values[0]
+
+class FieldSet:
+    """Белый список полей списочного эндпоинта для параметра ?fields=.
+
+    Запрошенные поля компилируются в select() только нужных колонок
+    (с join-ами только для тех полей, которым они нужны), без загрузки
+    ORM-объектов.
+    """
+
+    def __init__(self, base, fields, default, joins=None):
+        self.base = base
+        self.fields = fields
+        self.default = default
+        self.joins = joins or {}  # имя -> (таблица, условие, outer)
+
+    def parse(self, raw):
+        """Разобрать значение ?fields=. Неизвестные поля - ValueError"""
+        if not raw:
+            return list(self.default)
+        names = []
+        for name in raw.split(','):
+            name = name.strip()
+            if not name or name in names:
+                continue
+            if name not in self.fields:
+                raise ValueError(f'Unknown field: {name}. Allowed: {", ".join(self.fields)}')
+            names.append(name)
+        if not names:
+            raise ValueError('fields must not be empty')
+        return names
+
+    def select(self, names):
+        columns = [column for name in names for column in self.fields[name].columns]
+        stmt = select(*columns).select_from(self.base)
+
+        needed = {join for name in names for join in self.fields[name].joins}
+        for join_name, (target, onclause, outer) in self.joins.items():
+            if join_name in needed:
+                stmt = stmt.join(target, onclause, isouter=outer)
+        return stmt
+
+    def serialize(self, names, rows):
+        result = []
+        for row in rows:
+            item, position = {}, 0
+            for name in names:
+                field = self.fields[name]
+                width = len(field.columns)
+                item[name] = field.value(row[position:position + width])
+                position += width
+            result.append(item)
+        return result
+
+MODULE_FIELDS = FieldSet(
+    Module,
+    fields={
+        'id': Field(Module.id),
+        'course_id': Field(Module.course_id),
+        'title': Field(Module.title),
+        'content_length': Field(Module.content_length),
+        'content': Field(ModuleContent.codec, ModuleContent.data, convert=decode_text, joins=('body',)),
+        'created_at': Field(Module.created_at, convert=_isoformat),
+        'updated_at': Field(Module.updated_at, convert=_isoformat),
+    },
+    default=('id', 'title', 'content_length'),
+    joins={
+        'body': (ModuleContent, ModuleContent.module_id == Module.id, True),
+    }
+)
+
+ASSESSMENT_FIELDS = FieldSet(
+    Assessment,
+    fields={
+        'id': Field(Assessment.id),
+        'module_id': Field(Assessment.module_id),
+        'module_title': Field(Module.title, joins=('module',)),
+        'course_id': Field(Module.course_id, joins=('module',)),
+        'course_title': Field(Course.title, joins=('module', 'course')),
+        'grade': Field(Assessment.grade),
+        'assessment_date': Field(Assessment.assessment_date, convert=_isoformat),
+    },
+    default=('id', 'module_id', 'module_title', 'course_id', 'course_title', 'grade', 'assessment_date'),
+    joins={
+        'module': (Module, Assessment.module_id == Module.id, False),
+        'course': (Course, Module.course_id == Course.id, False),
+    }
+)
+
+ENROLLMENT_FIELDS = FieldSet(
+    Enrollment,
+    fields={
+        'id': Field(Enrollment.id),
+        'course_id': Field(Enrollment.course_id),
+        'course_title': Field(Course.title, joins=('course',)),
+        'progress': Field(Enrollment.progress),
+        'enrollment_date': Field(Enrollment.enrollment_date, convert=_isoformat),
+        'last_accessed': Field(Enrollment.last_accessed, convert=_isoformat),
+    },
+    default=('id', 'course_id', 'course_title', 'progress', 'enrollment_date'),
+    joins={
+        'course': (Course, Enrollment.course_id == Course.id, False),
+    }
+)
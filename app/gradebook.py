@@ -0,0 +1,99 @@
+import math
+import struct
+import sys
+from array import array
+from flask import Blueprint, Response, request, jsonify
+from sqlalchemy import text
+from .models import db, Course
+from .authz import require_role
+
+gradebook_bp = Blueprint('gradebook', __name__)
+
+# Заголовок бинарного формата: сигнатура, число студентов, число модулей (little-endian)
+BINARY_MAGIC = b'GRB1'
+BINARY_HEADER = struct.Struct('<4sII')
+
+# Размер порции при чтении оценок
+_FETCH_SIZE = 5000
+
+def build_gradebook(course_id):
+    """Плотная матрица оценок студенты × модули курса.
+
+    Строки - зарегистрированные на курс студенты по возрастанию id, столбцы -
+    модули по возрастанию id. Оценки читаются одним упорядоченным проходом по
+    assessments и пишутся сразу в массив float32 (row-major); клетки без оценки
+    остаются NaN. Возвращает (user_ids, module_ids, grades) как array.array.
+    """
+    user_ids = array('i', db.session.execute(text(
+        'SELECT user_id FROM enrollments WHERE course_id = :course_id ORDER BY user_id'
+    ), {'course_id': course_id}).scalars())
+    module_ids = array('i', db.session.execute(text(
+        'SELECT id FROM modules WHERE course_id = :course_id ORDER BY id'
+    ), {'course_id': course_id}).scalars())
+
+    width = len(module_ids)
+    grades = array('f', [math.nan]) * (len(user_ids) * width)
+    if not grades:
+        return user_ids, module_ids, grades
+
+    row_of = {user_id: row for row, user_id in enumerate(user_ids)}
+    column_of = {module_id: column for column, module_id in enumerate(module_ids)}
+
+    result = db.session.execute(text("""
+        SELECT a.user_id, a.module_id, a.grade
+        FROM assessments a
+        JOIN modules m ON m.id = a.module_id
+        WHERE m.course_id = :course_id
+        ORDER BY a.user_id, a.module_id
+    """), {'course_id': course_id})
+    while True:
+        chunk = result.fetchmany(_FETCH_SIZE)
+        if not chunk:
+            break
+        for user_id, module_id, grade in chunk:
+            row = row_of.get(user_id)
+            if row is not None:  # Оценки студентов, отменивших запись, не показываются
+                grades[row * width + column_of[module_id]] = grade
+
+    return user_ids, module_ids, grades
+
+def _little_endian(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def _wants_binary():
+    if request.args.get('format') == 'binary':
+        return True
+    if request.args.get('format') == 'json':
+        return False
+    best = request.accept_mimetypes.best_match(['application/json', 'application/octet-stream'])
+    return best == 'application/octet-stream'
+
+# Журнал оценок курса
+@gradebook_bp.route('/courses/<int:course_id>/gradebook', methods=['GET'])
+@require_role('admin', message='Нет прав на просмотр журнала оценок')
+def get_gradebook(course_id):
+    Course.query.get_or_404(course_id)
+    user_ids, module_ids, grades = build_gradebook(course_id)
+
+    if _wants_binary():
+        # GRB1, uint32 студентов, uint32 модулей, int32[] id студентов,
+        # int32[] id модулей, float32[] оценок (NaN - нет оценки)
+        body = b''.join((
+            BINARY_HEADER.pack(BINARY_MAGIC, len(user_ids), len(module_ids)),
+            _little_endian(user_ids),
+            _little_endian(module_ids),
+            _little_endian(grades),
+        ))
+        return Response(body, mimetype='application/octet-stream')
+
+    # В JSON нет NaN, поэтому пропущенные оценки передаются как null
+    return jsonify({
+        'course_id': course_id,
+        'shape': [len(user_ids), len(module_ids)],
+        'user_ids': user_ids.tolist(),
+        'module_ids': module_ids.tolist(),
+        'grades': [None if grade != grade else grade for grade in grades]
+    })
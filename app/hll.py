@@ -0,0 +1,57 @@
+import hashlib
+import math
+import zlib
+
+# 2^12 = 4096 регистров; стандартная ошибка оценки 1.04 / sqrt(4096) ~ 1.6%
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+RELATIVE_ERROR = 1.04 / math.sqrt(REGISTERS)
+
+_ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+_POWERS = [2.0 ** -rank for rank in range(65)]
+_VALUE_BITS = 64 - PRECISION
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'little')
+
+class HyperLogLog:
+    """Скетч HyperLogLog для приближенного числа уникальных значений.
+
+    Регистры - bytes длиной REGISTERS; объединение скетчей - поэлементный
+    максимум, поэтому скетчи за дни и курсы можно складывать в любом порядке.
+    """
+
+    def __init__(self, registers=None):
+        self.registers = bytearray(registers) if registers is not None else bytearray(REGISTERS)
+
+    def add(self, value):
+        """Учесть значение. Возвращает True, если скетч изменился"""
+        hashed = _hash(value)
+        index = hashed >> _VALUE_BITS
+        rest = hashed & ((1 << _VALUE_BITS) - 1)
+        rank = _VALUE_BITS - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        estimate = _ALPHA * REGISTERS * REGISTERS / sum(_POWERS[rank] for rank in self.registers)
+        if estimate <= 2.5 * REGISTERS:
+            # Малые мощности: линейный подсчет по пустым регистрам
+            zeros = self.registers.count(0)
+            if zeros:
+                estimate = REGISTERS * math.log(REGISTERS / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        # Скетчи малоактивных дней почти пустые и хорошо сжимаются
+        return zlib.compress(bytes(self.registers), 1)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(zlib.decompress(data))
@@ -0,0 +1,267 @@
+import heapq
+import threading
+import time
+from datetime import datetime
+from collections import OrderedDict
+import click
+from flask import Blueprint, request, jsonify, current_app
+from flask.cli import with_appcontext
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert
+from .models import db, User, Course, Module, Enrollment, Assessment, CourseLeaderboard
+from .authz import require_role
+from . import metrics
+
+leaderboard_bp = Blueprint('leaderboards', __name__)
+
+def _heap_key(entry):
+    """Выше средняя оценка, затем прогресс, затем меньший id; меньший ключ - худшее место"""
+    return (entry.average_grade, entry.progress, -entry.user_id)
+
+class CourseBoard:
+    """Top-K студентов курса в памяти: min-куча с худшим из K в вершине.
+
+    Новая или улучшенная строка вытесняет вершину за O(log K); если студент
+    из top-K ухудшил результат или выбыл, на его место может претендовать
+    любой студент вне кучи, поэтому board помечается устаревшим и при
+    следующем обращении перечитывается запросом ORDER BY ... LIMIT K по
+    индексу ix_course_leaderboard_rank. Места студентов вне top-K считает
+    rank_of_entry по тому же индексу.
+    """
+
+    def __init__(self, rows, total, size):
+        self.size = size
+        self.total = total
+        self.heap = [(_heap_key(row), row) for row in rows]
+        heapq.heapify(self.heap)
+        self.members = {row.user_id: row for row in rows}
+        self.stale = False
+        self.loaded_at = time.monotonic()
+
+    def put(self, entry, is_new):
+        if is_new:
+            self.total += 1
+        current = self.members.get(entry.user_id)
+        if current is not None:
+            if _heap_key(entry) < _heap_key(current):
+                self.stale = True
+                return
+            self.heap = [item for item in self.heap if item[1].user_id != entry.user_id]
+            heapq.heapify(self.heap)
+            del self.members[entry.user_id]
+        elif len(self.heap) >= self.size and _heap_key(entry) <= self.heap[0][0]:
+            return
+
+        heapq.heappush(self.heap, (_heap_key(entry), entry))
+        self.members[entry.user_id] = entry
+        if len(self.heap) > self.size:
+            _, evicted = heapq.heappop(self.heap)
+            del self.members[evicted.user_id]
+
+    def remove(self, user_id):
+        self.total = max(self.total - 1, 0)
+        if user_id in self.members:
+            self.stale = True
+
+    def top(self, limit):
+        return [entry for _, entry in heapq.nlargest(limit, self.heap)]
+
+    def rank(self, user_id):
+        """Место студента из top-K или None, если его там нет"""
+        entry = self.members.get(user_id)
+        if entry is None:
+            return None
+        key = _heap_key(entry)
+        return sum(1 for other, _ in self.heap if other > key) + 1
+
+class LeaderboardEntry:
+    __slots__ = ('user_id', 'average_grade', 'assessment_count', 'progress')
+
+    def __init__(self, user_id, average_grade, assessment_count, progress):
+        self.user_id = user_id
+        self.average_grade = average_grade
+        self.assessment_count = assessment_count
+        self.progress = progress
+
+class Leaderboards:
+    """Рейтинги курсов в памяти процесса поверх таблицы course_leaderboard.
+
+    Рейтинг курса загружается из таблицы при первом обращении и затем
+    обновляется при каждой записи оценки. В памяти держатся рейтинги не более
+    LEADERBOARD_CACHE_COURSES курсов (LRU); записи из других процессов
+    подхватываются перезагрузкой раз в LEADERBOARD_REFRESH_INTERVAL секунд.
+    """
+
+    def __init__(self):
+        self._boards = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _load(self, course_id):
+        size = current_app.config.get('LEADERBOARD_TOP_K', 100)
+        rows = db.session.query(
+            CourseLeaderboard.user_id, CourseLeaderboard.average_grade,
+            CourseLeaderboard.assessment_count, CourseLeaderboard.progress
+        ).filter(CourseLeaderboard.course_id == course_id).order_by(
+            CourseLeaderboard.average_grade.desc(), CourseLeaderboard.progress.desc(), CourseLeaderboard.user_id
+        ).limit(size).all()
+        total = db.session.query(db.func.count()).select_from(CourseLeaderboard).filter(
+            CourseLeaderboard.course_id == course_id
+        ).scalar()
+        return CourseBoard([LeaderboardEntry(*row) for row in rows], total, size)
+
+    def board(self, course_id):
+        interval = current_app.config.get('LEADERBOARD_REFRESH_INTERVAL', 300)
+        with self._lock:
+            board = self._boards.get(course_id)
+            fresh = board is not None and not board.stale and time.monotonic() - board.loaded_at <= interval
+            metrics.cache_hit('leaderboard', fresh)
+            if not fresh:
+                board = self._load(course_id)
+                self._boards[course_id] = board
+            self._boards.move_to_end(course_id)
+            while len(self._boards) > current_app.config.get('LEADERBOARD_CACHE_COURSES', 256):
+                self._boards.popitem(last=False)
+            return board
+
+    def record_assessment(self, user_id, course_id):
+        """Пересчитать строку студента после записи оценки по модулю курса.
+
+        Агрегат считается только по оценкам этого студента в этом курсе,
+        а не по всем студентам, как в User.get_user_performance_statistics.
+        """
+        average_grade, assessment_count = db.session.query(
+            db.func.coalesce(db.func.avg(Assessment.grade), 0.0), db.func.count(Assessment.id)
+        ).join(
+            Module, Module.id == Assessment.module_id
+        ).filter(
+            Assessment.user_id == user_id, Module.course_id == course_id
+        ).one()
+        progress = db.session.query(Enrollment.progress).filter_by(
+            user_id=user_id, course_id=course_id
+        ).scalar() or 0.0
+
+        is_new = db.session.get(CourseLeaderboard, (course_id, user_id)) is None
+        values = {'average_grade': average_grade, 'assessment_count': assessment_count, 'progress': progress}
+        stmt = insert(CourseLeaderboard).values(course_id=course_id, user_id=user_id, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CourseLeaderboard.course_id, CourseLeaderboard.user_id],
+            # onupdate колонки в ON CONFLICT DO UPDATE не применяется
+            set_={**values, 'updated_at': datetime.utcnow()}
+        )
+        db.session.execute(stmt)
+        db.session.commit()
+
+        with self._lock:
+            board = self._boards.get(course_id)
+            if board is not None:
+                board.put(LeaderboardEntry(user_id, average_grade, assessment_count, progress), is_new)
+
+    def remove_user(self, user_id, course_id):
+        removed = CourseLeaderboard.query.filter_by(course_id=course_id, user_id=user_id).delete()
+        db.session.commit()
+        with self._lock:
+            board = self._boards.get(course_id)
+            if board is not None and removed:
+                board.remove(user_id)
+
+    def forget_course(self, course_id):
+        CourseLeaderboard.query.filter_by(course_id=course_id).delete()
+        db.session.commit()
+        with self._lock:
+            self._boards.pop(course_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._boards.clear()
+
+leaderboards = Leaderboards()
+
+def rank_of_entry(course_id, entry):
+    """Место строки в рейтинге курса: число строк с лучшим ключом по индексу рейтинга"""
+    better = db.session.query(db.func.count()).select_from(CourseLeaderboard).filter(
+        CourseLeaderboard.course_id == course_id,
+        db.or_(
+            CourseLeaderboard.average_grade > entry.average_grade,
+            db.and_(CourseLeaderboard.average_grade == entry.average_grade, db.or_(
+                CourseLeaderboard.progress > entry.progress,
+                db.and_(CourseLeaderboard.progress == entry.progress, CourseLeaderboard.user_id < entry.user_id)
+            ))
+        )
+    ).scalar()
+    return better + 1
+
+def _entry_json(entry, rank, names):
+    return {
+        'rank': rank,
+        'user_id': entry.user_id,
+        'user_name': names.get(entry.user_id),
+        'average_grade': round(entry.average_grade, 2),
+        'assessment_count': entry.assessment_count,
+        'progress': entry.progress
+    }
+
+# Лучшие студенты курса
+@leaderboard_bp.route('/courses/<int:course_id>/leaderboard', methods=['GET'])
+@require_role('admin', message='Нет прав на просмотр рейтинга курса')
+def get_course_leaderboard(course_id):
+    Course.query.get_or_404(course_id)
+    limit = min(max(request.args.get('limit', 10, type=int), 1), current_app.config.get('LEADERBOARD_TOP_K', 100))
+
+    board = leaderboards.board(course_id)
+    top = board.top(limit)
+    names = dict(db.session.query(User.id, User.name).filter(
+        User.id.in_([entry.user_id for entry in top])
+    )) if top else {}
+
+    return jsonify({
+        'course_id': course_id,
+        'total': board.total,
+        'items': [_entry_json(entry, rank, names) for rank, entry in enumerate(top, start=1)]
+    })
+
+# Место текущего пользователя в рейтинге курса
+@leaderboard_bp.route('/courses/<int:course_id>/leaderboard/me', methods=['GET'])
+@jwt_required()
+def get_own_rank(course_id):
+    current_user = get_jwt_identity()
+    user_id = current_user['id']
+
+    board = leaderboards.board(course_id)
+    entry = board.members.get(user_id)
+    if entry is not None:
+        rank = board.rank(user_id)
+    else:
+        row = db.session.query(
+            CourseLeaderboard.user_id, CourseLeaderboard.average_grade,
+            CourseLeaderboard.assessment_count, CourseLeaderboard.progress
+        ).filter_by(course_id=course_id, user_id=user_id).first()
+        if row is None:
+            return jsonify({'message': 'Нет оценок по этому курсу'}), 404
+        entry = LeaderboardEntry(*row)
+        rank = rank_of_entry(course_id, entry)
+
+    user = db.session.get(User, user_id)
+    names = {user_id: user.name} if user else {}
+    result = _entry_json(entry, rank, names)
+    result['total'] = board.total
+    return jsonify(result)
+
+# Пересчет рейтингов по таблице оценок
+@click.command('rebuild-leaderboards')
+@with_appcontext
+def rebuild_leaderboards_command():
+    """Полный пересчет таблицы course_leaderboard по оценкам и прогрессу."""
+    db.session.execute(text('DELETE FROM course_leaderboard'))
+    db.session.execute(text("""
+        INSERT INTO course_leaderboard (course_id, user_id, average_grade, assessment_count, progress, updated_at)
+        SELECT m.course_id, a.user_id, AVG(a.grade), COUNT(a.id), e.progress, CURRENT_TIMESTAMP
+        FROM assessments a
+        JOIN modules m ON m.id = a.module_id
+        JOIN enrollments e ON e.user_id = a.user_id AND e.course_id = m.course_id
+        GROUP BY m.course_id, a.user_id
+    """))
+    db.session.commit()
+    leaderboards.clear()
+    count = db.session.query(db.func.count()).select_from(CourseLeaderboard).scalar()
+    click.echo(f'Записей в рейтингах: {count}.')
@@ -0,0 +1,347 @@
+import glob
+import hmac
+import json
+import os
+import sqlite3
+import threading
+import time
+from flask import Blueprint, Response, current_app, jsonify, request
+from sqlalchemy import event
+from . import db
+
+metrics_bp = Blueprint('metrics', __name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+SQL_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+POOL_WAIT_BUCKETS = (0.0001, 0.001, 0.01, 0.1, 0.5, 1.0, 5.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dump(self):
+        return [[list(key), value] for key, value in self.values.items()]
+
+    @staticmethod
+    def merge(target, value):
+        return (target or 0) + value
+
+    def render(self, samples):
+        for key, value in samples.items():
+            yield f'{self.name}{_labels(self.labelnames, key)} {_number(value)}'
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # ключ меток -> [счетчики корзин..., сумма, количество]
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.registry.lock:
+            data = self.values.get(key)
+            if data is None:
+                data = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+                    break
+            data[-2] += value
+            data[-1] += 1
+
+    def dump(self):
+        return [[list(key), list(data)] for key, data in self.values.items()]
+
+    @staticmethod
+    def merge(target, value):
+        return value if target is None else [a + b for a, b in zip(target, value)]
+
+    def render(self, samples):
+        for key, data in samples.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, data[:-2]):
+                cumulative += count
+                yield f'{self.name}_bucket{_labels(self.labelnames, key, ("le", _number(bound)))} {cumulative}'
+            yield f'{self.name}_bucket{_labels(self.labelnames, key, ("le", "+Inf"))} {data[-1]}'
+            yield f'{self.name}_sum{_labels(self.labelnames, key)} {_number(data[-2])}'
+            yield f'{self.name}_count{_labels(self.labelnames, key)} {data[-1]}'
+
+class Registry:
+    """Метрики процесса и сборка текстового формата Prometheus.
+
+    При заданном METRICS_DIR каждый процесс периодически сохраняет свои
+    значения в <METRICS_DIR>/metrics-<pid>-<время старта>.json, а /metrics
+    складывает файлы всех процессов: так pre-fork воркеры отдают общие счетчики,
+    к какому бы процессу ни пришел запрос. Значения завершившихся процессов
+    остаются в сумме, чтобы счетчики не убывали; gauge-и считаются только по
+    живым. Время старта в имени файла не дает новому воркеру, получившему pid
+    завершившегося, затереть его значения.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.gauges = {}  # имя -> (описание, функция -> {метка: значение})
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.metrics.setdefault(name, Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.metrics.setdefault(name, Histogram(self, name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, collect):
+        """Gauge, значения которого вычисляются при сборе: collect() -> {значение метки kind: число}"""
+        self.gauges[name] = (documentation, collect)
+
+    def snapshot(self):
+        with self.lock:
+            metrics = {name: metric.dump() for name, metric in self.metrics.items()}
+        gauges = {}
+        for name, (_, collect) in self.gauges.items():
+            try:
+                gauges[name] = collect()
+            except Exception:  # gauge не должен ломать выдачу остальных метрик
+                continue
+        pid, started = _process()
+        return {'pid': pid, 'started': started, 'metrics': metrics, 'gauges': gauges}
+
+    def write(self, directory):
+        pid, started = _process()
+        path = os.path.join(directory, f'metrics-{pid}-{started}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + '.tmp', path)
+
+    def collect(self, directory=None):
+        """Снимки всех процессов: свой - из памяти, остальные - из файлов"""
+        own = self.snapshot()
+        if not directory:
+            return [own]
+        others = []
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if (snapshot.get('pid'), snapshot.get('started')) != (own['pid'], own['started']):
+                others.append(snapshot)
+
+        # Из нескольких файлов с одним pid живым может быть только последний запущенный
+        latest = {}
+        for snapshot in others:
+            pid = snapshot.get('pid')
+            latest[pid] = max(latest.get(pid, 0), snapshot.get('started', 0))
+        for snapshot in others:
+            pid = snapshot.get('pid')
+            if pid == own['pid'] or snapshot.get('started', 0) < latest[pid] or not _alive(pid):
+                snapshot['gauges'] = {}
+        return [own] + others
+
+    def render(self, snapshots):
+        lines = []
+        for name, metric in self.metrics.items():
+            merged = {}
+            for snapshot in snapshots:
+                for key, value in snapshot['metrics'].get(name, []):
+                    key = tuple(key)
+                    merged[key] = metric.merge(merged.get(key), value)
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            lines.extend(metric.render(merged))
+        for name, (documentation, _) in self.gauges.items():
+            merged = {}
+            for snapshot in snapshots:
+                for kind, value in snapshot['gauges'].get(name, {}).items():
+                    merged[kind] = merged.get(kind, 0) + value
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.extend(f'{name}{_labels(("kind",), (kind,))} {_number(value)}' for kind, value in merged.items())
+        return '\n'.join(lines) + '\n'
+
+_process_started = (None, None)
+
+def _process():
+    """pid и время (мс), с которого процесс ведет метрики; после fork отсчитывается заново"""
+    global _process_started
+    pid = os.getpid()
+    if _process_started[0] != pid:
+        _process_started = (pid, int(time.time() * 1000))
+    return _process_started
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except (OSError, TypeError):
+        return False
+    return True
+
+registry = Registry()
+
+requests_total = registry.counter(
+    'http_requests_total', 'Обработанные HTTP-запросы', ('blueprint', 'endpoint', 'method', 'status'))
+request_duration = registry.histogram(
+    'http_request_duration_seconds', 'Время обработки HTTP-запроса', ('blueprint', 'endpoint'))
+request_statements = registry.histogram(
+    'http_request_sql_statements', 'Число SQL-запросов на один HTTP-запрос', ('blueprint', 'endpoint'),
+    buckets=SQL_COUNT_BUCKETS)
+statement_duration = registry.histogram(
+    'db_statement_duration_seconds', 'Время выполнения SQL-запроса (включая ожидание блокировки SQLite)',
+    buckets=SQL_BUCKETS)
+pool_wait = registry.histogram(
+    'db_pool_checkout_wait_seconds', 'Ожидание соединения из пула', buckets=POOL_WAIT_BUCKETS)
+sqlite_busy = registry.counter(
+    'db_sqlite_busy_total', 'Ошибки SQLITE_BUSY / database is locked после истечения busy timeout')
+cache_requests = registry.counter(
+    'cache_requests_total', 'Обращения к кэшам процесса', ('cache', 'result'))
+
+def cache_hit(cache, hit):
+    cache_requests.inc(cache=cache, result='hit' if hit else 'miss')
+
+_local = threading.local()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('metrics_started')
+    if started:
+        statement_duration.observe(time.perf_counter() - started.pop())
+    if getattr(_local, 'statements', None) is not None:
+        _local.statements += 1
+
+def _handle_error(context):
+    error = context.original_exception
+    if isinstance(error, sqlite3.OperationalError) and ('locked' in str(error) or 'busy' in str(error)):
+        sqlite_busy.inc()
+    started = context.connection.info.get('metrics_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+def _time_checkout(pool):
+    # У пула нет события "начало ожидания", поэтому замеряется сам _do_get
+    do_get = pool._do_get
+
+    def timed_do_get():
+        started = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            pool_wait.observe(time.perf_counter() - started)
+
+    pool._do_get = timed_do_get
+
+def _password_queue():
+    from .passwords import password_hasher
+    stats = password_hasher.stats()
+    return {'password_hash_queued': stats['queued'], 'password_hash_running': stats['running']}
+
+def _preview_queue():
+    from .previews import pending_previews
+    return {'preview_pending': pending_previews()}
+
+def init_app(app):
+    """Подключить сбор метрик, если METRICS_ENABLED.
+
+    Метрики раскрывают эндпоинты и нагрузку, поэтому GET /metrics отвечает
+    только сборщику, передающему METRICS_TOKEN (переменная окружения) в
+    заголовке Authorization: Bearer <токен>; пока токен не задан, ответ - 401.
+    """
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    directory = app.config.get('METRICS_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(engine, 'handle_error', _handle_error)
+            _time_checkout(engine.pool)
+
+    registry.gauge('job_queue_depth', 'Задачи в очереди хеширования паролей и пула превью процесса', lambda: {
+        **_password_queue(), **_preview_queue()
+    })
+
+    @app.before_request
+    def start_request_metrics():
+        _local.started = time.perf_counter()
+        _local.statements = 0
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = getattr(_local, 'started', None)
+        if started is None:
+            return response
+        blueprint = request.blueprint or ''
+        endpoint = request.endpoint or 'unmatched'
+        request_duration.observe(time.perf_counter() - started, blueprint=blueprint, endpoint=endpoint)
+        request_statements.observe(_local.statements, blueprint=blueprint, endpoint=endpoint)
+        requests_total.inc(blueprint=blueprint, endpoint=endpoint, method=request.method, status=response.status_code)
+        return response
+
+    @app.teardown_request
+    def clear_request_metrics(exc):
+        _local.started = None
+        _local.statements = None
+
+    if directory:
+        interval = app.config.get('METRICS_FLUSH_INTERVAL', 5)
+
+        def flush_loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    registry.write(directory)
+                except OSError as e:
+                    app.logger.warning('Не удалось сохранить метрики: %s', e)
+
+        threading.Thread(target=flush_loop, name='metrics-flush', daemon=True).start()
+
+    app.register_blueprint(metrics_bp)
+
+# Метрики в текстовом формате Prometheus
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    token = current_app.config.get('METRICS_TOKEN')
+    supplied = request.headers.get('Authorization', '')
+    if not token or not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+        return jsonify({'message': 'Invalid metrics token'}), 401
+
+    directory = current_app.config.get('METRICS_DIR')
+    if directory:
+        registry.write(directory)
+    body = registry.render(registry.collect(directory))
+    return Response(body, mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -1,6 +1,19 @@
-from datetime import datetime
+import hashlib
+import os
+from datetime import datetime, timedelta
 from sqlalchemy import func, text, case
+from sqlalchemy.orm import selectinload
+from sqlalchemy.dialects.sqlite import insert
 from . import db
+from .textstore import CompressedText
+from .reports import ReportWindow
+from .hll import HyperLogLog
+
+def _course_modules_condition(module_column, window):
+    """Условие "модуль принадлежит курсу отчета" для таблиц, где есть только module_id"""
+    if window.course_id is None:
+        return []
+    return [module_column.in_(db.select(Module.id).where(Module.course_id == window.course_id))]
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -21,8 +34,9 @@ class User(db.Model):
         return f'<User {self.name}>'
 
     @classmethod
-    def get_active_users_with_courses(cls):
+    def get_active_users_with_courses(cls, window=None):
         """Получить активных пользователей с информацией о курсах (реализация запроса 1)"""
+        window = window or ReportWindow()
         return db.session.query(
             cls.id.label('user_id'),
             cls.name.label('user_name'),
@@ -30,7 +44,10 @@ class User(db.Model):
             func.count(Enrollment.id).label('enrolled_courses'),
             func.max(Enrollment.enrollment_date).label('last_enrollment_date')
         ).join(
-            Enrollment, cls.id == Enrollment.user_id
+            Enrollment, db.and_(
+                cls.id == Enrollment.user_id,
+                *window.conditions(Enrollment.enrollment_date, Enrollment.course_id)
+            )
         ).filter(
             cls.role == 'student'
         ).group_by(
@@ -42,8 +59,9 @@ class User(db.Model):
         ).all()
 
     @classmethod
-    def get_user_performance_statistics(cls):
+    def get_user_performance_statistics(cls, window=None):
         """Получить статистику успеваемости пользователей (реализация запроса 4)"""
+        window = window or ReportWindow()
         query = db.session.query(
             cls.id.label('user_id'),
             cls.name.label('user_name'),
@@ -51,13 +69,17 @@ class User(db.Model):
             func.avg(Assessment.grade).label('average_grade'),
             (func.avg(Assessment.grade) / 5.0 * 100).label('performance_percentage'),
             case(
-                [(func.avg(Assessment.grade) >= 4.5, 'Отлично'),
-                 (func.avg(Assessment.grade) >= 3.5, 'Хорошо'),
-                 (func.avg(Assessment.grade) >= 2.5, 'Удовлетворительно')],
+                (func.avg(Assessment.grade) >= 4.5, 'Отлично'),
+                (func.avg(Assessment.grade) >= 3.5, 'Хорошо'),
+                (func.avg(Assessment.grade) >= 2.5, 'Удовлетворительно'),
                 else_='Неудовлетворительно'
             ).label('performance_category')
         ).outerjoin(
-            Assessment, cls.id == Assessment.user_id
+            Assessment, db.and_(
+                cls.id == Assessment.user_id,
+                *window.conditions(Assessment.assessment_date),
+                *_course_modules_condition(Assessment.module_id, window)
+            )
         ).filter(
             cls.role == 'student'
         ).group_by(
@@ -68,29 +90,38 @@ class User(db.Model):
         return query.all()
 
     @classmethod
-    def get_user_activity_statistics(cls):
+    def get_user_activity_statistics(cls, window=None):
         """Получить статистику активности пользователей (реализация запроса 6)"""
         # Для реализации этого запроса может потребоваться написание raw SQL,
         # так как некоторые вычисления сложно представить через SQLAlchemy ORM
-
-        # Используем текстовый SQL-запрос
-        stmt = text("""
+        window = window or ReportWindow()
+        params = {}
+        enrollment_window = window.sql('e.enrollment_date', params, 'e.course_id')
+        assessment_window = window.sql('a.assessment_date', params)
+        if window.course_id is not None:
+            assessment_window += ' AND a.module_id IN (SELECT id FROM modules WHERE course_id = :window_course_id)'
+        feedback_window = window.sql('f.created_at', params, 'f.course_id')
+        course_window = window.sql('e2.enrollment_date', params, 'e2.course_id')
+
+        # Используем текстовый SQL-запрос; условия периода стоят в ON, чтобы
+        # студенты без активности за период оставались в отчете
+        stmt = text(f"""
             SELECT
                 u.id AS user_id,
                 u.name AS user_name,
                 COUNT(e.id) AS enrolled_courses,
                 COUNT(a.id) AS completed_assessments,
-                (COUNT(a.id) * 1.0 / NULLIF((SELECT COUNT(m.id) FROM modules m JOIN enrollments e2 ON m.course_id = e2.course_id WHERE e2.user_id = u.id), 0)) * 100 AS completion_rate,
+                (COUNT(a.id) * 1.0 / NULLIF((SELECT COUNT(m.id) FROM modules m JOIN enrollments e2 ON m.course_id = e2.course_id WHERE e2.user_id = u.id{course_window}), 0)) * 100 AS completion_rate,
                 AVG(e.progress) AS average_progress,
                 AVG(f.rating) AS average_feedback
             FROM
                 users u
             LEFT JOIN
-                enrollments e ON u.id = e.user_id
+                enrollments e ON u.id = e.user_id{enrollment_window}
             LEFT JOIN
-                assessments a ON u.id = a.user_id
+                assessments a ON u.id = a.user_id{assessment_window}
             LEFT JOIN
-                feedbacks f ON u.id = f.user_id
+                feedbacks f ON u.id = f.user_id{feedback_window}
             WHERE
                 u.role = 'student'
             GROUP BY
@@ -99,14 +130,29 @@ class User(db.Model):
                 completion_rate DESC, average_progress DESC
         """)
 
-        return db.session.execute(stmt).fetchall()
+        return db.session.execute(stmt, params).fetchall()
+
+class RevokedToken(db.Model):
+    """Отозванный access-токен (jti) или все токены пользователя, выпущенные до revoked_before"""
+    __tablename__ = 'revoked_tokens'
+    # Без AUTOINCREMENT SQLite повторно выдает id удаленных строк, и Blocklist.sync их пропустит
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), nullable=True, unique=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    revoked_before = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<RevokedToken {self.jti or self.user_id}>'
 
 class Course(db.Model):
     __tablename__ = 'courses'
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     modules = db.relationship('Module', back_populates='course')
@@ -117,17 +163,20 @@ class Course(db.Model):
         return f'<Course {self.title}>'
 
     @classmethod
-    def get_popular_courses(cls):
+    def get_popular_courses(cls, window=None):
         """Получить популярные курсы (реализация запроса 2)"""
+        window = window or ReportWindow()
         return db.session.query(
             cls.id.label('course_id'),
             cls.title.label('course_title'),
             func.count(Enrollment.id).label('enrollment_count'),
             func.avg(Feedback.rating).label('average_rating')
         ).outerjoin(
-            Enrollment, cls.id == Enrollment.course_id
+            Enrollment, db.and_(cls.id == Enrollment.course_id, *window.conditions(Enrollment.enrollment_date))
         ).outerjoin(
-            Feedback, cls.id == Feedback.course_id
+            Feedback, db.and_(cls.id == Feedback.course_id, *window.conditions(Feedback.created_at))
+        ).filter(
+            *window.conditions(None, cls.id)
         ).group_by(
             cls.id, cls.title
         ).having(
@@ -139,52 +188,74 @@ class Course(db.Model):
         ).all()
 
     @classmethod
-    def get_course_statistics(cls):
+    def get_course_statistics(cls, window=None):
         """Получить статистику по курсам (реализация запроса 5)"""
+        window = window or ReportWindow()
         total_students = db.session.query(func.count(User.id)).filter(User.role == 'student').scalar() or 1
 
+        # Модули, записи и отзывы агрегируются отдельно и присоединяются по курсу,
+        # без перемножения строк. Запись уникальна по (user_id, course_id), поэтому
+        # число записей и есть число разных студентов - без COUNT(DISTINCT)
+        modules = db.session.query(
+            Module.course_id, func.count(Module.id).label('module_count')
+        ).group_by(Module.course_id).subquery()
+        enrollments = db.session.query(
+            Enrollment.course_id, func.count(Enrollment.id).label('student_count')
+        ).filter(
+            *window.conditions(Enrollment.enrollment_date, Enrollment.course_id)
+        ).group_by(Enrollment.course_id).subquery()
+        feedbacks = db.session.query(
+            Feedback.course_id, func.avg(Feedback.rating).label('average_rating')
+        ).filter(
+            *window.conditions(Feedback.created_at, Feedback.course_id)
+        ).group_by(Feedback.course_id).subquery()
+        student_count = func.coalesce(enrollments.c.student_count, 0)
+
         return db.session.query(
             cls.id.label('course_id'),
             cls.title.label('course_title'),
-            func.count(Module.id).label('module_count'),
-            func.count(func.distinct(Enrollment.user_id)).label('student_count'),
-            (func.count(func.distinct(Enrollment.user_id)) * 100.0 / total_students).label('enrollment_percentage'),
-            func.avg(Feedback.rating).label('average_rating'),
-            (func.avg(Feedback.rating) / 5.0 * 100).label('satisfaction_percentage')
+            func.coalesce(modules.c.module_count, 0).label('module_count'),
+            student_count.label('student_count'),
+            (student_count * 100.0 / total_students).label('enrollment_percentage'),
+            feedbacks.c.average_rating.label('average_rating'),
+            (feedbacks.c.average_rating / 5.0 * 100).label('satisfaction_percentage')
         ).outerjoin(
-            Module, cls.id == Module.course_id
+            modules, modules.c.course_id == cls.id
         ).outerjoin(
-            Enrollment, cls.id == Enrollment.course_id
+            enrollments, enrollments.c.course_id == cls.id
         ).outerjoin(
-            Feedback, cls.id == Feedback.course_id
-        ).group_by(
-            cls.id, cls.title
+            feedbacks, feedbacks.c.course_id == cls.id
+        ).filter(
+            *window.conditions(None, cls.id)
         ).order_by(
-            func.count(func.distinct(Enrollment.user_id)).desc(),
-            func.avg(Feedback.rating).desc()
+            student_count.desc(),
+            feedbacks.c.average_rating.desc()
         ).all()
 
     @classmethod
-    def get_course_module_statistics(cls):
-        """Получить статистику по модулям курсов (реализация запроса 3)"""
-        year_ago = datetime.utcnow().replace(year=datetime.utcnow().year - 1)
+    def get_course_module_statistics(cls, window=None):
+        """Получить статистику по модулям курсов (реализация запроса 3)
+
+        Период относится к датам оценок; по умолчанию - последний год.
+        """
+        window = window or ReportWindow(start=datetime.utcnow() - timedelta(days=365))
 
         return db.session.query(
             cls.id.label('course_id'),
             cls.title.label('course_title'),
-            func.count(Module.id).label('module_count'),
+            func.count(func.distinct(Module.id)).label('module_count'),
             func.count(Assessment.id).label('assessment_count'),
             func.avg(Assessment.grade).label('average_grade')
         ).outerjoin(
             Module, cls.id == Module.course_id
         ).outerjoin(
-            Assessment, Module.id == Assessment.module_id
+            Assessment, db.and_(Module.id == Assessment.module_id, *window.conditions(Assessment.assessment_date))
         ).filter(
-            cls.created_at > year_ago
+            *window.conditions(None, cls.id)
         ).group_by(
             cls.id, cls.title
         ).order_by(
-            func.count(Module.id).desc(),
+            func.count(func.distinct(Module.id)).desc(),
             func.avg(Assessment.grade).desc()
         ).all()
 
@@ -198,24 +269,53 @@ class Module(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
-    content = db.Column(db.Text, nullable=False)
+    # Длина текста в символах; сам текст хранится сжатым в module_contents
+    content_length = db.Column(db.Integer, nullable=False, default=0)
+    # sha256 текста - ключ готового HTML в rendered_contents
+    content_hash = db.Column(db.String(64), nullable=True, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     course = db.relationship('Course', back_populates='modules')
     assessments = db.relationship('Assessment', back_populates='module')
     attachments = db.relationship('Attachment', back_populates='module')
+    # Загружается только при обращении к content
+    body = db.relationship('ModuleContent', uselist=False, back_populates='module',
+                           cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<Module {self.title}>'
 
+    @property
+    def content(self):
+        return self.body.text if self.body is not None else None
+
+    @content.setter
+    def content(self, value):
+        if self.body is None:
+            self.body = ModuleContent()
+        self.body.text = value
+        self.content_length = len(value or '')
+        self.content_hash = hashlib.sha256((value or '').encode('utf-8')).hexdigest()
+
+class ModuleContent(CompressedText, db.Model):
+    """Текст модуля, вынесенный из горячей таблицы modules"""
+    __tablename__ = 'module_contents'
+    module_id = db.Column(db.Integer, db.ForeignKey('modules.id'), primary_key=True)
+
+    module = db.relationship('Module', back_populates='body')
+
+    def __repr__(self):
+        return f'<ModuleContent {self.module_id} ({self.codec})>'
+
 class Enrollment(db.Model):
     __tablename__ = 'enrollments'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False)
     progress = db.Column(db.Float, default=0.0)
-    enrollment_date = db.Column(db.DateTime, default=datetime.utcnow)
+    milestone = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # наибольший пройденный порог, %
+    enrollment_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     last_accessed = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     user = db.relationship('User', back_populates='enrollments')
@@ -249,9 +349,20 @@ class Enrollment(db.Model):
             raise ValueError("Пользователь уже зарегистрирован на этот курс")
 
         # Регистрация пользователя на курсе
-        enrollment = cls(user_id=user_id, course_id=course_id, progress=0.0)
+        enrollment = cls(user_id=user_id, course_id=course_id, progress=0.0, enrollment_date=datetime.utcnow())
         db.session.add(enrollment)
+        ActivityRollup.record('enrollment', course_id)
+        CohortMilestone.record(enrollment, 0, enrollment.enrollment_date)
+        ActivitySketch.record(user_id, course_id, enrollment.enrollment_date)
+        # Импорт здесь: модули рекомендаций и индексов каталога сами импортируют модели
+        from .recommendations import record_enrollment
+        from .suggest import title_index
+        from .facets import facet_index
+        record_enrollment(user_id, course_id, 1)
         db.session.commit()
+        # Счетчики в памяти - и для явной записи, и для автоматической из save_grade
+        title_index.add_enrollments(course_id, 1)
+        facet_index.add_enrollments(course_id, 1)
 
         return enrollment
 
@@ -293,6 +404,7 @@ class Enrollment(db.Model):
         # Обновление записи о прогрессе
         enrollment.progress = new_progress
         enrollment.last_accessed = datetime.utcnow()
+        CohortMilestone.record_progress(enrollment, enrollment.last_accessed)
         db.session.commit()
 
         return enrollment
@@ -303,7 +415,7 @@ class Assessment(db.Model):
     module_id = db.Column(db.Integer, db.ForeignKey('modules.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     grade = db.Column(db.Float, nullable=False, default=0.0)
-    assessment_date = db.Column(db.DateTime, default=datetime.utcnow)
+    assessment_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     module = db.relationship('Module', back_populates='assessments')
     user = db.relationship('User', back_populates='assessments')
@@ -320,18 +432,27 @@ class Assessment(db.Model):
         if not assessment:
             assessment = Assessment(user_id=user_id, module_id=module_id, grade=0.0)
             db.session.add(assessment)
+            course_id = db.session.query(Module.course_id).filter(Module.id == module_id).scalar()
+            ActivityRollup.record('assessment', course_id)
             db.session.commit()
 
         return assessment
 
     def save_grade(self, grade):
         """Сохранить оценку и обновить прогресс пользователя"""
+        previous_date = self.assessment_date
         self.grade = grade
         self.assessment_date = datetime.utcnow()
-        db.session.commit()
 
         # Получение курса, к которому принадлежит модуль
         course_id = self.module.course_id
+        # Оценка учитывается в счетчиках по дате последнего выставления
+        if previous_date is None or previous_date.date() != self.assessment_date.date():
+            if previous_date is not None:
+                ActivityRollup.record('assessment', course_id, previous_date, -1)
+            ActivityRollup.record('assessment', course_id, self.assessment_date)
+        ActivitySketch.record(self.user_id, course_id, self.assessment_date)
+        db.session.commit()
 
         # Обновление прогресса пользователя
         try:
@@ -349,7 +470,7 @@ class Feedback(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     comment = db.Column(db.Text, nullable=True)
     rating = db.Column(db.Integer, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     course = db.relationship('Course', back_populates='feedbacks')
     user = db.relationship('User', back_populates='feedbacks')
@@ -362,6 +483,112 @@ class Feedback(db.Model):
     def __repr__(self):
         return f'<Feedback for course {self.course_id} by user {self.user_id}>'
 
+class CourseCooccurrence(db.Model):
+    """Ячейка матрицы совместных записей курс × курс (X^T X по матрице пользователь × курс).
+
+    Диагональ (course_id == other_course_id) хранит квадрат нормы столбца курса,
+    нужный для косинусной меры.
+    """
+    __tablename__ = 'course_cooccurrence'
+    course_id = db.Column(db.Integer, primary_key=True)
+    other_course_id = db.Column(db.Integer, primary_key=True)
+    weight = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<CourseCooccurrence {self.course_id} - {self.other_course_id}: {self.weight}>'
+
+class CourseRelated(db.Model):
+    """Предрассчитанные top-k похожих курсов (см. app/recommendations.py)"""
+    __tablename__ = 'course_related'
+    course_id = db.Column(db.Integer, primary_key=True)
+    related_course_id = db.Column(db.Integer, primary_key=True, index=True)
+    score = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<CourseRelated {self.course_id} -> {self.related_course_id}: {self.score:.3f}>'
+
+class CourseLeaderboard(db.Model):
+    """Средняя оценка и прогресс студента по курсу для рейтинга (см. app/leaderboards.py)"""
+    __tablename__ = 'course_leaderboard'
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    average_grade = db.Column(db.Float, nullable=False, default=0.0)
+    assessment_count = db.Column(db.Integer, nullable=False, default=0)
+    progress = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_course_leaderboard_rank', 'course_id', 'average_grade', 'progress'),
+    )
+
+    def __repr__(self):
+        return f'<CourseLeaderboard {self.course_id} user {self.user_id}: {self.average_grade}>'
+
+class RenderedContent(db.Model):
+    """Санитизированный HTML текста модуля (см. app/rendering.py)"""
+    __tablename__ = 'rendered_contents'
+    content_hash = db.Column(db.String(64), primary_key=True)
+    renderer = db.Column(db.String(32), nullable=False)  # версия конвейера, которой построен html
+    html = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<RenderedContent {self.content_hash[:12]} ({self.renderer})>'
+
+class ActivityRollup(db.Model):
+    """Количество событий за день или неделю по курсу (см. app/rollups.py)"""
+    __tablename__ = 'activity_rollups'
+    granularity = db.Column(db.String(8), primary_key=True)  # 'day' или 'week'
+    bucket = db.Column(db.Date, primary_key=True)  # день или понедельник недели
+    course_id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(20), primary_key=True)  # enrollment, assessment, feedback, upload
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_activity_rollups_series', 'event_type', 'granularity', 'bucket'),
+    )
+
+    EVENT_TYPES = ('enrollment', 'assessment', 'feedback', 'upload')
+    GRANULARITIES = ('day', 'week')
+
+    def __repr__(self):
+        return f'<ActivityRollup {self.event_type} {self.granularity} {self.bucket} course {self.course_id}: {self.count}>'
+
+    @classmethod
+    def record(cls, event_type, course_id, when=None, delta=1):
+        """Учесть событие в дневном и недельном счетчике в текущей транзакции.
+
+        Счетчики соответствуют существующим строкам исходных таблиц, как и при
+        пересчете backfill-activity-rollups: при удалении строки событие снимается
+        (delta=-1) с корзины ее даты. Ниже нуля счетчик не уходит - строки,
+        созданные до появления activity_rollups, могли быть не учтены.
+        """
+        day = (when or datetime.utcnow()).date()
+        week = day - timedelta(days=day.weekday())
+        for granularity, bucket in (('day', day), ('week', week)):
+            stmt = insert(cls).values(
+                granularity=granularity, bucket=bucket, course_id=course_id,
+                event_type=event_type, count=max(delta, 0)
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[cls.granularity, cls.bucket, cls.course_id, cls.event_type],
+                set_={'count': db.func.max(cls.count + delta, 0)}
+            )
+            db.session.execute(stmt)
+
+class Blob(db.Model):
+    """Файл в контентно-адресуемом хранилище (ключ - sha256 содержимого)"""
+    __tablename__ = 'blobs'
+    hash = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    attachments = db.relationship('Attachment', back_populates='blob')
+
+    def __repr__(self):
+        return f'<Blob {self.hash[:12]} refs={self.ref_count}>'
+
 class Attachment(db.Model):
     __tablename__ = 'attachments'
     id = db.Column(db.Integer, primary_key=True)
@@ -370,9 +597,14 @@ class Attachment(db.Model):
     file_path = db.Column(db.String(255), nullable=False)
     file_type = db.Column(db.String(50))
     file_size = db.Column(db.Integer)
-    uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # NULL у вложений, загруженных до появления хранилища blobs (см. flask dedupe-uploads)
+    content_hash = db.Column(db.String(64), db.ForeignKey('blobs.hash'), nullable=True, index=True)
+    # Путь к PNG-превью относительно UPLOAD_FOLDER; заполняется фоновым пулом (app/previews.py)
+    preview_path = db.Column(db.String(255), nullable=True)
+    uploaded_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     module = db.relationship('Module', back_populates='attachments')
+    blob = db.relationship('Blob', back_populates='attachments')
 
     def __repr__(self):
         return f'<Attachment {self.filename}>'
@@ -389,20 +621,68 @@ class Attachment(db.Model):
             join(Module, cls.module_id == Module.id).\
             filter(Module.course_id == course_id).all()
 
+class StorageUsage(db.Model):
+    """Инкрементально поддерживаемый объем вложений модуля или курса"""
+    __tablename__ = 'storage_usage'
+    scope = db.Column(db.String(10), primary_key=True)  # 'module' или 'course'
+    scope_id = db.Column(db.Integer, primary_key=True)
+    total_bytes = db.Column(db.Integer, nullable=False, default=0)
+    file_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<StorageUsage {self.scope} {self.scope_id}: {self.file_count} files, {self.total_bytes} bytes>'
+
+class UploadSession(db.Model):
+    """Незавершенная загрузка файла по частям"""
+    __tablename__ = 'upload_sessions'
+    id = db.Column(db.String(32), primary_key=True)
+    module_id = db.Column(db.Integer, db.ForeignKey('modules.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    total_size = db.Column(db.Integer, nullable=True)
+    received_size = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    module = db.relationship('Module')
+
+    def __repr__(self):
+        return f'<UploadSession {self.id} {self.received_size}/{self.total_size}>'
+
+    @property
+    def temp_path(self):
+        """Путь временного файла относительно UPLOAD_FOLDER"""
+        return os.path.join('tmp', f'upload_{self.id}.part')
+
 class Notification(db.Model):
     __tablename__ = 'notifications'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
-    message = db.Column(db.Text, nullable=False)
+    # Длина текста в символах; сам текст хранится сжатым в notification_messages
+    message_length = db.Column(db.Integer, nullable=False, default=0)
     is_read = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     user = db.relationship('User', back_populates='notifications')
+    # Загружается только при обращении к message
+    body = db.relationship('NotificationMessage', uselist=False, back_populates='notification',
+                           cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<Notification {self.title} for user {self.user_id}>'
 
+    @property
+    def message(self):
+        return self.body.text if self.body is not None else None
+
+    @message.setter
+    def message(self, value):
+        if self.body is None:
+            self.body = NotificationMessage()
+        self.body.text = value
+        self.message_length = len(value or '')
+
     @classmethod
     def create_notification(cls, user_id, title, message):
         """Создать новое уведомление для пользователя"""
@@ -412,11 +692,13 @@ class Notification(db.Model):
         return notification
 
     @classmethod
-    def get_user_notifications(cls, user_id, unread_only=False):
+    def get_user_notifications(cls, user_id, unread_only=False, include_message=False):
         """Получить уведомления пользователя"""
         query = cls.query.filter_by(user_id=user_id)
         if unread_only:
             query = query.filter_by(is_read=False)
+        if include_message:
+            query = query.options(selectinload(cls.body))
         return query.order_by(cls.created_at.desc()).all()
 
     def mark_as_read(self):
@@ -424,6 +706,118 @@ class Notification(db.Model):
         self.is_read = True
         db.session.commit()
 
+class NotificationMessage(CompressedText, db.Model):
+    """Текст уведомления, вынесенный из таблицы notifications"""
+    __tablename__ = 'notification_messages'
+    notification_id = db.Column(db.Integer, db.ForeignKey('notifications.id'), primary_key=True)
+
+    notification = db.relationship('Notification', back_populates='body')
+
+    def __repr__(self):
+        return f'<NotificationMessage {self.notification_id} ({self.codec})>'
+
+class CohortMilestone(db.Model):
+    """Сколько записей недельной когорты прошли порог прогресса через N недель (см. app/cohorts.py).
+
+    Когорта - понедельник недели регистрации на курс. Порог 0 с weeks_since = 0
+    хранит размер когорты.
+    """
+    __tablename__ = 'cohort_milestones'
+    cohort_week = db.Column(db.Date, primary_key=True)
+    course_id = db.Column(db.Integer, primary_key=True)
+    milestone = db.Column(db.Integer, primary_key=True)  # 0, 25, 50, 75, 100
+    weeks_since = db.Column(db.Integer, primary_key=True)  # полных недель от регистрации до порога
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    MILESTONES = (25, 50, 75, 100)
+
+    def __repr__(self):
+        return f'<CohortMilestone {self.cohort_week} course {self.course_id} {self.milestone}% +{self.weeks_since}w: {self.count}>'
+
+    @staticmethod
+    def cohort_of(enrollment_date):
+        day = enrollment_date.date()
+        return day - timedelta(days=day.weekday())
+
+    @staticmethod
+    def weeks_between(enrollment_date, when):
+        return max((when - enrollment_date).days, 0) // 7
+
+    @classmethod
+    def reached(cls, progress):
+        """Наибольший порог, не превышающий прогресс"""
+        return max((m for m in cls.MILESTONES if (progress or 0) >= m), default=0)
+
+    @classmethod
+    def record(cls, enrollment, milestone, when, delta=1):
+        """Учесть прохождение порога записью на курс в текущей транзакции.
+
+        Отмена записи на курс снимает ее из размера когорты (порог 0, delta=-1);
+        ниже нуля счетчик не уходит.
+        """
+        stmt = insert(cls).values(
+            cohort_week=cls.cohort_of(enrollment.enrollment_date), course_id=enrollment.course_id,
+            milestone=milestone, weeks_since=cls.weeks_between(enrollment.enrollment_date, when), count=max(delta, 0)
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.cohort_week, cls.course_id, cls.milestone, cls.weeks_since],
+            set_={'count': db.func.max(cls.count + delta, 0)}
+        )
+        db.session.execute(stmt)
+
+    @classmethod
+    def record_progress(cls, enrollment, when):
+        """Учесть пороги, впервые пройденные при новом значении прогресса.
+
+        Порог считается один раз: если прогресс потом снизится, запись
+        остается в воронке.
+        """
+        reached = cls.reached(enrollment.progress)
+        if reached <= (enrollment.milestone or 0):
+            return
+        for milestone in cls.MILESTONES:
+            if (enrollment.milestone or 0) < milestone <= reached:
+                cls.record(enrollment, milestone, when)
+        enrollment.milestone = reached
+
+class ActivitySketch(db.Model):
+    """HyperLogLog-скетч студентов, активных на курсе за день (см. app/sketches.py).
+
+    Активность - регистрация на курс или сохранение оценки. Скетч с
+    course_id = ALL_COURSES считается по всем курсам сразу.
+    """
+    __tablename__ = 'activity_sketches'
+    course_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    registers = db.Column(db.LargeBinary, nullable=False)  # HyperLogLog.to_bytes()
+
+    ALL_COURSES = 0
+
+    def __repr__(self):
+        return f'<ActivitySketch course {self.course_id} {self.day}>'
+
+    @classmethod
+    def record(cls, user_id, course_id, when=None):
+        """Учесть активность студента в текущей транзакции.
+
+        Перед чтением скетча изменения сессии сбрасываются в БД: SQLite уже
+        держит блокировку записи, и параллельная транзакция не может
+        перезаписать скетч между чтением и записью.
+        """
+        db.session.flush()
+        day = (when or datetime.utcnow()).date()
+        for scope in (course_id, cls.ALL_COURSES):
+            sketch = db.session.get(cls, (scope, day))
+            if sketch is None:
+                hll = HyperLogLog()
+                hll.add(user_id)
+                db.session.add(cls(course_id=scope, day=day, registers=hll.to_bytes()))
+                continue
+            hll = HyperLogLog.from_bytes(sketch.registers)
+            if hll.add(user_id):
+                sketch.registers = hll.to_bytes()
+
+
 # Для SQLite триггеры нужно создавать с помощью DDL после создания таблиц
 # Этот код будет выполнен при инициализации базы данных
 def create_triggers():
@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from .models import db, User, Notification
+from .authz import require_role
+from .reports import ReportWindow
 
 notification_bp = Blueprint('notifications', __name__)
 
@@ -13,17 +15,46 @@ def get_user_notifications():
 
     # Параметр для фильтрации только непрочитанных уведомлений
     unread_only = request.args.get('unread', 'false').lower() == 'true'
+    # Тексты уведомлений по умолчанию не загружаются (см. GET /notifications/<id>)
+    include_message = request.args.get('include') == 'message'
 
-    notifications = Notification.get_user_notifications(user_id, unread_only)
-    result = [{
+    notifications = Notification.get_user_notifications(user_id, unread_only, include_message)
+    result = []
+    for notification in notifications:
+        item = {
+            'id': notification.id,
+            'title': notification.title,
+            'message_length': notification.message_length,
+            'is_read': notification.is_read,
+            'created_at': notification.created_at.isoformat()
+        }
+        if include_message:
+            item['message'] = notification.message
+        result.append(item)
+
+    return jsonify(result)
+
+# Получение уведомления с текстом
+@notification_bp.route('/notifications/<int:notification_id>', methods=['GET'])
+@jwt_required()
+def get_notification(notification_id):
+    current_user = get_jwt_identity()
+    user_id = current_user['id']
+
+    notification = Notification.query.get_or_404(notification_id)
+
+    # Проверка, принадлежит ли уведомление текущему пользователю
+    if notification.user_id != user_id:
+        return jsonify({'message': 'Нет прав на просмотр этого уведомления'}), 403
+
+    return jsonify({
         'id': notification.id,
         'title': notification.title,
         'message': notification.message,
+        'message_length': notification.message_length,
         'is_read': notification.is_read,
         'created_at': notification.created_at.isoformat()
-    } for notification in notifications]
-
-    return jsonify(result)
+    })
 
 # Получение количества непрочитанных уведомлений
 @notification_bp.route('/notifications/count', methods=['GET'])
@@ -95,16 +126,8 @@ def delete_notification(notification_id):
 
 # Создание уведомления для пользователя (только для администраторов)
 @notification_bp.route('/notifications', methods=['POST'])
-@jwt_required()
+@require_role('admin', message='Нет прав на создание уведомлений')
 def create_notification():
-    current_user = get_jwt_identity()
-    creator_id = current_user['id']
-
-    # Проверка прав (администратор)
-    creator = User.query.get(creator_id)
-    if not creator or creator.role != 'admin':
-        return jsonify({'message': 'Нет прав на создание уведомлений'}), 403
-
     data = request.get_json()
     user_id = data.get('user_id')
     title = data.get('title')
@@ -127,31 +150,29 @@ def create_notification():
 
 # Получение статистики по уведомлениям пользователей
 @notification_bp.route('/notifications/statistics', methods=['GET'])
-@jwt_required()
+@require_role('admin', message='Нет прав на просмотр статистики уведомлений')
 def get_notification_statistics():
-    current_user = get_jwt_identity()
-    user_id = current_user['id']
-
-    # Проверка прав (администратор)
-    user = User.query.get(user_id)
-    if not user or user.role != 'admin':
-        return jsonify({'message': 'Нет прав на просмотр статистики уведомлений'}), 403
-
     # Запрос с вычисляемыми полями:
     # 1. Общее количество уведомлений пользователя
     # 2. Количество непрочитанных уведомлений
     # 3. Процент прочитанных уведомлений
+    # Период from/to относится к дате создания уведомления; уведомления не
+    # привязаны к курсу, поэтому course_id здесь не применяется
+    try:
+        window = ReportWindow.from_args(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
 
     user_stats = db.session.query(
         User.id.label('user_id'),
         User.name.label('user_name'),
         User.email.label('user_email'),
         db.func.count(Notification.id).label('total_notifications'),
-        db.func.sum(db.case([(Notification.is_read == False, 1)], else_=0)).label('unread_notifications'),
-        (db.func.sum(db.case([(Notification.is_read == True, 1)], else_=0)) * 100.0 /
+        db.func.sum(db.case((Notification.is_read == False, 1), else_=0)).label('unread_notifications'),
+        (db.func.sum(db.case((Notification.is_read == True, 1), else_=0)) * 100.0 /
          db.func.nullif(db.func.count(Notification.id), 0)).label('read_percentage')
     ).outerjoin(
-        Notification, User.id == Notification.user_id
+        Notification, db.and_(User.id == Notification.user_id, *window.conditions(Notification.created_at))
     ).group_by(
         User.id, User.name, User.email
     ).having(
@@ -0,0 +1,136 @@
+import re
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from . import bcrypt
+
+# Стоимость bcrypt из хеша вида $2b$12$...
+_COST_RE = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+class PasswordHasherBusy(Exception):
+    """Очередь хеширования переполнена - запрос нужно повторить позже"""
+
+class PasswordHasher:
+    """Хеширование паролей в отдельном пуле потоков.
+
+    bcrypt выполняется в пуле из PASSWORD_HASH_WORKERS потоков (он отпускает
+    GIL), а не в потоке запроса: всплеск логинов не занимает все ядра, а поток
+    запроса только ждет результата. В очереди пула держится не больше
+    PASSWORD_HASH_QUEUE_SIZE задач; если очередь полна или результат не готов
+    за PASSWORD_HASH_QUEUE_TIMEOUT, выбрасывается PasswordHasherBusy (503).
+    """
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._queue_size = None
+        self._timeout = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'completed': 0,
+            'rejected': 0,
+            'queued': 0,
+            'running': 0,
+            'queue_time_total': 0.0,
+            'queue_time_max': 0.0,
+            'run_time_total': 0.0,
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        workers = app.config.setdefault('PASSWORD_HASH_WORKERS', 4)
+        self._queue_size = app.config.setdefault('PASSWORD_HASH_QUEUE_SIZE', 64)
+        self._timeout = app.config.setdefault('PASSWORD_HASH_QUEUE_TIMEOUT', 5.0)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hasher')
+
+    def _task(self, submitted, func, *args):
+        """Выполняется в потоке пула"""
+        started = time.perf_counter()
+        with self._lock:
+            self._stats['queued'] -= 1
+            self._stats['running'] += 1
+            wait = started - submitted
+            self._stats['queue_time_total'] += wait
+            self._stats['queue_time_max'] = max(self._stats['queue_time_max'], wait)
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._stats['running'] -= 1
+                self._stats['completed'] += 1
+                self._stats['run_time_total'] += time.perf_counter() - started
+
+    def _run(self, func, *args):
+        with self._lock:
+            if self._stats['queued'] >= self._queue_size:
+                self._stats['rejected'] += 1
+                raise PasswordHasherBusy()
+            self._stats['queued'] += 1
+
+        future = self._executor.submit(self._task, time.perf_counter(), func, *args)
+        try:
+            return future.result(timeout=self._timeout)
+        except TimeoutError:
+            # Задача, до которой очередь не дошла, снимается; начатая досчитается в пуле
+            with self._lock:
+                if future.cancel():
+                    self._stats['queued'] -= 1
+                self._stats['rejected'] += 1
+            raise PasswordHasherBusy()
+
+    def hash(self, password):
+        """Вычислить bcrypt-хеш с текущей стоимостью BCRYPT_LOG_ROUNDS"""
+        rounds = current_app.config.get('BCRYPT_LOG_ROUNDS', 12)
+        return self._run(bcrypt.generate_password_hash, password, rounds).decode('utf-8')
+
+    def verify(self, password_hash, password):
+        return self._run(bcrypt.check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Хеш создан с другой стоимостью, чем настроена сейчас"""
+        match = _COST_RE.match(password_hash or '')
+        if not match:
+            return False
+        return int(match.group(1)) != current_app.config.get('BCRYPT_LOG_ROUNDS', 12)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        completed = stats['completed'] or 1
+        stats['queue_time_avg'] = stats['queue_time_total'] / completed
+        stats['run_time_avg'] = stats['run_time_total'] / completed
+        return stats
+
+password_hasher = PasswordHasher()
+
+# Подбор стоимости bcrypt под целевую задержку на текущем оборудовании
+@click.command('calibrate-bcrypt')
+@click.option('--target-ms', default=250, show_default=True, help='Допустимое время одного хеширования, мс.')
+@click.option('--samples', default=5, show_default=True, help='Количество замеров на каждую стоимость.')
+@with_appcontext
+def calibrate_bcrypt_command(target_ms, samples):
+    """Подбор BCRYPT_LOG_ROUNDS под целевую задержку."""
+    chosen = 4
+    for rounds in range(4, 17):
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            bcrypt.generate_password_hash('calibration-password', rounds)
+            timings.append((time.perf_counter() - started) * 1000)
+        median = statistics.median(timings)
+        click.echo(f'rounds={rounds}: {median:.1f} мс')
+
+        if median > target_ms:
+            break
+        chosen = rounds
+
+    current = current_app.config.get('BCRYPT_LOG_ROUNDS', 12)
+    click.echo(f'Рекомендуемое значение BCRYPT_LOG_ROUNDS = {chosen} (сейчас {current}).')
+    if chosen != current:
+        click.echo('После изменения хеши пользователей будут пересчитаны при следующем входе.')
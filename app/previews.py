@@ -0,0 +1,160 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from .models import db, Attachment
+from . import storage
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow не установлен - превью изображений не строятся
+    Image = None
+
+try:
+    import pymupdf
+except ImportError:  # PyMuPDF не установлен - превью PDF не строятся
+    pymupdf = None
+
+IMAGE_TYPES = {'png', 'jpg', 'jpeg', 'gif'}
+PDF_TYPES = {'pdf'}
+
+# Максимальный размер стороны превью в пикселях
+PREVIEW_SIZE = (320, 320)
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = 0  # задачи, отправленные в пул и еще не завершенные
+
+def can_preview(file_type):
+    if file_type in IMAGE_TYPES:
+        return Image is not None
+    if file_type in PDF_TYPES:
+        return pymupdf is not None and Image is not None
+    return False
+
+def preview_relative_path(digest):
+    """Превью хранится рядом с blob-ом и общее для всех его вложений"""
+    return storage.blob_relative_path(digest) + storage.PREVIEW_SUFFIX
+
+def render_preview(source_path, target_path, file_type):
+    """Построить PNG-превью файла. Выполняется в дочернем процессе."""
+    if file_type in PDF_TYPES:
+        # Первая страница PDF в уменьшенном масштабе
+        with pymupdf.open(source_path) as document:
+            if document.page_count == 0:
+                return None
+            pixmap = document.load_page(0).get_pixmap(matrix=pymupdf.Matrix(0.5, 0.5))
+            image = Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+    else:
+        image = Image.open(source_path)
+        image.seek(0)  # Первый кадр для анимированных GIF
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    image.thumbnail(PREVIEW_SIZE)
+
+    # Запись через временный файл, чтобы читатели не увидели недописанное превью
+    tmp_path = target_path + '.tmp'
+    image.save(tmp_path, format='PNG', optimize=True)
+    os.replace(tmp_path, target_path)
+    return target_path
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=current_app.config.get('PREVIEW_WORKERS', 2))
+        return _executor
+
+def pending_previews():
+    return _pending
+
+def _on_preview_ready(app, digest, relative_path, future):
+    """Отметить превью у всех вложений с этим содержимым"""
+    global _pending
+    with _executor_lock:
+        _pending -= 1
+    try:
+        if future.result() is None:
+            return
+    except Exception as e:
+        app.logger.warning('Не удалось построить превью %s: %s', digest, e)
+        return
+
+    with app.app_context():
+        Attachment.query.filter_by(content_hash=digest).update(
+            {Attachment.preview_path: relative_path}, synchronize_session=False
+        )
+        db.session.commit()
+
+def schedule_preview(attachment):
+    """Поставить построение превью вложения в очередь пула процессов.
+
+    Возвращает True, если превью уже готово: тогда оно записывается во все
+    вложения с тем же содержимым (изменения не коммитятся).
+    """
+    if not attachment.content_hash or not can_preview(attachment.file_type):
+        return False
+
+    relative_path = preview_relative_path(attachment.content_hash)
+    if os.path.exists(storage.absolute_path(relative_path)):
+        Attachment.query.filter_by(content_hash=attachment.content_hash).update(
+            {Attachment.preview_path: relative_path}, synchronize_session=False
+        )
+        attachment.preview_path = relative_path
+        return True
+
+    global _pending
+    with _executor_lock:
+        _pending += 1
+    future = get_executor().submit(
+        render_preview,
+        storage.absolute_path(attachment.file_path),
+        storage.absolute_path(relative_path),
+        attachment.file_type
+    )
+    future.add_done_callback(partial(
+        _on_preview_ready, current_app._get_current_object(), attachment.content_hash, relative_path
+    ))
+    return False
+
+# Построение превью для уже загруженных вложений
+@click.command('generate-previews')
+@click.option('--batch-size', default=200, show_default=True, help='Количество вложений в одной порции.')
+@with_appcontext
+def generate_previews_command(batch_size):
+    """Построение превью для вложений, у которых его еще нет."""
+    global _executor
+    storage.ensure_attachment_columns()
+    last_id = 0
+    scheduled = 0
+    seen = set()  # хеши, превью которых уже поставлено в очередь или отмечено
+
+    while True:
+        attachments = Attachment.query.filter(
+            Attachment.id > last_id,
+            Attachment.preview_path.is_(None),
+            Attachment.content_hash.isnot(None)
+        ).order_by(Attachment.id).limit(batch_size).all()
+
+        if not attachments:
+            break
+
+        for attachment in attachments:
+            last_id = attachment.id
+            if attachment.content_hash in seen:
+                continue
+            seen.add(attachment.content_hash)
+            if can_preview(attachment.file_type) and not schedule_preview(attachment):
+                scheduled += 1
+
+        db.session.commit()
+
+    # Дожидаемся завершения всех задач пула
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+    click.echo(f'Поставлено в очередь превью: {scheduled}.')
@@ -0,0 +1,109 @@
+import json
+import logging
+import random
+import threading
+import time
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from . import db
+
+_local = threading.local()
+
+def current_profile():
+    """Профиль текущего запроса или None, если запрос не попал в выборку"""
+    return getattr(_local, 'profile', None)
+
+class RequestProfile:
+    __slots__ = ('started', 'sql_count', 'sql_time', 'serialize_time')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+
+class ProfilingJSONProvider(DefaultJSONProvider):
+    """JSON-провайдер, засекающий время сериализации ответов jsonify"""
+
+    def response(self, *args, **kwargs):
+        profile = current_profile()
+        if profile is None:
+            return super().response(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return super().response(*args, **kwargs)
+        finally:
+            profile.serialize_time += time.perf_counter() - started
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profile() is not None:
+        conn.info.setdefault('profiling_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile()
+    if profile is None:
+        return
+    started = conn.info.get('profiling_started')
+    if started:
+        profile.sql_time += time.perf_counter() - started.pop()
+    profile.sql_count += 1
+
+def _milliseconds(seconds):
+    return round(seconds * 1000, 3)
+
+def init_app(app):
+    """Подключить профилирование запросов, если PROFILING_ENABLED.
+
+    При выключенном профилировании никакие обработчики не регистрируются.
+    Для запросов из выборки (PROFILING_SAMPLE_RATE) считаются общее время,
+    число и время SQL-запросов (события курсора SQLAlchemy), время
+    сериализации JSON и размер ответа; результат пишется в заголовок
+    Server-Timing и строкой JSON в журнал <app>.profiling.
+    """
+    if not app.config.get('PROFILING_ENABLED'):
+        return
+    sample_rate = app.config.get('PROFILING_SAMPLE_RATE', 1.0)
+    server_timing = app.config.get('PROFILING_SERVER_TIMING', True)
+    logger = logging.getLogger(f'{app.name}.profiling')
+
+    app.json = ProfilingJSONProvider(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_profile():
+        _local.profile = RequestProfile() if random.random() < sample_rate else None
+
+    @app.after_request
+    def finish_profile(response):
+        profile = current_profile()
+        if profile is None:
+            return response
+        total = time.perf_counter() - profile.started
+        size = response.calculate_content_length()
+
+        if server_timing:
+            response.headers.add('Server-Timing', ', '.join((
+                f'app;dur={_milliseconds(total)}',
+                f'sql;dur={_milliseconds(profile.sql_time)};desc="{profile.sql_count} queries"',
+                f'serialize;dur={_milliseconds(profile.serialize_time)}',
+            )))
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': _milliseconds(total),
+            'sql_count': profile.sql_count,
+            'sql_ms': _milliseconds(profile.sql_time),
+            'serialize_ms': _milliseconds(profile.serialize_time),
+            'response_bytes': size  # None у потоковых ответов
+        }, ensure_ascii=False))
+        return response
+
+    @app.teardown_request
+    def clear_profile(exc):
+        _local.profile = None
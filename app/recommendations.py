@@ -0,0 +1,367 @@
+import heapq
+import math
+import time
+import click
+from flask import Blueprint, request, jsonify, current_app
+from flask.cli import with_appcontext
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert
+from .models import db, Course, Enrollment, Feedback, CourseCooccurrence, CourseRelated
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # NumPy/SciPy не установлены - полная перестройка недоступна
+    np = None
+    sparse = None
+
+recommendation_bp = Blueprint('recommendations', __name__)
+
+# Сколько строк вставлять за один executemany при перестройке
+_INSERT_BATCH = 50000
+
+# Остаток от вычитания весов с плавающей точкой, ниже которого ячейка считается пустой
+_EPSILON = 1e-9
+
+def _top_k():
+    return current_app.config.get('RECOMMENDATIONS_TOP_K', 20)
+
+def _use_ratings():
+    return current_app.config.get('RECOMMENDATIONS_USE_RATINGS', False)
+
+def entry_weight(rating, use_ratings=None):
+    """Вес записи пользователя на курс - тот же, что в _load_interactions"""
+    if use_ratings is None:
+        use_ratings = _use_ratings()
+    return rating / 3.0 if use_ratings and rating is not None else 1.0
+
+# ========== Полная перестройка ==========
+
+def _load_interactions(use_ratings):
+    """Пары (пользователь, курс, вес) из enrollments.
+
+    С use_ratings вес записи с отзывом равен rating / 3: курс, оцененный на 5,
+    связывает курсы сильнее, чем оцененный на 1. Записи без отзыва имеют вес 1.
+    """
+    if use_ratings:
+        sql = """
+            SELECT e.user_id, e.course_id, COALESCE(f.rating / 3.0, 1.0)
+            FROM enrollments e
+            LEFT JOIN feedbacks f ON f.user_id = e.user_id AND f.course_id = e.course_id
+        """
+    else:
+        sql = 'SELECT user_id, course_id, 1.0 FROM enrollments'
+    rows = db.session.execute(text(sql)).fetchall()
+    if not rows:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float64)
+    data = np.array(rows, dtype=np.float64)
+    return data[:, 0].astype(np.int64), data[:, 1].astype(np.int64), data[:, 2]
+
+def build_matrices(user_ids, course_ids, weights, top_k):
+    """Векторизованный расчет совместной встречаемости и top-k похожих курсов.
+
+    X - разреженная матрица пользователь × курс, C = X^T X - матрица совместных
+    записей, косинусная мера S = D^-1/2 C D^-1/2, где D - диагональ C.
+    Возвращает (курсы, C в формате COO, [(курс, похожий курс, score)]).
+    """
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    courses, course_index = np.unique(course_ids, return_inverse=True)
+
+    x = sparse.csr_matrix((weights, (user_index, course_index)), shape=(len(users), len(courses)))
+    cooccurrence = (x.T @ x).tocsr()
+
+    norms = np.sqrt(cooccurrence.diagonal())
+    inverse = sparse.diags(np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0))
+    similarity = (inverse @ cooccurrence @ inverse).tocsr()
+    similarity.setdiag(0)
+    similarity.eliminate_zeros()
+
+    related = []
+    for row in range(similarity.shape[0]):
+        start, end = similarity.indptr[row], similarity.indptr[row + 1]
+        columns = similarity.indices[start:end]
+        scores = similarity.data[start:end]
+        if len(scores) > top_k:
+            best = np.argpartition(scores, -top_k)[-top_k:]
+            columns, scores = columns[best], scores[best]
+        course_id = int(courses[row])
+        related.extend((course_id, int(courses[col]), float(score)) for col, score in zip(columns, scores))
+
+    return courses, cooccurrence.tocoo(), related
+
+def _bulk_insert(table, columns, rows):
+    placeholders = ', '.join(f':{column}' for column in columns)
+    stmt = text(f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({placeholders})')
+    for start in range(0, len(rows), _INSERT_BATCH):
+        batch = rows[start:start + _INSERT_BATCH]
+        db.session.execute(stmt, [dict(zip(columns, row)) for row in batch])
+
+def rebuild(use_ratings=None, top_k=None):
+    """Пересчитать матрицу совместных записей и таблицу похожих курсов целиком"""
+    if np is None:
+        raise RuntimeError('Для перестройки рекомендаций нужны numpy и scipy')
+    top_k = top_k or _top_k()
+    if use_ratings is None:
+        use_ratings = _use_ratings()
+
+    user_ids, course_ids, weights = _load_interactions(use_ratings)
+    if len(user_ids):
+        courses, cooccurrence, related = build_matrices(user_ids, course_ids, weights, top_k)
+        pairs = list(zip(
+            courses[cooccurrence.row].tolist(),
+            courses[cooccurrence.col].tolist(),
+            cooccurrence.data.tolist()
+        ))
+    else:
+        pairs, related = [], []
+
+    db.session.execute(text('DELETE FROM course_cooccurrence'))
+    db.session.execute(text('DELETE FROM course_related'))
+    _bulk_insert('course_cooccurrence', ('course_id', 'other_course_id', 'weight'), pairs)
+    _bulk_insert('course_related', ('course_id', 'related_course_id', 'score'), related)
+    db.session.commit()
+    return len(pairs), len(related)
+
+# ========== Инкрементальное обновление ==========
+
+def _add_weight(course_id, other_course_id, delta):
+    stmt = insert(CourseCooccurrence).values(
+        course_id=course_id, other_course_id=other_course_id, weight=delta
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CourseCooccurrence.course_id, CourseCooccurrence.other_course_id],
+        set_={'weight': CourseCooccurrence.weight + delta}
+    )
+    db.session.execute(stmt)
+
+def _row_scores(course_id):
+    """Косинусные меры курса со всеми курсами его строки матрицы совместных записей"""
+    rows = db.session.execute(text("""
+        SELECT p.other_course_id, p.weight, own.weight AS own_norm, other.weight AS other_norm
+        FROM course_cooccurrence p
+        JOIN course_cooccurrence own
+             ON own.course_id = p.course_id AND own.other_course_id = p.course_id
+        JOIN course_cooccurrence other
+             ON other.course_id = p.other_course_id AND other.other_course_id = p.other_course_id
+        WHERE p.course_id = :course_id AND p.other_course_id != p.course_id AND p.weight > 0
+    """), {'course_id': course_id}).fetchall()
+    return [(row.other_course_id, row.weight / math.sqrt(row.own_norm * row.other_norm))
+            for row in rows if row.own_norm > 0 and row.other_norm > 0]
+
+def refresh_related(course_id, top_k=None, scores=None):
+    """Пересчитать top-k похожих для одного курса по строке матрицы совместных записей"""
+    top_k = top_k or _top_k()
+    if scores is None:
+        scores = _row_scores(course_id)
+    best = heapq.nlargest(top_k, scores, key=lambda item: item[1])
+
+    CourseRelated.query.filter_by(course_id=course_id).delete(synchronize_session=False)
+    for related_course_id, score in best:
+        db.session.add(CourseRelated(course_id=course_id, related_course_id=related_course_id, score=score))
+
+def _pair_score(course_id, other_course_id):
+    """Косинусная мера одной пары курсов по матрице совместных записей"""
+    row = db.session.execute(text("""
+        SELECT p.weight, own.weight AS own_norm, other.weight AS other_norm
+        FROM course_cooccurrence p
+        JOIN course_cooccurrence own
+             ON own.course_id = p.course_id AND own.other_course_id = p.course_id
+        JOIN course_cooccurrence other
+             ON other.course_id = p.other_course_id AND other.other_course_id = p.other_course_id
+        WHERE p.course_id = :course_id AND p.other_course_id = :other_course_id
+    """), {'course_id': course_id, 'other_course_id': other_course_id}).first()
+    if row is None or row.weight <= 0 or row.own_norm <= 0 or row.other_norm <= 0:
+        return 0.0
+    return row.weight / math.sqrt(row.own_norm * row.other_norm)
+
+def refresh_pair(course_id, related_course_id, top_k=None, score=None):
+    """Обновить в top-k похожих курса course_id только пару с related_course_id.
+
+    Остальные оценки строки не изменились, поэтому список остается точным:
+    выросшая оценка обновляется на месте или вытесняет худшую, и только
+    уменьшение оценки пары из списка требует пересчета всей строки.
+    """
+    top_k = top_k or _top_k()
+    if score is None:
+        score = _pair_score(course_id, related_course_id)
+    current = db.session.get(CourseRelated, (course_id, related_course_id))
+    if current is not None:
+        if score < current.score:
+            refresh_related(course_id, top_k)
+        else:
+            current.score = score
+        return
+    if score <= 0:
+        return
+
+    entries = CourseRelated.query.filter_by(course_id=course_id).order_by(CourseRelated.score).all()
+    if len(entries) >= top_k:
+        if score <= entries[0].score:
+            return
+        db.session.delete(entries[0])
+    db.session.add(CourseRelated(course_id=course_id, related_course_id=related_course_id, score=score))
+
+def _rating(user_id, course_id):
+    return db.session.query(Feedback.rating).filter_by(user_id=user_id, course_id=course_id).scalar()
+
+def _change_weight(user_id, course_id, old_weight, new_weight):
+    """Изменить вес записи пользователя на курс с old_weight на new_weight.
+
+    Обновляются строка и столбец курса в матрице совместных записей, список
+    похожих самого курса и пары с ним в списках всех курсов его строки:
+    вместе с нормой курса меняются все его меры, а не только общие с
+    остальными курсами пользователя.
+    """
+    if old_weight == new_weight:
+        return
+    others = db.session.query(Enrollment.course_id, Feedback.rating).outerjoin(
+        Feedback, db.and_(Feedback.user_id == Enrollment.user_id, Feedback.course_id == Enrollment.course_id)
+    ).filter(
+        Enrollment.user_id == user_id, Enrollment.course_id != course_id
+    ).all()
+
+    # C = X^T X: диагональ - сумма квадратов весов, вне диагонали - сумма произведений
+    _add_weight(course_id, course_id, new_weight ** 2 - old_weight ** 2)
+    for other_course_id, rating in others:
+        delta = (new_weight - old_weight) * entry_weight(rating)
+        _add_weight(course_id, other_course_id, delta)
+        _add_weight(other_course_id, course_id, delta)
+
+    # Обнуленные ячейки удаляются только среди измененных (поиск по первичному ключу)
+    other_ids = [other_course_id for other_course_id, _ in others]
+    CourseCooccurrence.query.filter(
+        CourseCooccurrence.weight <= _EPSILON,
+        db.or_(
+            db.and_(CourseCooccurrence.course_id == course_id,
+                    CourseCooccurrence.other_course_id.in_([course_id] + other_ids)),
+            db.and_(CourseCooccurrence.course_id.in_(other_ids),
+                    CourseCooccurrence.other_course_id == course_id)
+        )
+    ).delete(synchronize_session=False)
+
+    # Мера симметрична: строка курса дает и новые оценки в чужих списках
+    scores = _row_scores(course_id)
+    refresh_related(course_id, scores=scores)
+    changed = dict.fromkeys(other_ids, 0.0)
+    changed.update(scores)
+    for other_course_id, score in changed.items():
+        refresh_pair(other_course_id, course_id, score=score)
+
+def record_enrollment(user_id, course_id, delta=1):
+    """Учесть запись (delta=1) или отмену записи (delta=-1) пользователя на курс.
+
+    Выполняется в текущей транзакции вместе с самой записью; коммит - у
+    вызывающего кода. Вес записи тот же, что при полной перестройке
+    (RECOMMENDATIONS_USE_RATINGS).
+    """
+    weight = entry_weight(_rating(user_id, course_id))
+    if delta > 0:
+        _change_weight(user_id, course_id, 0.0, weight)
+    else:
+        _change_weight(user_id, course_id, weight, 0.0)
+
+def record_rating(user_id, course_id, old_rating, new_rating):
+    """Учесть изменение оценки в отзыве, если вес записи зависит от оценки (в текущей транзакции)"""
+    if not _use_ratings():
+        return
+    if not Enrollment.query.filter_by(user_id=user_id, course_id=course_id).first():
+        return
+    _change_weight(user_id, course_id, entry_weight(old_rating), entry_weight(new_rating))
+
+def forget_course(course_id):
+    """Удалить курс из матрицы и списков похожих"""
+    CourseCooccurrence.query.filter(db.or_(
+        CourseCooccurrence.course_id == course_id, CourseCooccurrence.other_course_id == course_id
+    )).delete(synchronize_session=False)
+    CourseRelated.query.filter(db.or_(
+        CourseRelated.course_id == course_id, CourseRelated.related_course_id == course_id
+    )).delete(synchronize_session=False)
+    db.session.commit()
+
+# ========== Маршруты ==========
+
+# Курсы, на которые записываются вместе с данным
+@recommendation_bp.route('/courses/<int:course_id>/related', methods=['GET'])
+def get_related_courses(course_id):
+    Course.query.get_or_404(course_id)
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+
+    rows = db.session.query(
+        CourseRelated.related_course_id, Course.title, CourseRelated.score
+    ).join(
+        Course, Course.id == CourseRelated.related_course_id
+    ).filter(
+        CourseRelated.course_id == course_id
+    ).order_by(CourseRelated.score.desc()).limit(limit).all()
+
+    result = [{
+        'course_id': row.related_course_id,
+        'title': row.title,
+        'score': round(row.score, 4)
+    } for row in rows]
+
+    return jsonify(result)
+
+# Рекомендации для текущего пользователя
+@recommendation_bp.route('/recommendations', methods=['GET'])
+@jwt_required()
+def get_recommendations():
+    current_user = get_jwt_identity()
+    user_id = current_user['id']
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+
+    enrolled = db.session.query(Enrollment.course_id).filter(Enrollment.user_id == user_id)
+
+    # Сумма сходства кандидата со всеми курсами пользователя
+    score = db.func.sum(CourseRelated.score).label('score')
+    rows = db.session.query(
+        CourseRelated.related_course_id.label('course_id'), Course.title, score
+    ).join(
+        Course, Course.id == CourseRelated.related_course_id
+    ).filter(
+        CourseRelated.course_id.in_(enrolled),
+        CourseRelated.related_course_id.notin_(enrolled)
+    ).group_by(
+        CourseRelated.related_course_id, Course.title
+    ).order_by(score.desc()).limit(limit).all()
+
+    if rows:
+        return jsonify([{
+            'course_id': row.course_id,
+            'title': row.title,
+            'score': round(row.score, 4),
+            'source': 'related'
+        } for row in rows])
+
+    # Пользователь еще никуда не записан (или нет данных) - самые популярные курсы
+    enrollment_count = db.func.count(Enrollment.id).label('enrollment_count')
+    popular = db.session.query(
+        Course.id, Course.title, enrollment_count
+    ).outerjoin(
+        Enrollment, Enrollment.course_id == Course.id
+    ).filter(
+        Course.id.notin_(enrolled)
+    ).group_by(Course.id, Course.title).order_by(enrollment_count.desc(), Course.id).limit(limit).all()
+
+    return jsonify([{
+        'course_id': row.id,
+        'title': row.title,
+        'score': 0,
+        'source': 'popular'
+    } for row in popular])
+
+# Полная перестройка матрицы совместных записей
+@click.command('rebuild-recommendations')
+@click.option('--top-k', default=None, type=int, help='Сколько похожих курсов хранить (по умолчанию RECOMMENDATIONS_TOP_K).')
+@with_appcontext
+def rebuild_recommendations_command(top_k):
+    """Построение таблицы похожих курсов по всем записям на курсы.
+
+    Вес записи задает RECOMMENDATIONS_USE_RATINGS - тот же, что используют
+    инкрементальные обновления при записи, отмене записи и изменении отзыва.
+    """
+    started = time.perf_counter()
+    pairs, related = rebuild(top_k=top_k)
+    click.echo(f'Пар курсов: {pairs}, записей похожих курсов: {related} '
+               f'({time.perf_counter() - started:.1f} с).')
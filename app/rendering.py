@@ -0,0 +1,131 @@
+import hashlib
+import html
+import re
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import selectinload
+from .models import db, Module, RenderedContent
+from . import metrics
+
+try:
+    import markdown
+except ImportError:  # Markdown не установлен - текст выводится абзацами без разметки
+    markdown = None
+
+try:
+    import bleach
+except ImportError:  # bleach не установлен - Markdown не применяется, HTML экранируется
+    bleach = None
+
+# Меняется при изменении конвейера: записи со старой версией перестраиваются
+RENDERER_VERSION = '1'
+
+ALLOWED_TAGS = {
+    'p', 'br', 'hr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'strong', 'em', 'b', 'i', 'code', 'pre',
+    'blockquote', 'ul', 'ol', 'li', 'a', 'img', 'table', 'thead', 'tbody', 'tr', 'th', 'td',
+}
+ALLOWED_ATTRIBUTES = {
+    'a': ['href', 'title'],
+    'img': ['src', 'alt', 'title'],
+    'th': ['align'],
+    'td': ['align'],
+}
+ALLOWED_PROTOCOLS = {'http', 'https', 'mailto'}
+
+def _renderer():
+    return f"{RENDERER_VERSION}{'m' if markdown else ''}{'b' if bleach else ''}"
+
+def render_html(source):
+    """Markdown -> санитизированный HTML"""
+    source = source or ''
+    if markdown is None or bleach is None:
+        # Без Markdown или санитайзера текст выводится абзацами, весь HTML экранируется
+        paragraphs = re.split(r'\n\s*\n', source.strip())
+        return ''.join(
+            '<p>{}</p>'.format(html.escape(paragraph, quote=False).replace('\n', '<br>'))
+            for paragraph in paragraphs if paragraph
+        )
+
+    rendered = markdown.markdown(source, extensions=['fenced_code', 'tables'])
+    return bleach.clean(
+        rendered, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES,
+        protocols=ALLOWED_PROTOCOLS, strip=True
+    )
+
+def ensure_rendered(module):
+    """Построить HTML для текущей версии текста модуля, если его еще нет.
+
+    Результат общий для всех модулей с одинаковым текстом. Запись вставляется
+    UPSERT-ом, поэтому параллельные запросы с одним и тем же новым текстом не
+    конфликтуют по ключу. Возвращает запись RenderedContent; изменения не коммитятся.
+    """
+    if module.content_hash is None:
+        module.content_hash = hashlib.sha256((module.content or '').encode('utf-8')).hexdigest()
+
+    rendered = db.session.get(RenderedContent, module.content_hash)
+    renderer = _renderer()
+    if rendered is not None and rendered.renderer == renderer:
+        metrics.cache_hit('rendered_html', True)
+        return rendered
+    metrics.cache_hit('rendered_html', False)
+
+    values = {'renderer': renderer, 'html': render_html(module.content)}
+    stmt = insert(RenderedContent).values(content_hash=module.content_hash, **values)
+    stmt = stmt.on_conflict_do_update(index_elements=[RenderedContent.content_hash], set_=values)
+    db.session.execute(stmt)
+    return db.session.get(RenderedContent, module.content_hash, populate_existing=True)
+
+def ensure_content_hash_column():
+    """Добавить modules.content_hash, если колонки еще нет (повторный вызов ничего не меняет)"""
+    columns = {row[1] for row in db.session.execute(text('PRAGMA table_info(modules)'))}
+    if 'content_hash' not in columns:
+        db.session.execute(text('ALTER TABLE modules ADD COLUMN content_hash VARCHAR(64)'))
+        db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_modules_content_hash ON modules (content_hash)'))
+        db.session.commit()
+
+def release(content_hash):
+    """Удалить HTML версии текста, на которую больше не ссылается ни один модуль"""
+    if content_hash is None:
+        return
+    db.session.flush()
+    if not db.session.query(Module.query.filter(Module.content_hash == content_hash).exists()).scalar():
+        RenderedContent.query.filter_by(content_hash=content_hash).delete()
+
+# Построение HTML для всех модулей
+@click.command('prerender-modules')
+@click.option('--batch-size', default=200, show_default=True, help='Количество модулей в одной транзакции.')
+@click.option('--force', is_flag=True, help='Перестроить HTML, даже если он уже есть.')
+@with_appcontext
+def prerender_modules_command(batch_size, force):
+    """Предварительный рендеринг текстов модулей в HTML."""
+    ensure_content_hash_column()
+    db.create_all()  # Таблица rendered_contents
+
+    if force:
+        RenderedContent.query.delete()
+        db.session.commit()
+
+    last_id = 0
+    rendered = 0
+    while True:
+        modules = Module.query.options(selectinload(Module.body)).filter(
+            Module.id > last_id
+        ).order_by(Module.id).limit(batch_size).all()
+        if not modules:
+            break
+        for module in modules:
+            ensure_rendered(module)
+        db.session.commit()
+        last_id = modules[-1].id
+        rendered += len(modules)
+        click.echo(f'Обработано модулей: {rendered} (до id {last_id})')
+
+    # HTML версий текста, которых больше нет ни у одного модуля
+    deleted = db.session.execute(text("""
+        DELETE FROM rendered_contents
+        WHERE content_hash NOT IN (SELECT content_hash FROM modules WHERE content_hash IS NOT NULL)
+    """)).rowcount
+    db.session.commit()
+    click.echo(f'Готово. Удалено устаревших записей: {deleted}.')
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from . import db
+
+def parse_date(value, name):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'{name} must be a date in YYYY-MM-DD format')
+
+class ReportWindow:
+    """Период и курс отчета из параметров from, to (YYYY-MM-DD, включительно) и course_id.
+
+    Период превращается в полуинтервал [start, end) по колонке даты, чтобы
+    условие оставалось диапазонным и использовало индекс по этой колонке.
+    """
+
+    def __init__(self, start=None, end=None, course_id=None):
+        self.start = start
+        self.end = end
+        self.course_id = course_id
+
+    @classmethod
+    def from_args(cls, args, default_days=None):
+        """Разобрать параметры запроса. Неверная дата - ValueError.
+
+        default_days - число последних дней (включая сегодня), если не заданы ни from, ни to.
+        """
+        start = parse_date(args.get('from'), 'from')
+        end = parse_date(args.get('to'), 'to')
+        if start and end and start > end:
+            raise ValueError('from must not be later than to')
+        window = cls(
+            datetime.combine(start, datetime.min.time()) if start else None,
+            datetime.combine(end + timedelta(days=1), datetime.min.time()) if end else None,
+            args.get('course_id', type=int)
+        )
+        if default_days and not start and not end:
+            window.start = datetime.combine(datetime.utcnow().date() - timedelta(days=default_days - 1), datetime.min.time())
+        return window
+
+    @property
+    def bounded(self):
+        return self.start is not None or self.end is not None
+
+    def conditions(self, date_column, course_column=None):
+        """Условия на колонку даты и колонку курса (любая может быть None) для filter() или join"""
+        conditions = []
+        if date_column is not None and self.start is not None:
+            conditions.append(date_column >= self.start)
+        if date_column is not None and self.end is not None:
+            conditions.append(date_column < self.end)
+        if course_column is not None and self.course_id is not None:
+            conditions.append(course_column == self.course_id)
+        return conditions
+
+    def sql(self, date_column, params, course_column=None):
+        """То же для текстового SQL: фрагмент ' AND ...' и параметры :window_*"""
+        fragment = ''
+        if self.start is not None:
+            fragment += f' AND {date_column} >= :window_start'
+            params['window_start'] = self.start.isoformat(' ')
+        if self.end is not None:
+            fragment += f' AND {date_column} < :window_end'
+            params['window_end'] = self.end.isoformat(' ')
+        if course_column is not None and self.course_id is not None:
+            fragment += f' AND {course_column} = :window_course_id'
+            params['window_course_id'] = self.course_id
+        return fragment
+
+# Создание индексов, объявленных в моделях, в уже существующей базе
+@click.command('create-missing-indexes')
+@with_appcontext
+def create_missing_indexes_command():
+    """Создание индексов моделей, которых еще нет в базе (db.create_all не меняет существующие таблицы)."""
+    db.create_all()
+    created = 0
+    existing = {name for (name,) in db.session.execute(db.text(
+        "SELECT name FROM sqlite_master WHERE type = 'index'"
+    ))}
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                click.echo(f'Создан индекс {index.name}')
+                created += 1
+    click.echo(f'Готово. Создано индексов: {created}.')
@@ -0,0 +1,150 @@
+import threading
+import time
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from .models import db, RevokedToken
+from . import jwt
+
+def _token_lifetime():
+    expires = current_app.config.get('JWT_ACCESS_TOKEN_EXPIRES', 86400)
+    return expires if isinstance(expires, timedelta) else timedelta(seconds=expires)
+
+def _epoch(value):
+    return (value - datetime(1970, 1, 1)).total_seconds()
+
+class Blocklist:
+    """Копия таблицы revoked_tokens в памяти процесса.
+
+    Проверка токена - поиск в словаре. Новые записи подтягиваются из БД
+    инкрементально (по id больше последнего прочитанного) не чаще, чем раз в
+    REVOCATION_SYNC_INTERVAL секунд, поэтому отзыв, сделанный в другом
+    процессе, начинает действовать с задержкой не больше этого интервала.
+    Отметку последнего id двигает только sync: собственный отзыв процесса
+    применяется сразу, но не скрывает от sync строки других процессов с
+    меньшими id.
+    """
+
+    def __init__(self):
+        self._jtis = {}          # jti -> время истечения токена (epoch)
+        self._user_cutoffs = {}  # user_id -> (отозваны токены с iat раньше, время истечения)
+        self._high_water = 0
+        self._next_sync = 0.0
+        self._next_prune = 0.0
+        self._lock = threading.Lock()
+
+    def _add(self, row):
+        expires = _epoch(row.expires_at)
+        if row.jti:
+            self._jtis[row.jti] = expires
+        elif row.user_id is not None and row.revoked_before is not None:
+            cutoff = _epoch(row.revoked_before)
+            current = self._user_cutoffs.get(row.user_id)
+            if current is None or current[0] < cutoff:
+                self._user_cutoffs[row.user_id] = (cutoff, expires)
+
+    def _prune(self, now):
+        self._jtis = {jti: exp for jti, exp in self._jtis.items() if exp > now}
+        self._user_cutoffs = {uid: v for uid, v in self._user_cutoffs.items() if v[1] > now}
+
+    def sync(self, force=False):
+        now = time.monotonic()
+        if not force and now < self._next_sync:
+            return
+        with self._lock:
+            if not force and now < self._next_sync:
+                return
+            rows = RevokedToken.query.filter(
+                RevokedToken.id > self._high_water
+            ).order_by(RevokedToken.id).all()
+            for row in rows:
+                self._add(row)
+                self._high_water = row.id
+            self._next_sync = now + current_app.config.get('REVOCATION_SYNC_INTERVAL', 5)
+
+            if now >= self._next_prune:
+                self._prune(time.time())
+                self._next_prune = now + 300
+
+    def is_revoked(self, payload):
+        self.sync()
+        if payload.get('jti') in self._jtis:
+            return True
+        identity = payload.get(current_app.config.get('JWT_IDENTITY_CLAIM', 'sub'))
+        user_id = identity.get('id') if isinstance(identity, dict) else None
+        cutoff = self._user_cutoffs.get(user_id)
+        return cutoff is not None and payload.get('iat', 0) < cutoff[0]
+
+    def revoke_token(self, jti, user_id=None, expires_at=None):
+        """Отозвать один токен по jti"""
+        row = RevokedToken(
+            jti=jti,
+            user_id=user_id,
+            expires_at=expires_at or datetime.utcnow() + _token_lifetime()
+        )
+        db.session.add(row)
+        db.session.commit()
+        with self._lock:
+            self._add(row)
+        return row
+
+    def revoke_user(self, user_id):
+        """Отозвать все выпущенные на данный момент токены пользователя.
+
+        iat в токене - целые секунды, поэтому граница тоже округляется вниз до
+        секунды: токен, выданный сразу после отзыва в ту же секунду, остается
+        действительным (как и выданный в эту секунду чуть раньше отзыва).
+        """
+        now = datetime.utcnow().replace(microsecond=0)
+        row = RevokedToken(
+            user_id=user_id,
+            revoked_before=now,
+            expires_at=now + _token_lifetime()
+        )
+        db.session.add(row)
+        db.session.commit()
+        with self._lock:
+            self._add(row)
+        return row
+
+blocklist = Blocklist()
+
+def init_app(app):
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return blocklist.is_revoked(jwt_payload)
+
+def _ensure_autoincrement():
+    """Пересоздать revoked_tokens с AUTOINCREMENT, если таблица создана без него"""
+    sql = db.session.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'revoked_tokens'"
+    )).scalar()
+    if sql is None or 'AUTOINCREMENT' in sql.upper():
+        return
+    db.session.execute(text('ALTER TABLE revoked_tokens RENAME TO revoked_tokens_old'))
+    db.session.execute(text('DROP INDEX IF EXISTS ix_revoked_tokens_expires_at'))
+    RevokedToken.__table__.create(db.session.connection())
+    db.session.execute(text("""
+        INSERT INTO revoked_tokens (id, jti, user_id, revoked_before, expires_at, created_at)
+        SELECT id, jti, user_id, revoked_before, expires_at, created_at FROM revoked_tokens_old
+    """))
+    db.session.execute(text('DROP TABLE revoked_tokens_old'))
+    db.session.commit()
+
+# Удаление записей об отзыве, срок действия которых истек
+@click.command('prune-revoked-tokens')
+@with_appcontext
+def prune_revoked_tokens_command():
+    """Удаление истекших записей из таблицы revoked_tokens.
+
+    Таблица, созданная до перехода на AUTOINCREMENT, предварительно
+    пересоздается, чтобы id удаленных строк не выдавались повторно.
+    """
+    _ensure_autoincrement()
+    deleted = RevokedToken.query.filter(
+        RevokedToken.expires_at < datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f'Удалено записей: {deleted}.')
@@ -0,0 +1,113 @@
+from datetime import timedelta
+import click
+from flask import Blueprint, request, jsonify
+from flask.cli import with_appcontext
+from flask_jwt_extended import jwt_required
+from sqlalchemy import text
+from .models import db, ActivityRollup
+from .reports import parse_date
+
+rollup_bp = Blueprint('rollups', __name__)
+
+# Источник событий: таблица, колонка времени, выражение course_id и нужный join
+EVENT_SOURCES = {
+    'enrollment': ('enrollments', 't.enrollment_date', 't.course_id', ''),
+    'assessment': ('assessments', 't.assessment_date', 'm.course_id', 'JOIN modules m ON m.id = t.module_id'),
+    'feedback': ('feedbacks', 't.created_at', 't.course_id', ''),
+    'upload': ('attachments', 't.uploaded_at', 'm.course_id', 'JOIN modules m ON m.id = t.module_id'),
+}
+
+# Начало дня и понедельник недели в SQLite
+BUCKET_SQL = {
+    'day': 'date({column})',
+    'week': "date({column}, 'weekday 0', '-6 days')",
+}
+
+def _series_buckets(granularity, start, end):
+    step = timedelta(days=1 if granularity == 'day' else 7)
+    if granularity == 'week':
+        start -= timedelta(days=start.weekday())
+    bucket = start
+    while bucket <= end:
+        yield bucket
+        bucket += step
+
+# Временной ряд событий по дням или неделям
+@rollup_bp.route('/statistics/timeseries', methods=['GET'])
+@jwt_required()
+def get_timeseries():
+    metric = request.args.get('metric')
+    if metric not in ActivityRollup.EVENT_TYPES:
+        return jsonify({'message': f'metric must be one of: {", ".join(ActivityRollup.EVENT_TYPES)}'}), 400
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in ActivityRollup.GRANULARITIES:
+        return jsonify({'message': 'granularity must be one of: day, week'}), 400
+    try:
+        start = parse_date(request.args.get('from'), 'from')
+        end = parse_date(request.args.get('to'), 'to')
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    course_id = request.args.get('course_id', type=int)
+
+    total = db.func.sum(ActivityRollup.count).label('count')
+    query = db.session.query(ActivityRollup.bucket, total).filter(
+        ActivityRollup.event_type == metric,
+        ActivityRollup.granularity == granularity
+    )
+    if start:
+        # Неделя, в которую попадает начало периода, тоже входит в ряд
+        first = start - timedelta(days=start.weekday()) if granularity == 'week' else start
+        query = query.filter(ActivityRollup.bucket >= first)
+    if end:
+        query = query.filter(ActivityRollup.bucket <= end)
+    if course_id is not None:
+        query = query.filter(ActivityRollup.course_id == course_id)
+    counts = dict(query.group_by(ActivityRollup.bucket).all())
+
+    # Пустые интервалы заполняются нулями, чтобы ряд можно было сразу рисовать
+    if counts or (start and end):
+        series_start = start or min(counts)
+        series_end = end or max(counts)
+        points = [{'bucket': bucket.isoformat(), 'count': counts.get(bucket, 0)}
+                  for bucket in _series_buckets(granularity, series_start, series_end)]
+    else:
+        points = []
+
+    return jsonify({
+        'metric': metric,
+        'granularity': granularity,
+        'course_id': course_id,
+        'points': points
+    })
+
+# Заполнение таблицы activity_rollups по существующим данным
+@click.command('backfill-activity-rollups')
+@click.option('--batch-size', default=50000, show_default=True, help='Количество строк источника в одной транзакции.')
+@with_appcontext
+def backfill_activity_rollups_command(batch_size):
+    """Пересчет дневных и недельных счетчиков событий по исходным таблицам."""
+    db.create_all()
+    db.session.execute(text('DELETE FROM activity_rollups'))
+    db.session.commit()
+
+    for event_type, (table, column, course, join) in EVENT_SOURCES.items():
+        max_id = db.session.execute(text(f'SELECT COALESCE(MAX(id), 0) FROM {table}')).scalar()
+        last_id = 0
+        while last_id < max_id:
+            upper = min(last_id + batch_size, max_id)
+            for granularity, bucket_sql in BUCKET_SQL.items():
+                bucket = bucket_sql.format(column=column)
+                db.session.execute(text(f"""
+                    INSERT INTO activity_rollups (granularity, bucket, course_id, event_type, count)
+                    SELECT :granularity, {bucket}, {course}, :event_type, COUNT(*)
+                    FROM {table} t {join}
+                    WHERE t.id > :low AND t.id <= :high AND {column} IS NOT NULL
+                    GROUP BY {bucket}, {course}
+                    ON CONFLICT (granularity, bucket, course_id, event_type)
+                    DO UPDATE SET count = count + excluded.count
+                """), {'granularity': granularity, 'event_type': event_type, 'low': last_id, 'high': upper})
+            db.session.commit()
+            last_id = upper
+            click.echo(f'{table}: обработано до id {last_id}')
+
+    click.echo('Счетчики активности пересчитаны.')
@@ -0,0 +1,244 @@
+import html
+import re
+from datetime import datetime
+import click
+from flask import Blueprint, request, jsonify
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from sqlalchemy.orm import selectinload
+from .models import db, Module
+
+search_bp = Blueprint('search', __name__)
+
+# unicode61 приводит к нижнему регистру и кириллицу, и латиницу; porter добавляет
+# стемминг для английского. Русская морфология покрывается префиксными запросами,
+# для которых строится префиксный индекс.
+FTS_OPTIONS = "tokenize = 'porter unicode61 remove_diacritics 2', prefix = '3'"
+
+SEARCH_INDEX_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS courses_fts USING fts5(
+        title, description, content = 'courses', content_rowid = 'id', {FTS_OPTIONS}
+    )""",
+    # Текст модулей хранится сжатым в module_contents и недоступен триггерам,
+    # поэтому modules_fts хранит свою копию и обновляется из приложения (index_module)
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS modules_fts USING fts5(
+        title, content, {FTS_OPTIONS}
+    )""",
+
+    "DROP TRIGGER IF EXISTS courses_fts_insert",
+    "DROP TRIGGER IF EXISTS courses_fts_delete",
+    "DROP TRIGGER IF EXISTS courses_fts_update",
+    "DROP TRIGGER IF EXISTS modules_fts_insert",
+    "DROP TRIGGER IF EXISTS modules_fts_delete",
+    "DROP TRIGGER IF EXISTS modules_fts_update",
+
+    """CREATE TRIGGER courses_fts_insert AFTER INSERT ON courses BEGIN
+        INSERT INTO courses_fts(rowid, title, description) VALUES (NEW.id, NEW.title, NEW.description);
+    END""",
+    """CREATE TRIGGER courses_fts_delete AFTER DELETE ON courses BEGIN
+        INSERT INTO courses_fts(courses_fts, rowid, title, description) VALUES ('delete', OLD.id, OLD.title, OLD.description);
+    END""",
+    """CREATE TRIGGER courses_fts_update AFTER UPDATE OF title, description ON courses BEGIN
+        INSERT INTO courses_fts(courses_fts, rowid, title, description) VALUES ('delete', OLD.id, OLD.title, OLD.description);
+        INSERT INTO courses_fts(rowid, title, description) VALUES (NEW.id, NEW.title, NEW.description);
+    END""",
+]
+
+# Маркеры подсветки внутри snippet(): текст экранируется уже после FTS5
+_MARK_OPEN, _MARK_CLOSE = '\x02', '\x03'
+
+SEARCH_SQL = {
+    'course': f"""
+        SELECT 'course' AS kind, c.id AS id, c.id AS course_id, c.title AS title,
+               snippet(courses_fts, -1, '{_MARK_OPEN}', '{_MARK_CLOSE}', '…', 16) AS snippet,
+               bm25(courses_fts, 10.0, 1.0) AS rank
+        FROM courses_fts JOIN courses c ON c.id = courses_fts.rowid
+        WHERE courses_fts MATCH :query
+    """,
+    'module': f"""
+        SELECT 'module' AS kind, m.id AS id, m.course_id AS course_id, m.title AS title,
+               snippet(modules_fts, -1, '{_MARK_OPEN}', '{_MARK_CLOSE}', '…', 16) AS snippet,
+               bm25(modules_fts, 10.0, 1.0) AS rank
+        FROM modules_fts JOIN modules m ON m.id = modules_fts.rowid
+        WHERE modules_fts MATCH :query
+    """,
+}
+
+def create_search_index():
+    """Создать FTS5-индексы и триггеры, поддерживающие их в актуальном состоянии"""
+    for statement in SEARCH_INDEX_DDL:
+        db.session.execute(text(statement))
+    db.session.commit()
+
+def index_module(module):
+    """Обновить модуль в modules_fts в текущей транзакции (после flush, когда известен id)"""
+    unindex_module(module.id)
+    db.session.execute(text(
+        'INSERT INTO modules_fts(rowid, title, content) VALUES (:id, :title, :content)'
+    ), {'id': module.id, 'title': module.title, 'content': module.content})
+
+def unindex_module(module_id):
+    db.session.execute(text('DELETE FROM modules_fts WHERE rowid = :id'), {'id': module_id})
+
+def _index_modules(table, modules):
+    db.session.execute(text(
+        f'INSERT OR REPLACE INTO {table}(rowid, title, content) VALUES (:id, :title, :content)'
+    ), [{'id': module.id, 'title': module.title, 'content': module.content} for module in modules])
+
+def reindex_modules(batch_size=1000, start_id=0):
+    """Построить modules_fts заново, не прерывая поиск.
+
+    Индекс заполняется порциями в отдельной таблице modules_fts_build, а затем
+    одной транзакцией подменяет modules_fts (заодно заменяя прежнюю таблицу с
+    content = 'modules'). Перед подменой досинхронизируются модули, измененные
+    или удаленные после начала построения (по modules.updated_at). С start_id > 0
+    продолжается прерванное построение той же таблицы.
+    """
+    db.session.execute(text(
+        'CREATE TABLE IF NOT EXISTS search_rebuilds (name VARCHAR(64) PRIMARY KEY, started_at DATETIME NOT NULL)'
+    ))
+    if start_id == 0:
+        db.session.execute(text('DROP TABLE IF EXISTS modules_fts_build'))
+        db.session.execute(text("DELETE FROM search_rebuilds WHERE name = 'modules_fts'"))
+    db.session.execute(text(f'CREATE VIRTUAL TABLE IF NOT EXISTS modules_fts_build USING fts5(title, content, {FTS_OPTIONS})'))
+    db.session.execute(text(
+        "INSERT OR IGNORE INTO search_rebuilds (name, started_at) VALUES ('modules_fts', :now)"
+    ), {'now': datetime.utcnow()})
+    db.session.commit()
+
+    last_id = start_id
+    while True:
+        modules = Module.query.options(selectinload(Module.body)).filter(
+            Module.id > last_id
+        ).order_by(Module.id).limit(batch_size).all()
+        if not modules:
+            break
+        _index_modules('modules_fts_build', modules)
+        db.session.commit()
+        last_id = modules[-1].id
+        click.echo(f'modules: проиндексировано до id {last_id}')
+
+    # DELETE берет блокировку записи: до коммита модули не меняются
+    db.session.execute(text('DELETE FROM modules_fts_build WHERE rowid NOT IN (SELECT id FROM modules)'))
+    started_at = datetime.fromisoformat(db.session.execute(text(
+        "SELECT started_at FROM search_rebuilds WHERE name = 'modules_fts'"
+    )).scalar())
+    changed = Module.query.options(selectinload(Module.body)).filter(Module.updated_at >= started_at).all()
+    if changed:
+        _index_modules('modules_fts_build', changed)
+    db.session.execute(text('DROP TABLE IF EXISTS modules_fts'))
+    db.session.execute(text('ALTER TABLE modules_fts_build RENAME TO modules_fts'))
+    db.session.execute(text("DELETE FROM search_rebuilds WHERE name = 'modules_fts'"))
+    db.session.commit()
+
+# Окончания, отбрасываемые у русских слов перед префиксным поиском (от длинных к коротким)
+_RU_ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ией', 'ий', 'ый', 'ой',
+    'ая', 'яя', 'ое', 'ее', 'ие', 'ые', 'ов', 'ев', 'ей', 'ам', 'ям', 'ах', 'ях', 'ом', 'ем',
+    'ию', 'ия', 'ью', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь',
+), key=len, reverse=True)
+
+def _stem(term):
+    """Грубое отсечение окончания у кириллических слов"""
+    if len(term) <= 4 or not re.match(r'[а-яё]', term):
+        return term
+    for ending in _RU_ENDINGS:
+        if term.endswith(ending) and len(term) - len(ending) >= 4:
+            return term[:-len(ending)]
+    return term
+
+def build_match_query(raw_query):
+    """Преобразовать ввод пользователя в безопасный запрос FTS5.
+
+    Каждое слово берется в кавычки (операторы FTS5 не интерпретируются)
+    и ищется по префиксу; у русских слов предварительно отсекается окончание,
+    поэтому «индексов» находит и «индексы», и «индексами».
+    """
+    terms = re.findall(r'\w+', raw_query.lower())
+    return ' AND '.join(f'"{_stem(term)}"*' for term in terms[:16])
+
+def _highlight(snippet):
+    escaped = html.escape(snippet or '')
+    return escaped.replace(_MARK_OPEN, '<mark>').replace(_MARK_CLOSE, '</mark>')
+
+# Полнотекстовый поиск по курсам и модулям
+@search_bp.route('/search', methods=['GET'])
+def search():
+    match_query = build_match_query(request.args.get('q', ''))
+    if not match_query:
+        return jsonify({'message': 'Missing required parameter: q'}), 400
+
+    kind = request.args.get('type')
+    if kind and kind not in SEARCH_SQL:
+        return jsonify({'message': 'type must be one of: course, module'}), 400
+
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+
+    parts = [SEARCH_SQL[kind]] if kind else list(SEARCH_SQL.values())
+    stmt = text(' UNION ALL '.join(parts) + ' ORDER BY rank LIMIT :limit OFFSET :offset')
+
+    # Запрашиваем на одну запись больше, чтобы узнать о следующей странице без COUNT(*)
+    rows = db.session.execute(stmt, {
+        'query': match_query,
+        'limit': per_page + 1,
+        'offset': (page - 1) * per_page
+    }).fetchall()
+
+    result = [{
+        'type': row.kind,
+        'id': row.id,
+        'course_id': row.course_id,
+        'title': row.title,
+        'snippet': _highlight(row.snippet),
+        'score': -row.rank
+    } for row in rows[:per_page]]
+
+    return jsonify({
+        'items': result,
+        'page': page,
+        'per_page': per_page,
+        'has_more': len(rows) > per_page
+    })
+
+# Индексация существующих данных порциями
+@click.command('rebuild-search-index')
+@click.option('--batch-size', default=1000, show_default=True, help='Количество строк в одной транзакции.')
+@click.option('--course-start-id', default=0, show_default=True, help='Продолжить курсы с id больше указанного.')
+@click.option('--module-start-id', default=0, show_default=True, help='Продолжить модули с id больше указанного.')
+@with_appcontext
+def rebuild_search_index_command(batch_size, course_start_id, module_start_id):
+    """Построение полнотекстового индекса по существующим курсам и модулям.
+
+    id курсов и модулей независимы, поэтому точка продолжения задается для
+    каждой таблицы отдельно (выводятся строки "courses: ... до id N" и
+    "modules: ... до id N"). Чтобы продолжить только модули, передайте
+    --course-start-id, равный последнему id курсов. Модули индексируются в
+    отдельную таблицу, поэтому поиск по ним работает все время перестроения.
+    """
+    create_search_index()
+
+    # Курсы, добавленные после начала перестроения, индексируют триггеры
+    max_id = db.session.execute(text('SELECT COALESCE(MAX(id), 0) FROM courses')).scalar()
+
+    if course_start_id == 0:
+        db.session.execute(text("INSERT INTO courses_fts(courses_fts) VALUES ('delete-all')"))
+        db.session.commit()
+
+    last_id = course_start_id
+    while last_id < max_id:
+        upper = min(last_id + batch_size, max_id)
+        db.session.execute(text("""
+            INSERT INTO courses_fts(rowid, title, description)
+            SELECT id, title, description FROM courses WHERE id > :low AND id <= :high
+        """), {'low': last_id, 'high': upper})
+        db.session.commit()
+        last_id = upper
+        click.echo(f'courses: проиндексировано до id {last_id}')
+
+    reindex_modules(batch_size, module_start_id)
+
+    db.session.execute(text("INSERT INTO courses_fts(courses_fts) VALUES ('optimize')"))
+    db.session.execute(text("INSERT INTO modules_fts(modules_fts) VALUES ('optimize')"))
+    db.session.commit()
+    click.echo('Полнотекстовый индекс построен.')
@@ -0,0 +1,123 @@
+from datetime import date, timedelta
+import click
+from flask import Blueprint, request, jsonify
+from flask.cli import with_appcontext
+from flask_jwt_extended import jwt_required
+from sqlalchemy import text
+from .models import db, ActivitySketch
+from .hll import HyperLogLog, RELATIVE_ERROR
+from .reports import ReportWindow
+
+sketch_bp = Blueprint('sketches', __name__)
+
+def estimate_active_students(course_id, first_day, last_day):
+    """Приближенное число уникальных студентов за дни [first_day, last_day] - объединение дневных скетчей"""
+    query = ActivitySketch.query.filter(
+        ActivitySketch.course_id == (ActivitySketch.ALL_COURSES if course_id is None else course_id)
+    )
+    if first_day is not None:
+        query = query.filter(ActivitySketch.day >= first_day)
+    if last_day is not None:
+        query = query.filter(ActivitySketch.day <= last_day)
+
+    merged = HyperLogLog()
+    days = 0
+    for sketch in query.yield_per(500):
+        merged.merge(HyperLogLog.from_bytes(sketch.registers))
+        days += 1
+    return merged.count(), days
+
+def count_active_students(window):
+    """Точное число уникальных студентов: регистрации и последние оценки за период"""
+    params = {}
+    enrollment_window = window.sql('enrollment_date', params, 'course_id')
+    assessment_window = window.sql('a.assessment_date', params, 'm.course_id')
+    return db.session.execute(text(f"""
+        SELECT COUNT(*) FROM (
+            SELECT user_id FROM enrollments WHERE 1 = 1{enrollment_window}
+            UNION
+            SELECT a.user_id FROM assessments a JOIN modules m ON m.id = a.module_id
+            WHERE 1 = 1{assessment_window}
+        )
+    """), params).scalar()
+
+# Число уникальных активных студентов за период
+@sketch_bp.route('/statistics/active-students', methods=['GET'])
+@jwt_required()
+def get_active_students():
+    try:
+        window = ReportWindow.from_args(request.args, default_days=7)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    first_day = window.start.date() if window.start else None
+    last_day = (window.end - timedelta(days=1)).date() if window.end else None
+
+    result = {
+        'course_id': window.course_id,
+        'from': first_day.isoformat() if first_day else None,
+        'to': last_day.isoformat() if last_day else None,
+    }
+    if request.args.get('exact') in ('1', 'true'):
+        # Точный подсчет читает всю историю периода; у assessments учитывается
+        # только дата последнего изменения оценки
+        result.update({'unique_students': count_active_students(window), 'approximate': False})
+    else:
+        estimate, days = estimate_active_students(window.course_id, first_day, last_day)
+        result.update({
+            'unique_students': estimate,
+            'approximate': True,
+            'relative_error': round(RELATIVE_ERROR, 4),  # ~95% оценок отклоняются не более чем на 2 * relative_error
+            'sketch_days': days
+        })
+    return jsonify(result)
+
+# Пересчет скетчей по регистрациям и оценкам
+@click.command('rebuild-activity-sketches')
+@with_appcontext
+def rebuild_activity_sketches_command():
+    """Пересчет HyperLogLog-скетчей активности по истории enrollments и assessments.
+
+    Строки читаются одним проходом в порядке дня; скетчи дня записываются,
+    как только день закончился, поэтому в памяти только скетчи одного дня.
+    Пересчет идет одной транзакцией: до ее завершения читаются старые скетчи.
+    У assessments хранится только последняя дата оценки, поэтому более
+    ранняя активность по оценкам при пересчете не восстанавливается.
+    """
+    db.create_all()
+    ActivitySketch.query.delete()
+
+    result = db.session.execute(text("""
+        SELECT date(enrollment_date) AS day, course_id, user_id FROM enrollments
+        WHERE enrollment_date IS NOT NULL
+        UNION ALL
+        SELECT date(a.assessment_date), m.course_id, a.user_id
+        FROM assessments a JOIN modules m ON m.id = a.module_id
+        WHERE a.assessment_date IS NOT NULL
+        ORDER BY day
+    """))
+
+    def flush(day, sketches):
+        db.session.bulk_insert_mappings(ActivitySketch, [
+            {'course_id': course_id, 'day': date.fromisoformat(day), 'registers': hll.to_bytes()}
+            for course_id, hll in sketches.items()
+        ])
+
+    current_day, sketches, days = None, {}, 0
+    while True:
+        rows = result.fetchmany(10000)
+        if not rows:
+            break
+        for day, course_id, user_id in rows:
+            if day != current_day:
+                if sketches:
+                    flush(current_day, sketches)
+                    days += 1
+                current_day, sketches = day, {}
+            for scope in (course_id, ActivitySketch.ALL_COURSES):
+                sketches.setdefault(scope, HyperLogLog()).add(user_id)
+    if sketches:
+        flush(current_day, sketches)
+        days += 1
+    db.session.commit()
+
+    click.echo(f'Скетчи активности пересчитаны: {days} дней.')
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from flask import Blueprint, current_app, has_request_context, request, jsonify
+from sqlalchemy import event
+from . import db
+from .authz import require_role
+
+slowlog_bp = Blueprint('slowlog', __name__)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+# План есть только у запросов к данным; DDL и PRAGMA не объясняются
+_EXPLAINABLE_RE = re.compile(r'^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+_logger = logging.getLogger('slow_queries')
+
+def normalize(statement):
+    """SQL без литералов и лишних пробелов: запросы, отличающиеся только значениями, совпадают"""
+    normalized = _STRING_RE.sub('?', statement)
+    normalized = _NUMBER_RE.sub('?', normalized)
+    normalized = _SPACE_RE.sub(' ', normalized).strip()
+    # Списки IN (?, ?, ?) разной длины - один и тот же запрос
+    return _LIST_RE.sub('(?...)', normalized)
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+def parameter_shape(parameters, executemany):
+    """Типы параметров без значений (значения могут содержать персональные данные)"""
+    if executemany:
+        rows = list(parameters or [])
+        return {'rows': len(rows), 'row': parameter_shape(rows[0], False) if rows else None}
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+def _explain(cursor, statement, parameters):
+    # Через DB-API напрямую, чтобы EXPLAIN не проходил через события движка
+    try:
+        rows = cursor.connection.execute(f'EXPLAIN QUERY PLAN {statement}', parameters or ()).fetchall()
+    except Exception as e:
+        return [f'EXPLAIN failed: {e}']
+    return [row[-1] for row in rows]
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('slowlog_started', []).append(time.perf_counter())
+
+def _make_after_cursor_execute(threshold, explain):
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('slowlog_started')
+        if not started:
+            return
+        duration = time.perf_counter() - started.pop()
+        if duration < threshold:
+            return
+
+        normalized = normalize(statement)
+        _logger.info(json.dumps({
+            'time': datetime.utcnow().isoformat(),
+            'fingerprint': fingerprint(normalized),
+            'statement': normalized,
+            'parameters': parameter_shape(parameters, executemany),
+            'duration_ms': round(duration * 1000, 3),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'pid': os.getpid(),
+            'plan': _explain(cursor, statement, parameters)
+                    if explain and not executemany and _EXPLAINABLE_RE.match(statement) else None,
+        }, ensure_ascii=False))
+    return after_cursor_execute
+
+def _handle_error(context):
+    started = context.connection.info.get('slowlog_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+def init_app(app):
+    """Подключить журнал медленных запросов, если задан SLOW_QUERY_THRESHOLD_MS.
+
+    Запросы дольше порога пишутся строками JSON в SLOW_QUERY_LOG с ротацией
+    по размеру: нормализованный текст и его отпечаток, типы параметров,
+    длительность, эндпоинт и план EXPLAIN QUERY PLAN.
+    """
+    threshold_ms = app.config.get('SLOW_QUERY_THRESHOLD_MS')
+    if threshold_ms is None:
+        return
+
+    path = os.path.join(app.instance_path, app.config.get('SLOW_QUERY_LOG', 'slow_queries.log'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not any(getattr(handler, 'baseFilename', None) == os.path.abspath(path) for handler in _logger.handlers):
+        handler = RotatingFileHandler(
+            path,
+            maxBytes=app.config.get('SLOW_QUERY_LOG_MAX_BYTES', 10 * 1024 * 1024),
+            backupCount=app.config.get('SLOW_QUERY_LOG_BACKUPS', 5),
+            encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _logger.addHandler(handler)
+    _logger.setLevel(logging.INFO)
+    _logger.propagate = False
+
+    after_cursor_execute = _make_after_cursor_execute(threshold_ms / 1000.0, app.config.get('SLOW_QUERY_EXPLAIN', True))
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+            event.listen(engine, 'handle_error', _handle_error)
+
+def _log_files():
+    path = os.path.join(current_app.instance_path, current_app.config.get('SLOW_QUERY_LOG', 'slow_queries.log'))
+    backups = current_app.config.get('SLOW_QUERY_LOG_BACKUPS', 5)
+    return [name for name in [path] + [f'{path}.{i}' for i in range(1, backups + 1)] if os.path.exists(name)]
+
+# Самые затратные запросы по суммарному времени (по журналу медленных запросов всех процессов)
+@slowlog_bp.route('/slow-queries', methods=['GET'])
+@require_role('admin', message='Нет прав на просмотр медленных запросов')
+def get_slow_queries():
+    if current_app.config.get('SLOW_QUERY_THRESHOLD_MS') is None:
+        return jsonify({'message': 'Журнал медленных запросов выключен (SLOW_QUERY_THRESHOLD_MS)'}), 404
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 200)
+
+    groups = {}
+    for path in _log_files():
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                group = groups.get(entry['fingerprint'])
+                if group is None:
+                    group = groups[entry['fingerprint']] = {
+                        'fingerprint': entry['fingerprint'],
+                        'statement': entry['statement'],
+                        'count': 0,
+                        'total_ms': 0.0,
+                        'max_ms': 0.0,
+                        'last_seen': None,
+                        'plan': None,
+                        'endpoints': Counter(),
+                    }
+                group['count'] += 1
+                group['total_ms'] += entry['duration_ms']
+                group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+                group['endpoints'][entry.get('endpoint')] += 1
+                if group['last_seen'] is None or entry['time'] > group['last_seen']:
+                    group['last_seen'] = entry['time']
+                    group['plan'] = entry.get('plan')
+
+    top = sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)[:limit]
+    for group in top:
+        group['total_ms'] = round(group['total_ms'], 3)
+        group['avg_ms'] = round(group['total_ms'] / group['count'], 3)
+        group['endpoints'] = [
+            {'endpoint': endpoint, 'count': count} for endpoint, count in group['endpoints'].most_common(5)
+        ]
+    return jsonify(top)
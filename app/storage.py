@@ -0,0 +1,320 @@
+import hashlib
+import os
+import tempfile
+import shutil
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import OperationalError
+from .models import db, Blob, Attachment, StorageUsage, UploadSession
+
+# Размер блока при потоковом чтении файлов
+CHUNK_SIZE = 64 * 1024
+
+# Подкаталоги внутри UPLOAD_FOLDER
+BLOBS_DIR = 'blobs'
+TMP_DIR = 'tmp'
+
+# Суффикс файла превью, который лежит рядом с blob-ом
+PREVIEW_SUFFIX = '.preview.png'
+
+def upload_root():
+    return current_app.config.get('UPLOAD_FOLDER', 'uploads')
+
+def absolute_path(relative_path):
+    return os.path.join(upload_root(), relative_path)
+
+def blob_relative_path(digest):
+    """Путь blob-а с разбиением по первым байтам хеша: blobs/ab/cd/abcd..."""
+    return os.path.join(BLOBS_DIR, digest[:2], digest[2:4], digest)
+
+def temp_dir():
+    # Временные файлы лежат внутри UPLOAD_FOLDER, чтобы os.replace оставался атомарным
+    path = os.path.join(upload_root(), TMP_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def stream_to_temp(stream):
+    """Записать поток во временный файл, вычисляя sha256 по ходу чтения.
+
+    Возвращает (путь к временному файлу, hex-хеш, размер в байтах).
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=temp_dir())
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+    return tmp_path, hasher.hexdigest(), size
+
+def hash_file(path):
+    """Вычислить sha256 файла потоковым чтением"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def add_reference(digest, size):
+    """Увеличить счетчик ссылок на blob (создав запись при необходимости).
+
+    Выполняется одним UPSERT-ом, поэтому параллельные загрузки одного и того же
+    файла не конфликтуют по первичному ключу.
+    """
+    stmt = insert(Blob).values(hash=digest, size=size, ref_count=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Blob.hash],
+        set_={'ref_count': Blob.ref_count + 1}
+    )
+    db.session.execute(stmt)
+
+def store_file(tmp_path, digest, size):
+    """Поместить временный файл в хранилище под его хешем.
+
+    Ссылка учитывается до перемещения файла: UPSERT берет блокировку записи
+    SQLite, и параллельный release_reference не сможет удалить blob между
+    проверкой и заменой файла. Коммит выполняет вызывающий код.
+    Возвращает относительный путь blob-а.
+    """
+    add_reference(digest, size)
+
+    relative_path = blob_relative_path(digest)
+    target = absolute_path(relative_path)
+    if os.path.exists(target):
+        # Такое содержимое уже хранится - дубликат не нужен
+        os.remove(tmp_path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp_path, target)
+
+    return relative_path
+
+def store_copy(path, digest, size):
+    """Как store_file, но исходный файл остается на месте.
+
+    Blob создается жесткой ссылкой (или копией, если ссылки не поддерживаются),
+    поэтому исходник можно удалить только после коммита. Коммит выполняет
+    вызывающий код. Возвращает относительный путь blob-а.
+    """
+    add_reference(digest, size)
+
+    relative_path = blob_relative_path(digest)
+    target = absolute_path(relative_path)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(path, target)
+        except FileExistsError:
+            pass
+        except OSError:
+            # Файловая система без жестких ссылок
+            fd, tmp_path = tempfile.mkstemp(dir=temp_dir())
+            os.close(fd)
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, target)
+
+    return relative_path
+
+def release_reference(digest):
+    """Уменьшить счетчик ссылок и удалить запись blob-а, если ссылок не осталось.
+
+    Файл здесь не удаляется: после успешного коммита вызывающий код передает
+    хеш в remove_unreferenced_blob. Если транзакция откатится, запись и файл
+    останутся согласованными. Возвращает True, если запись удалена.
+    """
+    db.session.query(Blob).filter(Blob.hash == digest).update(
+        {Blob.ref_count: Blob.ref_count - 1}, synchronize_session=False
+    )
+    deleted = db.session.query(Blob).filter(
+        Blob.hash == digest, Blob.ref_count <= 0
+    ).delete(synchronize_session=False)
+
+    return bool(deleted)
+
+def remove_unreferenced_blob(digest):
+    """Удалить файл blob-а и его превью, если записи blob-а больше нет.
+
+    Вызывается после коммита release_reference. Проверка и удаление идут под
+    блокировкой записи SQLite (ее берет DELETE в начале транзакции), поэтому
+    параллельная загрузка того же содержимого либо еще не добавила ссылку и
+    запишет файл заново, либо уже добавила - тогда файл не трогается.
+    """
+    try:
+        db.session.query(Blob).filter(
+            Blob.hash == digest, Blob.ref_count <= 0
+        ).delete(synchronize_session=False)
+        if db.session.get(Blob, digest) is None:
+            path = absolute_path(blob_relative_path(digest))
+            for derived_path in (path, path + PREVIEW_SUFFIX):
+                if os.path.exists(derived_path):
+                    os.remove(derived_path)
+        db.session.commit()
+    except Exception:
+        # Оставшийся файл позже удалит flask sweep-uploads
+        db.session.rollback()
+        raise
+
+# ========== Учет занятого места ==========
+
+def _add_usage(scope, scope_id, delta_bytes, delta_count):
+    # Счетчики не уходят ниже нуля: вложения, загруженные до появления
+    # storage_usage и не учтенные пересчетом, не должны давать отрицательных значений
+    stmt = insert(StorageUsage).values(
+        scope=scope, scope_id=scope_id, total_bytes=max(delta_bytes, 0), file_count=max(delta_count, 0)
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[StorageUsage.scope, StorageUsage.scope_id],
+        set_={
+            'total_bytes': db.func.max(StorageUsage.total_bytes + delta_bytes, 0),
+            'file_count': db.func.max(StorageUsage.file_count + delta_count, 0)
+        }
+    )
+    db.session.execute(stmt)
+
+def account_usage(module, delta_bytes, delta_count):
+    """Изменить счетчики модуля и его курса в текущей транзакции"""
+    _add_usage('module', module.id, delta_bytes, delta_count)
+    _add_usage('course', module.course_id, delta_bytes, delta_count)
+
+def check_quota(module, incoming_bytes):
+    """Проверить квоты перед загрузкой. Возвращает текст ошибки или None.
+
+    Читаются только две строки storage_usage по первичному ключу.
+    """
+    limits = (
+        ('module', module.id, current_app.config.get('MODULE_STORAGE_QUOTA'), 'модуля'),
+        ('course', module.course_id, current_app.config.get('COURSE_STORAGE_QUOTA'), 'курса'),
+    )
+    for scope, scope_id, quota, label in limits:
+        if not quota:
+            continue
+        usage = db.session.get(StorageUsage, (scope, scope_id))
+        used = usage.total_bytes if usage else 0
+        if used + incoming_bytes > quota:
+            return f'Превышена квота вложений {label}: занято {used} из {quota} байт'
+    return None
+
+def rebuild_storage_usage():
+    """Пересчитать storage_usage по таблице attachments в одной транзакции"""
+    from .models import Module
+
+    db.session.query(StorageUsage).delete()
+
+    for scope, key in (('module', Module.id), ('course', Module.course_id)):
+        rows = db.session.query(
+            key, db.func.coalesce(db.func.sum(Attachment.file_size), 0), db.func.count(Attachment.id)
+        ).join(
+            Module, Attachment.module_id == Module.id
+        ).group_by(key).all()
+
+        db.session.add_all([
+            StorageUsage(scope=scope, scope_id=scope_id, total_bytes=total_bytes, file_count=file_count)
+            for scope_id, total_bytes, file_count in rows
+        ])
+
+    db.session.commit()
+
+# Пересчет счетчиков по таблице attachments
+@click.command('rebuild-storage-usage')
+@with_appcontext
+def rebuild_storage_usage_command():
+    """Полный пересчет таблицы storage_usage по вложениям."""
+    rebuild_storage_usage()
+    click.echo('Счетчики занятого места пересчитаны.')
+
+def ensure_attachment_columns():
+    """Добавить в attachments колонки хранилища blobs и превью, если их еще нет.
+
+    Повторный вызов ничего не меняет. Вызывается при создании приложения, так
+    как модель Attachment читает эти колонки в каждом запросе; таблицы еще может
+    не быть (до init-db), а параллельно стартующий воркер может успеть первым.
+    """
+    columns = {row[1] for row in db.session.execute(text('PRAGMA table_info(attachments)'))}
+    if not columns:
+        return
+    try:
+        if 'content_hash' not in columns:
+            db.session.execute(text('ALTER TABLE attachments ADD COLUMN content_hash VARCHAR(64) REFERENCES blobs (hash)'))
+            db.session.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_attachments_content_hash ON attachments (content_hash)'
+            ))
+        if 'preview_path' not in columns:
+            db.session.execute(text('ALTER TABLE attachments ADD COLUMN preview_path VARCHAR(255)'))
+        db.session.commit()
+        # Таблицы хранилища, без которых не работает загрузка
+        db.metadata.create_all(db.engine, tables=[Blob.__table__, StorageUsage.__table__, UploadSession.__table__])
+    except OperationalError:
+        db.session.rollback()
+
+def init_app(app):
+    with app.app_context():
+        ensure_attachment_columns()
+        db.session.remove()
+
+# Миграция существующего каталога uploads/ в хранилище blobs
+@click.command('dedupe-uploads')
+@click.option('--batch-size', default=500, show_default=True, help='Количество вложений в одной транзакции.')
+@with_appcontext
+def dedupe_uploads_command(batch_size):
+    """Перенос вложений в контентно-адресуемое хранилище с удалением дубликатов.
+
+    Недостающие колонки attachments (content_hash, preview_path) добавляются
+    при запуске приложения и еще раз проверяются здесь. Исходные файлы
+    удаляются только после коммита порции; при сбое порции они остаются на
+    месте, а вложения - на старых путях. В конце пересчитывает storage_usage, чтобы квоты учитывали старые вложения.
+    """
+    ensure_attachment_columns()
+    last_id = 0
+    migrated = duplicates = missing = 0
+
+    while True:
+        attachments = Attachment.query.filter(
+            Attachment.id > last_id,
+            Attachment.content_hash.is_(None)
+        ).order_by(Attachment.id).limit(batch_size).all()
+
+        if not attachments:
+            break
+
+        moved = []
+        for attachment in attachments:
+            last_id = attachment.id
+            old_path = absolute_path(attachment.file_path)
+            if not os.path.exists(old_path):
+                missing += 1
+                continue
+
+            digest = hash_file(old_path)
+            if os.path.exists(absolute_path(blob_relative_path(digest))):
+                duplicates += 1
+
+            attachment.file_path = store_copy(old_path, digest, os.path.getsize(old_path))
+            attachment.content_hash = digest
+            moved.append(old_path)
+            migrated += 1
+
+        db.session.commit()
+        for old_path in moved:
+            os.remove(old_path)
+
+    # Удаляем опустевшие каталоги module_<id>
+    root = upload_root()
+    for name in os.listdir(root) if os.path.isdir(root) else []:
+        path = os.path.join(root, name)
+        if name.startswith('module_') and os.path.isdir(path) and not os.listdir(path):
+            os.rmdir(path)
+
+    rebuild_storage_usage()
+    click.echo(f'Перенесено вложений: {migrated}, из них дубликатов: {duplicates}, файлов не найдено: {missing}.')
@@ -0,0 +1,139 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from flask import current_app
+from .models import db, Course, Module, Enrollment
+
+# Верхняя граница для диапазона ключей с заданным префиксом
+_PREFIX_END = '\U0010ffff'
+
+def _normalize(title):
+    return ' '.join((title or '').casefold().split())
+
+def _word_keys(title):
+    """Ключи для поиска с начала названия и с начала каждого слова"""
+    words = _normalize(title).split(' ')
+    return {' '.join(words[i:]) for i in range(len(words)) if words[i]}
+
+class TitleIndex:
+    """Отсортированный массив ключей названий курсов и модулей для автодополнения.
+
+    Поиск по префиксу - два bisect по массиву и выбор top-k по числу записей
+    на курс. Ответы для частых префиксов кешируются до следующего изменения.
+    Индекс живет в памяти процесса: изменения из других процессов подхватываются
+    полной перестройкой раз в SUGGEST_REFRESH_INTERVAL секунд.
+    """
+
+    def __init__(self):
+        self._keys = []           # отсортированные (ключ, тип, id)
+        self._items = {}          # (тип, id) -> (название, course_id, ключи)
+        self._enrollments = {}    # course_id -> число записей на курс
+        self._cache = {}
+        self._built_at = None
+        self._lock = threading.RLock()
+
+    def build(self):
+        courses = db.session.query(Course.id, Course.title).all()
+        modules = db.session.query(Module.id, Module.course_id, Module.title).all()
+        counts = db.session.query(
+            Enrollment.course_id, db.func.count(Enrollment.id)
+        ).group_by(Enrollment.course_id).all()
+
+        keys, items = [], {}
+        for course_id, title in courses:
+            item_keys = _word_keys(title)
+            items[('course', course_id)] = (title, course_id, item_keys)
+            keys.extend((key, 'course', course_id) for key in item_keys)
+        for module_id, course_id, title in modules:
+            item_keys = _word_keys(title)
+            items[('module', module_id)] = (title, course_id, item_keys)
+            keys.extend((key, 'module', module_id) for key in item_keys)
+        keys.sort()
+
+        with self._lock:
+            self._keys = keys
+            self._items = items
+            self._enrollments = dict(counts)
+            self._cache = {}
+            self._built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        interval = current_app.config.get('SUGGEST_REFRESH_INTERVAL', 300)
+        if self._built_at is None or time.monotonic() - self._built_at > interval:
+            self.build()
+
+    def put(self, kind, item_id, title, course_id):
+        """Добавить или обновить название курса/модуля"""
+        if self._built_at is None:
+            return  # Индекс еще не построен - будет загружен целиком
+        with self._lock:
+            self._discard(kind, item_id)
+            item_keys = _word_keys(title)
+            self._items[(kind, item_id)] = (title, course_id, item_keys)
+            for key in item_keys:
+                insort(self._keys, (key, kind, item_id))
+            self._cache = {}
+
+    def remove(self, kind, item_id):
+        if self._built_at is None:
+            return
+        with self._lock:
+            self._discard(kind, item_id)
+            if kind == 'course':
+                self._enrollments.pop(item_id, None)
+            self._cache = {}
+
+    def _discard(self, kind, item_id):
+        item = self._items.pop((kind, item_id), None)
+        if item is None:
+            return
+        for key in item[2]:
+            position = bisect_left(self._keys, (key, kind, item_id))
+            if position < len(self._keys) and self._keys[position] == (key, kind, item_id):
+                del self._keys[position]
+
+    def add_enrollments(self, course_id, delta):
+        if self._built_at is None:
+            return
+        with self._lock:
+            self._enrollments[course_id] = max(self._enrollments.get(course_id, 0) + delta, 0)
+            self._cache = {}
+
+    def suggest(self, prefix, limit=10, kind=None):
+        prefix = _normalize(prefix)
+        if not prefix:
+            return []
+
+        self._ensure_fresh()
+        cache_key = (prefix, limit, kind)
+
+        with self._lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+            low = bisect_left(self._keys, (prefix,))
+            high = bisect_left(self._keys, (prefix + _PREFIX_END,))
+
+            # Одно название может попасть в диапазон несколькими словами
+            candidates = {(item_kind, item_id) for _, item_kind, item_id in self._keys[low:high]
+                          if kind is None or item_kind == kind}
+
+            top = heapq.nlargest(limit, candidates, key=lambda ref: (
+                self._enrollments.get(self._items[ref][1], 0), ref[0] == 'course', -ref[1]
+            ))
+            result = [{
+                'type': item_kind,
+                'id': item_id,
+                'course_id': self._items[(item_kind, item_id)][1],
+                'title': self._items[(item_kind, item_id)][0],
+                'enrollment_count': self._enrollments.get(self._items[(item_kind, item_id)][1], 0)
+            } for item_kind, item_id in top]
+
+            if len(self._cache) >= 4096:
+                self._cache = {}
+            self._cache[cache_key] = result
+            return result
+
+title_index = TitleIndex()
@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from .models import db, Blob, Attachment, UploadSession
+from . import storage
+
+try:
+    import fcntl
+except ImportError:  # не POSIX - очистку выполняет каждый процесс
+    fcntl = None
+
+# Открытый файл блокировки процесса-чистильщика (держится до завершения процесса)
+_sweeper_lock = None
+
+def _older_than(path, grace_seconds):
+    try:
+        return time.time() - os.path.getmtime(path) > grace_seconds
+    except FileNotFoundError:
+        return False
+
+def _remove(path, stats):
+    try:
+        stats['reclaimed_bytes'] += os.path.getsize(path)
+        os.remove(path)
+        stats['removed_files'] += 1
+    except FileNotFoundError:
+        pass
+
+def _batches(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _iter_files(root):
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            yield os.path.join(dirpath, name)
+
+def _sweep_blobs(batch_size, grace_seconds, stats):
+    """Сверить файлы uploads/blobs с таблицами blobs и attachments"""
+    blobs_root = storage.absolute_path(storage.BLOBS_DIR)
+
+    for batch in _batches(_iter_files(blobs_root), batch_size):
+        by_hash = {}
+        for path in batch:
+            name = os.path.basename(path)
+            digest = name.split('.', 1)[0]
+            by_hash.setdefault(digest, []).append(path)
+
+        digests = list(by_hash)
+        known = {blob.hash: blob for blob in Blob.query.filter(Blob.hash.in_(digests)).all()}
+        referenced = dict(db.session.query(
+            Attachment.content_hash, db.func.count(Attachment.id)
+        ).filter(
+            Attachment.content_hash.in_(digests)
+        ).group_by(Attachment.content_hash).all())
+
+        for digest, paths in by_hash.items():
+            refs = referenced.get(digest, 0)
+            blob = known.get(digest)
+
+            if blob is not None and blob.ref_count != refs:
+                # Счетчик ссылок разошелся с реальным числом вложений
+                stats['fixed_ref_counts'] += 1
+                if refs:
+                    blob.ref_count = refs
+                else:
+                    db.session.delete(blob)
+                    blob = None
+
+            if blob is None and not refs:
+                for path in paths:
+                    if _older_than(path, grace_seconds):
+                        _remove(path, stats)
+
+        db.session.commit()
+
+def _sweep_legacy(batch_size, grace_seconds, stats):
+    """Файлы старой раскладки module_<id>/, на которые нет записей"""
+    root = storage.upload_root()
+    if not os.path.isdir(root):
+        return
+
+    for name in os.listdir(root):
+        directory = os.path.join(root, name)
+        if not name.startswith('module_') or not os.path.isdir(directory):
+            continue
+
+        for batch in _batches(_iter_files(directory), batch_size):
+            relative = {os.path.relpath(path, root): path for path in batch}
+            known = {row.file_path for row in db.session.query(Attachment.file_path).filter(
+                Attachment.file_path.in_(list(relative))
+            )}
+            for relative_path, path in relative.items():
+                if relative_path not in known and _older_than(path, grace_seconds):
+                    _remove(path, stats)
+
+def _sweep_temp(session_ttl, grace_seconds, stats):
+    """Брошенные сессии загрузки и временные файлы"""
+    expired = UploadSession.query.filter(
+        UploadSession.updated_at < datetime.utcnow() - timedelta(seconds=session_ttl)
+    ).all()
+    for upload in expired:
+        _remove(storage.absolute_path(upload.temp_path), stats)
+        db.session.delete(upload)
+        stats['expired_sessions'] += 1
+    db.session.commit()
+
+    sessions = UploadSession.query.all()
+    # Хеши частей в памяти этого процесса для уже несуществующих сессий
+    from .attachments import prune_upload_hashers
+    prune_upload_hashers({upload.id for upload in sessions})
+
+    tmp_root = storage.absolute_path(storage.TMP_DIR)
+    if not os.path.isdir(tmp_root):
+        return
+
+    active = {os.path.basename(upload.temp_path) for upload in sessions}
+    for name in os.listdir(tmp_root):
+        path = os.path.join(tmp_root, name)
+        if name not in active and _older_than(path, grace_seconds):
+            _remove(path, stats)
+
+def sweep_orphans(batch_size=500, grace_seconds=3600, session_ttl=86400):
+    """Удалить файлы в UPLOAD_FOLDER, которым не соответствует ни одна запись.
+
+    Файлы моложе grace_seconds не трогаются: их запись может быть еще не закоммичена.
+    Возвращает статистику очистки.
+    """
+    stats = {'removed_files': 0, 'reclaimed_bytes': 0, 'fixed_ref_counts': 0, 'expired_sessions': 0}
+    _sweep_blobs(batch_size, grace_seconds, stats)
+    _sweep_legacy(batch_size, grace_seconds, stats)
+    _sweep_temp(session_ttl, grace_seconds, stats)
+    return stats
+
+def _sweep_config(app):
+    return {
+        'batch_size': app.config.get('ORPHAN_SWEEP_BATCH_SIZE', 500),
+        'grace_seconds': app.config.get('ORPHAN_SWEEP_GRACE', 3600),
+        'session_ttl': app.config.get('UPLOAD_SESSION_TTL', 86400),
+    }
+
+def start_sweeper(app):
+    """Запускать периодическую очистку в фоновом потоке (ORPHAN_SWEEP_INTERVAL > 0).
+
+    Поток стартует при первом HTTP-запросе процесса, поэтому CLI-команды его
+    не запускают. Из воркеров pre-fork сервера очистку выполняет тот, кто
+    захватил блокировку instance/orphan-sweeper.lock; если он завершится,
+    блокировку подхватит другой.
+    """
+    interval = app.config.get('ORPHAN_SWEEP_INTERVAL', 0)
+    if not interval:
+        return
+    lock = threading.Lock()
+    started = []
+
+    @app.before_request
+    def start_sweeper_thread():
+        if started:
+            return
+        with lock:
+            if not started:
+                started.append(_start_sweeper_thread(app, interval))
+
+def _acquire_sweeper_lock(app):
+    global _sweeper_lock
+    if fcntl is None or _sweeper_lock is not None:
+        return True
+    os.makedirs(app.instance_path, exist_ok=True)
+    handle = open(os.path.join(app.instance_path, 'orphan-sweeper.lock'), 'w')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    _sweeper_lock = handle
+    return True
+
+def _start_sweeper_thread(app, interval):
+    def run():
+        while True:
+            time.sleep(interval)
+            if not _acquire_sweeper_lock(app):
+                continue
+            with app.app_context():
+                try:
+                    stats = sweep_orphans(**_sweep_config(app))
+                    app.logger.info('Очистка вложений: %s', stats)
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.warning('Ошибка при очистке вложений: %s', e)
+
+    thread = threading.Thread(target=run, name='orphan-sweeper', daemon=True)
+    thread.start()
+    return thread
+
+# Разовая очистка (для cron)
+@click.command('sweep-uploads')
+@with_appcontext
+def sweep_uploads_command():
+    """Удаление файлов-сирот из каталога загрузок."""
+    stats = sweep_orphans(**_sweep_config(current_app))
+    click.echo(
+        f"Удалено файлов: {stats['removed_files']} ({stats['reclaimed_bytes']} байт), "
+        f"исправлено счетчиков ссылок: {stats['fixed_ref_counts']}, "
+        f"просроченных загрузок: {stats['expired_sessions']}."
+    )
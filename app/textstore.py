@@ -0,0 +1,143 @@
+import sqlite3
+import zlib
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from . import db
+
+try:
+    import zstandard
+except ImportError:  # zstandard не установлен - используется zlib
+    zstandard = None
+
+# Тексты короче этого порога хранятся без сжатия: выигрыш меньше накладных расходов
+MIN_COMPRESSED_SIZE = 256
+
+def _preferred_codec():
+    codec = current_app.config.get('TEXT_COMPRESSION', 'zlib')
+    if codec == 'zstd' and zstandard is None:
+        return 'zlib'
+    return codec
+
+def encode_text(value):
+    """Сжать текст для хранения. Возвращает (кодек, байты)"""
+    raw = (value or '').encode('utf-8')
+    if len(raw) < MIN_COMPRESSED_SIZE:
+        return 'none', raw
+
+    codec = _preferred_codec()
+    if codec == 'zstd':
+        data = zstandard.ZstdCompressor(level=6).compress(raw)
+    elif codec == 'zlib':
+        data = zlib.compress(raw, 6)
+    else:
+        return 'none', raw
+
+    if len(data) >= len(raw):
+        return 'none', raw
+    return codec, data
+
+def decode_text(codec, data):
+    if data is None:
+        return None
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('Текст сжат zstd, но пакет zstandard не установлен')
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == 'zlib':
+        data = zlib.decompress(data)
+    return data.decode('utf-8')
+
+class CompressedText:
+    """Колонки сжатого текста для побочных таблиц module_contents и notification_messages"""
+    codec = db.Column(db.String(8), nullable=False, default='none')
+    data = db.Column(db.LargeBinary, nullable=False, default=b'')
+
+    @property
+    def text(self):
+        return decode_text(self.codec, self.data)
+
+    @text.setter
+    def text(self, value):
+        self.codec, self.data = encode_text(value)
+
+# (таблица, старая колонка, побочная таблица, ключ побочной таблицы, колонка длины)
+TEXT_COLUMNS = (
+    ('modules', 'content', 'module_contents', 'module_id', 'content_length'),
+    ('notifications', 'message', 'notification_messages', 'notification_id', 'message_length'),
+)
+
+def _columns(table):
+    return {row[1] for row in db.session.execute(text(f'PRAGMA table_info({table})'))}
+
+# Перенос текстов в побочные таблицы со сжатием
+@click.command('migrate-text-columns')
+@click.option('--batch-size', default=500, show_default=True, help='Количество строк в одной транзакции.')
+@with_appcontext
+def migrate_text_columns_command(batch_size):
+    """Перенос modules.content и notifications.message в сжатые побочные таблицы."""
+    from .search import create_search_index, reindex_modules
+    from .rendering import ensure_content_hash_column
+
+    # Старые колонки удаляются ALTER TABLE ... DROP COLUMN, который есть только в SQLite 3.35+
+    pending = [f'{table}.{column}' for table, column, *_ in TEXT_COLUMNS if column in _columns(table)]
+    if pending and sqlite3.sqlite_version_info < (3, 35, 0):
+        raise click.ClickException(
+            f'Для переноса {", ".join(pending)} нужен SQLite 3.35 или новее (сейчас {sqlite3.sqlite_version}); '
+            'база не изменена.'
+        )
+
+    ensure_content_hash_column()  # Модель Module читает ее при переиндексации
+    db.create_all()  # Побочные таблицы
+    # Удаляет триггеры modules_fts, которые читали modules.content
+    create_search_index()
+
+    for table, column, side_table, key, length_column in TEXT_COLUMNS:
+        columns = _columns(table)
+        if length_column not in columns:
+            db.session.execute(text(
+                f'ALTER TABLE {table} ADD COLUMN {length_column} INTEGER NOT NULL DEFAULT 0'
+            ))
+            db.session.commit()
+        if column not in columns:
+            click.echo(f'{table}.{column}: уже перенесено.')
+            continue
+
+        last_id = 0
+        moved = 0
+        while True:
+            rows = db.session.execute(text(f"""
+                SELECT id, {column} FROM {table} WHERE id > :last_id ORDER BY id LIMIT :limit
+            """), {'last_id': last_id, 'limit': batch_size}).fetchall()
+            if not rows:
+                break
+
+            values = []
+            for row_id, value in rows:
+                codec, data = encode_text(value)
+                values.append({'id': row_id, 'codec': codec, 'data': data, 'length': len(value or '')})
+
+            # Строки, перенесенные при прерванном запуске, не перезаписываются
+            db.session.execute(text(f"""
+                INSERT INTO {side_table} ({key}, codec, data) VALUES (:id, :codec, :data)
+                ON CONFLICT({key}) DO NOTHING
+            """), values)
+            db.session.execute(text(
+                f'UPDATE {table} SET {length_column} = :length WHERE id = :id'
+            ), values)
+            db.session.commit()
+
+            last_id = rows[-1][0]
+            moved += len(rows)
+            click.echo(f'{table}: перенесено {moved} строк (до id {last_id})')
+
+        # Модели больше не пишут в старую колонку (NOT NULL), поэтому она удаляется
+        db.session.execute(text(f'ALTER TABLE {table} DROP COLUMN {column}'))
+        db.session.commit()
+        click.echo(f'{table}.{column}: колонка удалена.')
+
+    click.echo('Переиндексация модулей для полнотекстового поиска...')
+    reindex_modules(batch_size)
+    db.session.execute(text('VACUUM'))
+    click.echo('Перенос завершен.')
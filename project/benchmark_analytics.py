@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк статистики распределений (app/analytics.py).
+Заполняет отдельную базу SQLite синтетическими оценками и прогрессом и
+замеряет код приложения: потоковое чтение столбцов (_stream_columns),
+построение AnalyticsSnapshot целиком, расчет по модулям и курсам, кривые
+завершения, z-оценки студентов одного курса и подготовку ответа эндпоинта.
+Использование: python benchmark_analytics.py [--rows 10000000] [--db путь]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import db
+from app.models import Module, Assessment, Enrollment
+from app.reports import ReportWindow
+from app.analytics import AnalyticsSnapshot, group_stats, completion_curves, _stream_columns
+
+# Сколько строк вставлять за один executemany при генерации
+INSERT_BATCH = 200_000
+
+def timed(label, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<40} {time.perf_counter() - started:8.3f} с")
+    return result
+
+def fill_database(path, args):
+    """Сгенерировать модули, оценки и записи на курсы прямо через sqlite3"""
+    rng = np.random.default_rng(42)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+
+    module_ids = np.arange(1, args.modules + 1)
+    conn.executemany(
+        "INSERT INTO modules (id, course_id, title, content_length) VALUES (?, ?, 'm', 0)",
+        zip(module_ids.tolist(), (module_ids % args.courses + 1).tolist())
+    )
+
+    for start in range(0, args.rows, INSERT_BATCH):
+        size = min(INSERT_BATCH, args.rows - start)
+        users = rng.integers(1, args.users + 1, size)
+        modules = rng.integers(1, args.modules + 1, size)
+        grades = np.clip(rng.normal(3.8, 0.9, size), 0, 5).round(1)
+        conn.executemany(
+            "INSERT OR IGNORE INTO assessments (user_id, module_id, grade, assessment_date) VALUES (?, ?, ?, '2024-01-01 00:00:00.000000')",
+            zip(users.tolist(), modules.tolist(), grades.tolist())
+        )
+
+    # Повторные пары (студент, курс) пропускаются уникальным индексом
+    enrollments = args.rows // 5
+    for start in range(0, enrollments, INSERT_BATCH):
+        size = min(INSERT_BATCH, enrollments - start)
+        users = rng.integers(1, args.users + 1, size)
+        courses = rng.integers(1, args.courses + 1, size)
+        progress = rng.uniform(0, 100, size).round()
+        conn.executemany(
+            "INSERT OR IGNORE INTO enrollments (user_id, course_id, progress, enrollment_date) VALUES (?, ?, ?, '2024-01-01 00:00:00.000000')",
+            zip(users.tolist(), courses.tolist(), progress.tolist())
+        )
+    conn.commit()
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк статистики распределений')
+    parser.add_argument('--rows', type=int, default=10_000_000, help='Количество оценок')
+    parser.add_argument('--modules', type=int, default=20_000, help='Количество модулей')
+    parser.add_argument('--courses', type=int, default=1_000, help='Количество курсов')
+    parser.add_argument('--users', type=int, default=500_000, help='Количество студентов')
+    parser.add_argument('--db', help='Файл базы (если уже заполнен - используется повторно)')
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'benchmark_analytics.sqlite3')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.abspath(path)}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            db.metadata.create_all(db.engine, tables=[
+                Module.__table__, Assessment.__table__, Enrollment.__table__
+            ])
+            print(f"Генерация {args.rows} оценок в {path}...")
+            timed('Заполнение базы', fill_database, path, args)
+
+        grade_user, grade_module, grade_course, grade = timed(
+            'Чтение оценок (_stream_columns)', _stream_columns,
+            'SELECT a.user_id, a.module_id, m.course_id, a.grade FROM assessments a JOIN modules m ON m.id = a.module_id',
+            (np.int64, np.int64, np.int64, np.float64)
+        )
+        enrollment_course, progress = timed(
+            'Чтение прогресса (_stream_columns)', _stream_columns,
+            'SELECT course_id, COALESCE(progress, 0) FROM enrollments', (np.int64, np.float64)
+        )
+        timed('Распределения по модулям', group_stats, grade_module, grade)
+        timed('Распределения по курсам', group_stats, grade_course, grade)
+        timed('Кривые завершения', completion_curves, enrollment_course, progress)
+
+        snapshot = timed('AnalyticsSnapshot целиком (с чтением)', AnalyticsSnapshot)
+        timed('z-оценки студентов одного курса', snapshot.student_scores, 1)
+        timed('Ответ по модулям (module_distributions)', snapshot.module_distributions)
+        timed('Ответ по курсам (course_distributions)', snapshot.course_distributions)
+
+        # Снимок за период строится без кэша; здесь в период попадают все строки
+        window = ReportWindow(start=datetime(2024, 1, 1), end=datetime(2024, 1, 31))
+        timed('AnalyticsSnapshot за период', AnalyticsSnapshot, window)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import create_app, db
+from app.models import User, Course, Module
+from app.search import create_search_index
+from app.revocation import blocklist
+from app.authz import user_state_cache
+from app.facets import facet_index
+from app.suggest import title_index
+from app.leaderboards import leaderboards
+from app import analytics
+
+@pytest.fixture
+def app_config(tmp_path):
+    """Настройки тестового приложения; модуль тестов может переопределить фикстуру"""
+    return {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "db.sqlite3"}',
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'EXPORT_FOLDER': str(tmp_path / 'exports'),
+        'SLOW_QUERY_THRESHOLD_MS': None,
+        'BCRYPT_LOG_ROUNDS': 4,
+        'JWT_VERIFY_SUB': False,  # identity в токене - словарь, а не строка
+    }
+
+@pytest.fixture
+def app(app_config):
+    app = create_app(app_config)
+
+    # Кэши процесса общие для всех приложений - каждый тест начинает с пустых
+    for cache in (blocklist, user_state_cache, facet_index, title_index, leaderboards):
+        cache.__init__()
+    analytics._snapshot = None
+
+    with app.app_context():
+        db.create_all()
+        create_search_index()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def login(client):
+    """Зарегистрировать пользователя (при первом вызове) и вернуть заголовок авторизации"""
+    def login(email='student@example.com', password='password', role='student'):
+        if User.query.filter_by(email=email).first() is None:
+            client.post('/auth/register', json={'name': email.split('@')[0], 'email': email, 'password': password})
+            if role != 'student':
+                User.query.filter_by(email=email).update({'role': role})
+                db.session.commit()
+        response = client.post('/auth/login', json={'email': email, 'password': password})
+        assert response.status_code == 200, response.get_json()
+        return {'Authorization': 'Bearer ' + response.get_json()['access_token']}
+    return login
+
+@pytest.fixture
+def module(app):
+    course = Course(title='Python', description='Основы языка')
+    db.session.add(course)
+    db.session.commit()
+    module = Module(course_id=course.id, title='Введение', content='Первый модуль')
+    db.session.add(module)
+    db.session.commit()
+    return module
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from app import db
+from app import analytics
+from app.models import Assessment
+
+def test_group_stats_match_per_group_numpy():
+    rng = np.random.default_rng(3)
+    keys = rng.integers(1, 20, 2000)
+    values = np.round(rng.uniform(0, 5, 2000), 1)
+
+    stats = analytics.group_stats(keys, values)
+
+    for i, key in enumerate(stats['groups']):
+        group = values[keys == key]
+        assert stats['count'][i] == len(group)
+        assert stats['mean'][i] == pytest.approx(group.mean())
+        assert stats['std'][i] == pytest.approx(group.std())
+        assert (stats['min'][i], stats['max'][i]) == (group.min(), group.max())
+        for q in analytics.QUANTILES:
+            assert stats['quantiles'][q][i] == pytest.approx(np.quantile(group, q))
+        expected = np.histogram(group, bins=analytics.GRADE_BINS, range=(0, analytics.MAX_GRADE))[0]
+        assert stats['histogram'][i].tolist() == expected.tolist()
+
+def test_completion_curve_counts_enrollments_at_or_above_threshold():
+    groups, curves = analytics.completion_curves(np.array([1, 1, 1, 2]), np.array([0.0, 50.0, 100.0, 15.0]))
+
+    assert groups.tolist() == [1, 2]
+    assert curves[0].tolist() == pytest.approx([1] + [2 / 3] * 5 + [1 / 3] * 5)
+    assert curves[1].tolist() == pytest.approx([1, 1] + [0] * 9)
+
+@pytest.fixture
+def graded(client, login, module):
+    """Два студента курса: оценки 5 и 3 за модуль, прогресс курса у обоих 100%"""
+    for i, grade in enumerate((5, 3)):
+        headers = login(f'user{i}@example.com')
+        client.post(f'/api/courses/{module.course_id}/enroll', headers=headers)
+        client.post(f'/api/modules/{module.id}/assessment', headers=headers, json={'grade': grade})
+    return login()
+
+def test_distribution_endpoints(client, module, graded):
+    modules = client.get('/api/statistics/distributions/modules', headers=graded).get_json()
+    assert [(item['module_id'], item['count'], item['mean'], item['quantiles']['p50']) for item in modules] == \
+        [(module.id, 2, 4.0, 4.0)]
+
+    courses = client.get('/api/statistics/distributions/courses', headers=graded).get_json()
+    assert courses[0]['course_id'] == module.course_id and courses[0]['std'] == 1.0
+    assert courses[0]['completion_curve'][-1] == {'progress': 100, 'share': 1.0}
+
+    students = client.get(f'/api/statistics/distributions/courses/{module.course_id}/students',
+                          headers=graded).get_json()
+    assert [(item['average_grade'], item['z_score']) for item in students] == [(5.0, 1.0), (3.0, -1.0)]
+
+def test_snapshot_is_reused_until_ttl_expires(app, client, module, graded):
+    client.get('/api/statistics/distributions/modules', headers=graded)
+    Assessment.query.update({'grade': 1.0})
+    db.session.commit()
+
+    cached = client.get('/api/statistics/distributions/modules', headers=graded).get_json()
+    assert cached[0]['mean'] == 4.0
+
+    app.config['ANALYTICS_CACHE_TTL'] = 0
+    fresh = client.get('/api/statistics/distributions/modules', headers=graded).get_json()
+    assert fresh[0]['mean'] == 1.0
+
+def test_window_reads_only_period_rows(client, module, graded):
+    in_past = client.get('/api/statistics/distributions/courses', headers=graded,
+                         query_string={'from': '2000-01-01', 'to': '2000-12-31'})
+    assert in_past.get_json() == []
+
+    invalid = client.get('/api/statistics/distributions/courses', headers=graded, query_string={'from': 'вчера'})
+    assert invalid.status_code == 400
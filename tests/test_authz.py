@@ -0,0 +1,58 @@
+from app import db
+from app.models import User
+from app.authz import user_state_cache
+
+def revoke_nothing(client, headers):
+    """Маршрут только для администраторов: 400 - права есть, 403 - нет"""
+    return client.post('/auth/revoke', headers=headers, json={}).status_code
+
+def set_role(email, role):
+    User.query.filter_by(email=email).update({'role': role})
+    db.session.commit()
+
+def test_fresh_token_is_authorized_from_claims(client, login):
+    admin = login('admin@example.com', role='admin')
+    misses = user_state_cache.misses
+
+    assert revoke_nothing(client, admin) == 400
+    assert revoke_nothing(client, login()) == 403
+    # Роль взята из claims свежих токенов, база не читалась
+    assert user_state_cache.misses == misses
+
+def test_old_token_uses_current_role(app, client, login):
+    admin = login('admin@example.com', role='admin')
+    set_role('admin@example.com', 'student')
+    # Токен старше USER_STATE_CACHE_TTL - claims больше не считаются актуальными
+    app.config['USER_STATE_CACHE_TTL'] = 0
+
+    assert revoke_nothing(client, admin) == 403
+
+def test_cache_serves_repeated_lookups(app, login):
+    login()
+    user_id = User.query.one().id
+    app.config['USER_STATE_CACHE_TTL'] = 300
+
+    assert user_state_cache.get(user_id).role == 'student'
+    set_role('student@example.com', 'admin')
+    assert user_state_cache.get(user_id).role == 'student'
+    assert user_state_cache.hits == 1
+
+    user_state_cache.invalidate(user_id)
+    assert user_state_cache.get(user_id).role == 'admin'
+
+def test_cache_is_bounded(app):
+    app.config['USER_STATE_CACHE_SIZE'] = 2
+    for user_id in (1, 2, 3):
+        user_state_cache.get(user_id)
+    assert list(user_state_cache._entries) == [2, 3]
+    assert user_state_cache.get(404) is None
+
+def test_revoke_user_invalidates_cached_state(app, client, login):
+    admin = login('admin@example.com', role='admin')
+    login()
+    student = User.query.filter_by(email='student@example.com').one()
+    user_state_cache.get(student.id)
+
+    assert client.post('/auth/revoke', headers=admin, json={'user_id': student.id}).status_code == 200
+
+    assert student.id not in user_state_cache._entries
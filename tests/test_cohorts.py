@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+from app import db
+from app.models import CohortMilestone, Enrollment, Module
+from app.cohorts import rebuild_cohorts_command
+
+def milestone_counts():
+    return {
+        (r.cohort_week, r.course_id, r.milestone, r.weeks_since): r.count
+        for r in CohortMilestone.query.all() if r.count
+    }
+
+def funnel(client, headers, course_id):
+    response = client.get('/api/statistics/cohorts/funnel', headers=headers, query_string={'course_id': course_id})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['cohorts']
+
+def add_module(course_id, title='Второй'):
+    module = Module(course_id=course_id, title=title, content='')
+    db.session.add(module)
+    db.session.commit()
+    return module
+
+def test_funnel_counts_reached_milestones(client, login, module):
+    second = add_module(module.course_id)
+    fast, slow = login('fast@example.com'), login('slow@example.com')
+    for headers in (fast, slow):
+        client.post(f'/api/courses/{module.course_id}/enroll', headers=headers)
+    for module_id in (module.id, second.id):
+        client.post(f'/api/modules/{module_id}/assessment', headers=fast, json={'grade': 5})
+    client.post(f'/api/modules/{module.id}/assessment', headers=slow, json={'grade': 4})
+
+    [cohort] = funnel(client, fast, module.course_id)
+
+    assert cohort['size'] == 2
+    assert {m['milestone']: m['count'] for m in cohort['milestones']} == {25: 2, 50: 2, 75: 1, 100: 1}
+    assert cohort['milestones'][-1]['share'] == 0.5
+
+def test_unenroll_shrinks_cohort(client, login, module):
+    first, second = login('a@example.com'), login('b@example.com')
+    for headers in (first, second):
+        client.post(f'/api/courses/{module.course_id}/enroll', headers=headers)
+
+    client.delete(f'/api/courses/{module.course_id}/unenroll', headers=second)
+
+    assert funnel(client, first, module.course_id)[0]['size'] == 1
+
+def test_milestone_is_counted_once(client, login, module):
+    headers = login()
+    client.post(f'/api/courses/{module.course_id}/enroll', headers=headers)
+    client.post(f'/api/modules/{module.id}/assessment', headers=headers, json={'grade': 5})
+    # Оценка снижена до нуля и выставлена снова - порог уже пройден
+    client.post(f'/api/modules/{module.id}/assessment', headers=headers, json={'grade': 0})
+    client.post(f'/api/modules/{module.id}/assessment', headers=headers, json={'grade': 5})
+
+    [cohort] = funnel(client, headers, module.course_id)
+
+    assert {m['milestone']: m['count'] for m in cohort['milestones']} == {25: 1, 50: 1, 75: 1, 100: 1}
+
+def test_size_never_goes_below_zero(app, module):
+    enrollment = Enrollment(user_id=1, course_id=module.course_id, enrollment_date=datetime(2024, 1, 3))
+    CohortMilestone.record(enrollment, 0, enrollment.enrollment_date, delta=-1)
+    db.session.commit()
+    assert CohortMilestone.query.one().count == 0
+
+def test_rebuild_matches_incremental_counts(app, client, login, module):
+    second = add_module(module.course_id)
+    for i in range(4):
+        headers = login(f'user{i}@example.com')
+        client.post(f'/api/courses/{module.course_id}/enroll', headers=headers)
+        for graded in (module, second)[:i % 3]:
+            client.post(f'/api/modules/{graded.id}/assessment', headers=headers, json={'grade': 4})
+    client.delete(f'/api/courses/{module.course_id}/unenroll', headers=login('user3@example.com'))
+    incremental = milestone_counts()
+
+    result = app.test_cli_runner().invoke(rebuild_cohorts_command, ['--batch-size', '2'])
+
+    assert result.exit_code == 0, result.output
+    db.session.expire_all()
+    assert milestone_counts() == incremental
+
+def test_retention_accumulates_by_week(client, login, module):
+    headers = login()
+    week = datetime.utcnow() - timedelta(weeks=3)
+    cohort_week = CohortMilestone.cohort_of(week)
+    # Когорта из 4 записей: одна прошла 100% в первую неделю, еще две - на третьей
+    for milestone, weeks_since, count in ((0, 0, 4), (100, 0, 1), (100, 2, 2)):
+        db.session.add(CohortMilestone(cohort_week=cohort_week, course_id=module.course_id,
+                                       milestone=milestone, weeks_since=weeks_since, count=count))
+    db.session.commit()
+
+    response = client.get('/api/statistics/cohorts/retention', headers=headers,
+                          query_string={'course_id': module.course_id, 'weeks': 4})
+
+    [cohort] = response.get_json()['cohorts']
+    assert cohort['size'] == 4
+    assert cohort['shares'][:3] == [0.25, 0.25, 0.75]
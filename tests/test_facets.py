@@ -0,0 +1,75 @@
+import io
+from datetime import datetime
+from app import db
+from app.models import Course, Module
+from app.facets import facet_index
+
+def catalog(client, **params):
+    response = client.get('/api/courses', query_string=params)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+def make_courses(client, headers, titles):
+    catalog(client, sort='rating')  # Индекс построен - дальше изменения инкрементальные
+    return [client.post('/api/courses', headers=headers, json={'title': t}).get_json()['course_id'] for t in titles]
+
+def rate(client, course_id, rating, headers):
+    client.post(f'/api/courses/{course_id}/feedback', headers=headers, json={'rating': rating})
+
+def test_filters_combine_and_counts_ignore_own_facet(client, login):
+    headers = login()
+    good, poor, unrated = make_courses(client, headers, ['Хороший', 'Слабый', 'Новый'])
+    rate(client, good, 5, headers)
+    rate(client, poor, 2, headers)
+    client.post(f'/api/courses/{good}/enroll', headers=headers)
+
+    result = catalog(client, filter='rating:4-5|2-3')
+    assert {item['id'] for item in result['items']} == {good, poor}
+    # Счетчики рейтинга считаются без фильтра по самому рейтингу
+    assert result['facets']['rating'] == {'4-5': 1, '2-3': 1, 'none': 1}
+    assert result['facets']['enrollments'] == {'1-9': 1, '0': 1}
+
+    both = catalog(client, filter='rating:4-5|2-3,enrollments:0')
+    assert [item['id'] for item in both['items']] == [poor]
+
+def test_attachments_facet_follows_uploads(client, login):
+    headers = login()
+    [course_id] = make_courses(client, headers, ['С файлами'])
+    module = Module(course_id=course_id, title='М', content='')
+    db.session.add(module)
+    db.session.commit()
+    client.post(f'/api/modules/{module.id}/attachments', headers=headers,
+                data={'file': (io.BytesIO(b'x'), 'a.pdf')}, content_type='multipart/form-data')
+
+    assert [i['id'] for i in catalog(client, filter='has_attachments:true')['items']] == [course_id]
+
+def test_incremental_index_matches_rebuild(client, login):
+    headers = login()
+    ids = make_courses(client, headers, [f'Курс {i}' for i in range(6)])
+    for i, course_id in enumerate(ids):
+        for j in range(i % 3):
+            user = login(f'user{j}@example.com')
+            client.post(f'/api/courses/{course_id}/enroll', headers=user)
+            rate(client, course_id, 1 + (i + j) % 5, user)
+    client.delete(f'/api/courses/{ids[1]}/unenroll', headers=login('user0@example.com'))
+    incremental = catalog(client, sort='-rating', per_page=100)
+
+    facet_index.build()
+
+    assert catalog(client, sort='-rating', per_page=100) == incremental
+
+def test_sort_keeps_undated_courses_last(client, login):
+    headers = login()
+    old, new, undated = make_courses(client, headers, ['Старый', 'Новый', 'Без даты'])
+    Course.query.filter_by(id=old).update({'created_at': datetime(2020, 1, 1)})
+    Course.query.filter_by(id=undated).update({'created_at': None})
+    db.session.commit()
+    facet_index.build()
+
+    assert [i['id'] for i in catalog(client, sort='created')['items']] == [old, new, undated]
+    assert [i['id'] for i in catalog(client, sort='-created')['items']] == [new, old, undated]
+    assert catalog(client, filter='created:unknown')['total'] == 1
+
+def test_invalid_filter_and_sort(client):
+    assert client.get('/api/courses', query_string={'filter': 'color:red'}).status_code == 400
+    assert client.get('/api/courses', query_string={'sort': 'title'}).status_code == 400
@@ -0,0 +1,45 @@
+from app.fieldsets import MODULE_FIELDS, ASSESSMENT_FIELDS
+
+def get(client, url, headers=None, **params):
+    response = client.get(url, headers=headers, query_string=params)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+def test_modules_default_to_table_of_contents(client, module):
+    items = get(client, f'/api/courses/{module.course_id}/modules')
+
+    assert items == [{'id': module.id, 'title': 'Введение', 'content_length': len('Первый модуль')}]
+
+def test_requested_fields_only_in_given_order(client, module):
+    items = get(client, f'/api/courses/{module.course_id}/modules', fields='content, title,content')
+    assert items == [{'content': 'Первый модуль', 'title': 'Введение'}]
+
+    with_include = get(client, f'/api/courses/{module.course_id}/modules', fields='id', include='content')
+    assert with_include == [{'id': module.id, 'content': 'Первый модуль'}]
+
+def test_unknown_or_empty_fields_are_rejected(client, login, module):
+    response = client.get(f'/api/courses/{module.course_id}/modules', query_string={'fields': 'id,secret'})
+    assert response.status_code == 400
+    assert 'Unknown field: secret' in response.get_json()['message']
+
+    response = client.get('/api/enrollments', headers=login(), query_string={'fields': ' , '})
+    assert response.status_code == 400
+
+def test_joins_only_for_requested_fields():
+    assert 'module_contents' not in str(MODULE_FIELDS.select(['id', 'title']))
+    assert 'module_contents' in str(MODULE_FIELDS.select(['content']))
+    assert 'courses' not in str(ASSESSMENT_FIELDS.select(['module_title']))
+    assert 'courses' in str(ASSESSMENT_FIELDS.select(['grade', 'course_title']))
+
+def test_assessments_and_enrollments_fields(client, login, module):
+    headers = login()
+    client.post(f'/api/courses/{module.course_id}/enroll', headers=headers)
+    client.post(f'/api/modules/{module.id}/assessment', headers=headers, json={'grade': 4})
+
+    assessments = get(client, '/api/assessments', headers, fields='course_title,grade')
+    assert assessments == [{'course_title': 'Python', 'grade': 4.0}]
+
+    enrollments = get(client, '/api/enrollments', headers, fields='course_id,course_title')
+    assert enrollments == [{'course_id': module.course_id, 'course_title': 'Python'}]
+    assert set(get(client, '/api/enrollments', headers)[0]) == \
+        {'id', 'course_id', 'course_title', 'progress', 'enrollment_date'}
@@ -0,0 +1,58 @@
+import pytest
+import numpy as np
+from app import db
+from app.models import Module
+from app.gradebook import BINARY_HEADER, BINARY_MAGIC
+
+@pytest.fixture
+def gradebook(client, login, module):
+    """Два модуля курса, два студента; второй оценен только за первый модуль"""
+    second = Module(course_id=module.course_id, title='Второй', content='')
+    db.session.add(second)
+    db.session.commit()
+    students = [login(f'user{i}@example.com') for i in range(2)]
+    for headers in students:
+        client.post(f'/api/courses/{module.course_id}/enroll', headers=headers)
+    for module_id, headers, grade in ((module.id, students[0], 5), (second.id, students[0], 3.5),
+                                      (module.id, students[1], 4)):
+        client.post(f'/api/modules/{module_id}/assessment', headers=headers, json={'grade': grade})
+    return module.course_id, [module.id, second.id], login('admin@example.com', role='admin')
+
+def test_json_uses_null_for_missing_grades(client, gradebook):
+    course_id, module_ids, admin = gradebook
+
+    result = client.get(f'/api/courses/{course_id}/gradebook', headers=admin).get_json()
+
+    assert result['shape'] == [2, 2]
+    assert result['module_ids'] == module_ids
+    assert result['grades'] == [5.0, 3.5, 4.0, None]
+
+def test_binary_layout(client, gradebook):
+    course_id, module_ids, admin = gradebook
+
+    response = client.get(f'/api/courses/{course_id}/gradebook', headers={
+        **admin, 'Accept': 'application/octet-stream'
+    })
+
+    assert response.mimetype == 'application/octet-stream'
+    magic, students, modules = BINARY_HEADER.unpack_from(response.data)
+    assert (magic, students, modules) == (BINARY_MAGIC, 2, 2)
+    offset = BINARY_HEADER.size
+    user_ids = np.frombuffer(response.data, '<i4', students, offset)
+    assert list(np.frombuffer(response.data, '<i4', modules, offset + 4 * students)) == module_ids
+    grades = np.frombuffer(response.data, '<f4', offset=offset + 4 * (students + modules)).reshape(2, 2)
+    assert list(user_ids) == sorted(user_ids)
+    assert grades[0].tolist() == [5.0, 3.5] and grades[1, 0] == 4.0 and np.isnan(grades[1, 1])
+
+def test_unenrolled_students_are_dropped(client, login, gradebook):
+    course_id, _, admin = gradebook
+    client.delete(f'/api/courses/{course_id}/unenroll', headers=login('user1@example.com'))
+
+    result = client.get(f'/api/courses/{course_id}/gradebook', headers=admin, query_string={'format': 'json'})
+
+    assert result.get_json()['grades'] == [5.0, 3.5]
+
+def test_admin_only_and_missing_course(client, login, gradebook):
+    course_id, _, admin = gradebook
+    assert client.get(f'/api/courses/{course_id}/gradebook', headers=login()).status_code == 403
+    assert client.get('/api/courses/999/gradebook', headers=admin).status_code == 404
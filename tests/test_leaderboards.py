@@ -0,0 +1,83 @@
+import pytest
+from app import db
+from app.models import Module, CourseLeaderboard
+from app.leaderboards import leaderboards, rebuild_leaderboards_command
+
+@pytest.fixture
+def students(client, login, module):
+    """Три студента курса с оценками 5, 4 и 3 за модуль"""
+    result = []
+    for i, grade in enumerate((5, 4, 3)):
+        headers = login(f'user{i}@example.com')
+        client.post(f'/api/courses/{module.course_id}/enroll', headers=headers)
+        grade_module(client, headers, module.id, grade)
+        result.append(headers)
+    return result
+
+def grade_module(client, headers, module_id, grade):
+    response = client.post(f'/api/modules/{module_id}/assessment', headers=headers, json={'grade': grade})
+    assert response.status_code == 200, response.get_json()
+
+def top(client, headers, course_id, **params):
+    response = client.get(f'/api/courses/{course_id}/leaderboard', headers=headers, query_string=params)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+def test_top_list_is_ordered_and_admin_only(client, login, module, students):
+    admin = login('admin@example.com', role='admin')
+
+    board = top(client, admin, module.course_id)
+
+    assert board['total'] == 3
+    assert [(item['rank'], item['user_name'], item['average_grade']) for item in board['items']] == \
+        [(1, 'user0', 5.0), (2, 'user1', 4.0), (3, 'user2', 3.0)]
+    assert client.get(f'/api/courses/{module.course_id}/leaderboard', headers=students[0]).status_code == 403
+
+def test_own_rank_outside_top_k(app, client, module, students):
+    app.config['LEADERBOARD_TOP_K'] = 2
+    leaderboards.clear()
+
+    response = client.get(f'/api/courses/{module.course_id}/leaderboard/me', headers=students[2])
+
+    assert response.get_json()['rank'] == 3 and response.get_json()['total'] == 3
+    assert client.get(f'/api/courses/{module.course_id}/leaderboard/me', headers=students[0]).get_json()['rank'] == 1
+
+def test_updates_keep_board_in_sync_with_table(app, client, login, module, students):
+    app.config['LEADERBOARD_TOP_K'] = 2
+    admin = login('admin@example.com', role='admin')
+    top(client, admin, module.course_id)  # Рейтинг загружен в память
+
+    # Лидер ухудшил результат, третий - улучшил
+    grade_module(client, students[0], module.id, 1)
+    grade_module(client, students[2], module.id, 4.5)
+    incremental = top(client, admin, module.course_id)
+
+    leaderboards.clear()
+    assert top(client, admin, module.course_id) == incremental
+    assert [item['average_grade'] for item in incremental['items']] == [4.5, 4.0]
+
+def test_unenroll_removes_student(client, login, module, students):
+    admin = login('admin@example.com', role='admin')
+    top(client, admin, module.course_id)
+
+    client.delete(f'/api/courses/{module.course_id}/unenroll', headers=students[0])
+
+    board = top(client, admin, module.course_id)
+    assert board['total'] == 2
+    assert [item['average_grade'] for item in board['items']] == [4.0, 3.0]
+    assert client.get(f'/api/courses/{module.course_id}/leaderboard/me', headers=students[0]).status_code == 404
+
+def test_rebuild_command_averages_grades(app, client, module, students):
+    second = Module(course_id=module.course_id, title='Второй', content='')
+    db.session.add(second)
+    db.session.commit()
+    grade_module(client, students[0], second.id, 2)
+    CourseLeaderboard.query.delete()
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(rebuild_leaderboards_command)
+
+    assert result.exit_code == 0, result.output
+    assert 'Записей в рейтингах: 3.' in result.output
+    rows = CourseLeaderboard.query.order_by(CourseLeaderboard.average_grade.desc()).all()
+    assert [(row.average_grade, row.assessment_count) for row in rows] == [(4.0, 1), (3.5, 2), (3.0, 1)]
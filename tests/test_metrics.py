@@ -0,0 +1,81 @@
+import json
+import os
+import pytest
+from app import metrics
+from app.metrics import Registry
+
+@pytest.fixture
+def app_config(app_config):
+    return {**app_config, 'METRICS_TOKEN': 'secret'}
+
+def scrape(client, token='secret'):
+    return client.get('/metrics', headers={'Authorization': f'Bearer {token}'} if token else {})
+
+def sample(body, line_prefix):
+    """Значение первой строки выдачи, начинающейся с line_prefix (0, если такой нет)"""
+    for line in body.splitlines():
+        if line.startswith(line_prefix):
+            return float(line.rsplit(' ', 1)[1])
+    return 0
+
+def test_metrics_require_token(client):
+    assert scrape(client, token=None).status_code == 401
+    assert scrape(client, token='wrong').status_code == 401
+
+    response = scrape(client)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+
+def test_requests_and_statements_are_counted(client, module):
+    url = f'/api/modules/{module.id}'
+    line = 'http_requests_total{blueprint="courses",endpoint="courses.get_module",method="GET",status="200"}'
+    before = sample(scrape(client).get_data(as_text=True), line)
+
+    client.get(url)
+    client.get(url)
+
+    body = scrape(client).get_data(as_text=True)
+    assert sample(body, line) == before + 2
+    assert '# TYPE http_request_duration_seconds histogram' in body
+    assert 'db_statement_duration_seconds_count' in body
+    assert 'job_queue_depth{kind="password_hash_queued"}' in body
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('latency', 'Задержка', ('endpoint',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, endpoint='a"b')
+
+    body = registry.render([registry.snapshot()])
+
+    assert 'latency_bucket{endpoint="a\\"b",le="0.1"} 1' in body
+    assert 'latency_bucket{endpoint="a\\"b",le="1.0"} 2' in body
+    assert 'latency_bucket{endpoint="a\\"b",le="+Inf"} 3' in body
+    assert 'latency_count{endpoint="a\\"b"} 3' in body
+
+def test_process_files_are_merged(tmp_path):
+    registry = Registry()
+    counter = registry.counter('jobs_total', 'Задачи')
+    registry.gauge('queue', 'Очередь', lambda: {'jobs': 1})
+    counter.inc(2)
+
+    def write(pid, started, jobs, queue):
+        with open(tmp_path / f'metrics-{pid}-{started}.json', 'w') as f:
+            json.dump({'pid': pid, 'started': started, 'metrics': {'jobs_total': [[[], jobs]]},
+                       'gauges': {'queue': {'jobs': queue}}}, f)
+
+    write(os.getppid(), 1, 3, 10)   # живой воркер
+    write(2 ** 22 + 1, 1, 5, 100)   # завершившийся воркер: счетчик остается, gauge - нет
+
+    body = registry.render(registry.collect(str(tmp_path)))
+
+    assert 'jobs_total 10' in body
+    assert 'queue{kind="jobs"} 11' in body
+
+def test_cache_hits_are_labelled():
+    line = 'cache_requests_total{cache="test",result="miss"}'
+    before = sample(metrics.registry.render([metrics.registry.snapshot()]), line)
+
+    metrics.cache_hit('test', False)
+
+    assert sample(metrics.registry.render([metrics.registry.snapshot()]), line) == before + 1
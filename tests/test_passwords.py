@@ -0,0 +1,81 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app import db
+from app.models import User
+from app.passwords import password_hasher, PasswordHasherBusy, calibrate_bcrypt_command
+
+@pytest.fixture
+def single_worker():
+    """Пул из одного потока, чтобы очередь заполнялась предсказуемо"""
+    previous = password_hasher._executor, password_hasher._queue_size, password_hasher._timeout
+    password_hasher._executor = ThreadPoolExecutor(max_workers=1)
+    yield
+    password_hasher._executor.shutdown(wait=True)
+    password_hasher._executor, password_hasher._queue_size, password_hasher._timeout = previous
+
+def test_hash_and_verify_run_off_the_request_thread(app):
+    threads = []
+    password_hasher._run(lambda: threads.append(threading.current_thread()))
+    assert threads[0] is not threading.current_thread()
+
+    password_hash = password_hasher.hash('secret')
+    assert password_hasher.verify(password_hash, 'secret')
+    assert not password_hasher.verify(password_hash, 'wrong')
+
+def test_login_rehashes_after_cost_change(app, client, login):
+    login()
+    assert User.query.one().password_hash.startswith('$2b$04$')
+    app.config['BCRYPT_LOG_ROUNDS'] = 5
+
+    login()
+
+    db.session.expire_all()
+    assert User.query.one().password_hash.startswith('$2b$05$')
+    assert not password_hasher.needs_rehash(User.query.one().password_hash)
+
+def test_full_queue_is_rejected(app, single_worker):
+    password_hasher._queue_size = 1
+    release = threading.Event()
+    running = password_hasher._executor.submit(release.wait)
+    results = []
+
+    def hash_in_background():
+        try:
+            results.append(password_hasher._run(lambda: 'done'))
+        except PasswordHasherBusy:
+            results.append('busy')
+
+    waiting = threading.Thread(target=hash_in_background)
+    waiting.start()
+    time.sleep(0.1)
+    # Одна задача уже ждет в очереди - следующая отклоняется сразу
+    with pytest.raises(PasswordHasherBusy):
+        password_hasher._run(lambda: 'rejected')
+
+    release.set()
+    waiting.join()
+    running.result()
+    assert results == ['done']
+    assert password_hasher.stats()['queued'] == 0
+
+def test_timeout_cancels_queued_task_and_returns_503(app, client, single_worker):
+    password_hasher._timeout = 0.1
+    release = threading.Event()
+    password_hasher._executor.submit(release.wait)
+    rejected = password_hasher.stats()['rejected']
+
+    response = client.post('/auth/register', json={'name': 'A', 'email': 'a@example.com', 'password': 'pw'})
+
+    release.set()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert User.query.count() == 0
+    stats = password_hasher.stats()
+    assert stats['rejected'] == rejected + 1 and stats['queued'] == 0
+
+def test_calibrate_recommends_rounds(app):
+    result = app.test_cli_runner().invoke(calibrate_bcrypt_command, ['--target-ms', '1', '--samples', '1'])
+    assert result.exit_code == 0, result.output
+    assert 'Рекомендуемое значение BCRYPT_LOG_ROUNDS = 4' in result.output
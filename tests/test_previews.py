@@ -0,0 +1,75 @@
+import io
+import pytest
+from app import db
+from app import previews
+from app.models import Attachment
+
+Image = pytest.importorskip('PIL.Image')
+
+def png_bytes(size=(800, 400), color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def upload(client, headers, module_id, content, filename):
+    return client.post(f'/api/modules/{module_id}/attachments', headers=headers,
+                       data={'file': (io.BytesIO(content), filename)}, content_type='multipart/form-data')
+
+def wait_for_previews():
+    """Дождаться задач пула процессов (и их колбэков, пишущих в базу)"""
+    if previews._executor is not None:
+        previews._executor.shutdown(wait=True)
+        previews._executor = None
+    db.session.expire_all()
+
+@pytest.fixture(autouse=True)
+def one_preview_worker(app):
+    app.config['PREVIEW_WORKERS'] = 1
+    yield
+    wait_for_previews()
+
+def test_preview_is_rendered_in_background(client, login, module):
+    headers = login()
+    attachment_id = upload(client, headers, module.id, png_bytes(), 'chart.png').get_json()['attachment_id']
+
+    wait_for_previews()
+
+    attachment = db.session.get(Attachment, attachment_id)
+    assert attachment.preview_path.endswith('.preview.png')
+    response = client.get(f'/api/attachments/{attachment_id}/preview')
+    assert response.status_code == 200 and response.mimetype == 'image/png'
+    assert max(Image.open(io.BytesIO(response.data)).size) <= max(previews.PREVIEW_SIZE)
+    assert previews.pending_previews() == 0
+
+def test_same_content_reuses_ready_preview(client, login, module):
+    headers = login()
+    content = png_bytes()
+    upload(client, headers, module.id, content, 'first.png')
+    wait_for_previews()
+
+    second_id = upload(client, headers, module.id, content, 'second.png').get_json()['attachment_id']
+
+    # Превью уже есть на диске - оно отмечается сразу, без задачи в пуле
+    assert previews._executor is None
+    assert db.session.get(Attachment, second_id).preview_path is not None
+
+def test_preview_missing_for_unsupported_type(client, login, module):
+    headers = login()
+    attachment_id = upload(client, headers, module.id, b'plain text', 'notes.txt').get_json()['attachment_id']
+    assert previews._executor is None
+    assert client.get(f'/api/attachments/{attachment_id}/preview').status_code == 404
+
+def test_generate_previews_marks_every_attachment_of_a_blob(app, client, login, module):
+    headers = login()
+    content = png_bytes(color='blue')
+    ids = [upload(client, headers, module.id, content, f'copy{i}.png').get_json()['attachment_id'] for i in range(3)]
+    wait_for_previews()
+    # Вложения, загруженные до появления превью
+    Attachment.query.update({Attachment.preview_path: None})
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(previews.generate_previews_command, ['--batch-size', '2'])
+
+    assert result.exit_code == 0, result.output
+    db.session.expire_all()
+    assert all(db.session.get(Attachment, i).preview_path for i in ids)
@@ -0,0 +1,47 @@
+import json
+import logging
+import re
+import pytest
+
+@pytest.fixture
+def app_config(app_config, request):
+    return {**app_config, 'PROFILING_ENABLED': True, **getattr(request, 'param', {})}
+
+def timings(response):
+    return dict(re.findall(r'(\w+);dur=([\d.]+)', response.headers['Server-Timing']))
+
+def test_server_timing_counts_queries(client, module):
+    response = client.get(f'/api/courses/{module.course_id}/modules')
+
+    assert set(timings(response)) == {'app', 'sql', 'serialize'}
+    queries = int(re.search(r'desc="(\d+) queries"', response.headers['Server-Timing']).group(1))
+    assert queries >= 1
+    assert float(timings(response)['app']) >= float(timings(response)['sql'])
+
+def test_profile_is_logged_as_json(app, client, module, caplog):
+    with caplog.at_level(logging.INFO, logger=f'{app.name}.profiling'):
+        client.get(f'/api/modules/{module.id}')
+
+    [record] = [r for r in caplog.records if r.name == f'{app.name}.profiling']
+    entry = json.loads(record.getMessage())
+    assert (entry['path'], entry['endpoint'], entry['status']) == (f'/api/modules/{module.id}', 'courses.get_module', 200)
+    assert entry['sql_count'] >= 1 and entry['response_bytes'] > 0
+
+@pytest.mark.parametrize('app_config', [
+    {'PROFILING_SAMPLE_RATE': 0.0},
+    {'PROFILING_ENABLED': False},
+], indirect=True)
+def test_unprofiled_requests_have_no_header(app, client, module, caplog):
+    with caplog.at_level(logging.INFO, logger=f'{app.name}.profiling'):
+        response = client.get(f'/api/modules/{module.id}')
+
+    assert 'Server-Timing' not in response.headers
+    assert not [r for r in caplog.records if r.name == f'{app.name}.profiling']
+
+@pytest.mark.parametrize('app_config', [{'PROFILING_SERVER_TIMING': False}], indirect=True)
+def test_server_timing_header_can_be_disabled(app, client, module, caplog):
+    with caplog.at_level(logging.INFO, logger=f'{app.name}.profiling'):
+        response = client.get(f'/api/modules/{module.id}')
+
+    assert 'Server-Timing' not in response.headers
+    assert [r for r in caplog.records if r.name == f'{app.name}.profiling']
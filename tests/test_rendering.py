@@ -0,0 +1,59 @@
+from app import db
+from app import rendering
+from app.models import Module, RenderedContent
+
+def create_module(client, headers, course_id, content, title='Модуль'):
+    response = client.post(f'/api/courses/{course_id}/modules', headers=headers,
+                           json={'title': title, 'content': content})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['module_id']
+
+def html_of(client, module_id, **headers):
+    return client.get(f'/api/modules/{module_id}', query_string={'format': 'html'}, headers=headers)
+
+def test_html_is_sanitized_and_cached_with_etag(client, login, module):
+    module_id = create_module(client, login(), module.course_id,
+                              '# Заголовок\n\n<script>alert(1)</script>[ссылка](javascript:alert(1))')
+
+    response = html_of(client, module_id)
+
+    assert response.status_code == 200
+    html = response.get_json()['html']
+    assert '<h1>Заголовок</h1>' in html
+    assert '<script>' not in html and 'javascript:' not in html
+    assert html_of(client, module_id, **{'If-None-Match': response.headers['ETag']}).status_code == 304
+
+def test_same_text_shares_one_entry_until_last_module_changes(client, login, module):
+    headers = login()
+    first = create_module(client, headers, module.course_id, 'Общий текст')
+    second = create_module(client, headers, module.course_id, 'Общий текст')
+    shared = db.session.get(Module, first).content_hash
+    assert RenderedContent.query.filter_by(content_hash=shared).count() == 1
+
+    client.put(f'/api/modules/{first}', headers=headers, json={'content': 'Новый текст'})
+    assert db.session.get(RenderedContent, shared) is not None
+
+    client.delete(f'/api/modules/{second}', headers=headers)
+    assert db.session.get(RenderedContent, shared) is None
+    assert 'Новый текст' in html_of(client, first).get_json()['html']
+
+def test_renderer_change_rebuilds_html(app, monkeypatch, module):
+    rendered = rendering.ensure_rendered(module)
+    db.session.commit()
+    assert rendered.renderer == rendering._renderer()
+
+    monkeypatch.setattr(rendering, 'RENDERER_VERSION', '2')
+    rebuilt = rendering.ensure_rendered(module)
+
+    assert rebuilt.renderer.startswith('2')
+    assert RenderedContent.query.count() == 1
+
+def test_prerender_command_drops_unused_entries(app, module):
+    db.session.add(RenderedContent(content_hash='0' * 64, renderer='0', html='<p>старый</p>'))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(rendering.prerender_modules_command)
+
+    assert result.exit_code == 0, result.output
+    assert 'Удалено устаревших записей: 1.' in result.output
+    assert [row.content_hash for row in RenderedContent.query] == [module.content_hash]
@@ -0,0 +1,79 @@
+from datetime import datetime
+import pytest
+from werkzeug.datastructures import MultiDict
+from app import db
+from app.models import Course, Enrollment, Assessment
+from app.reports import ReportWindow
+
+def test_window_is_half_open_and_validated():
+    window = ReportWindow.from_args(MultiDict({'from': '2024-01-01', 'to': '2024-01-31', 'course_id': '7'}))
+    assert (window.start, window.end, window.course_id) == (datetime(2024, 1, 1), datetime(2024, 2, 1), 7)
+
+    params = {}
+    assert window.sql('d', params) == ' AND d >= :window_start AND d < :window_end'
+    assert params == {'window_start': '2024-01-01 00:00:00', 'window_end': '2024-02-01 00:00:00'}
+
+    with pytest.raises(ValueError, match='from must not be later than to'):
+        ReportWindow.from_args(MultiDict({'from': '2024-02-01', 'to': '2024-01-01'}))
+    with pytest.raises(ValueError, match='YYYY-MM-DD'):
+        ReportWindow.from_args(MultiDict({'to': '01.02.2024'}))
+    assert not ReportWindow.from_args(MultiDict()).bounded
+    assert ReportWindow.from_args(MultiDict(), default_days=7).bounded
+
+@pytest.fixture
+def activity(client, login, module):
+    """Второй курс; студент записан на оба курса - на второй в 2020 году - и оценен по модулю первого"""
+    other = Course(title='Go', description='')
+    db.session.add(other)
+    db.session.commit()
+    headers = login()
+    for course_id in (module.course_id, other.id):
+        client.post(f'/api/courses/{course_id}/enroll', headers=headers)
+    client.post(f'/api/modules/{module.id}/assessment', headers=headers, json={'grade': 4})
+    Enrollment.query.filter_by(course_id=other.id).update({'enrollment_date': datetime(2020, 6, 1)})
+    db.session.commit()
+    return headers, module.course_id, other.id
+
+def statistics(client, headers, url, **params):
+    response = client.get(url, headers=headers, query_string=params)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+def test_course_statistics_keep_courses_without_activity_in_window(client, activity):
+    headers, python, go = activity
+
+    result = statistics(client, headers, '/api/courses/statistics', **{'from': '2020-01-01', 'to': '2020-12-31'})
+
+    assert {item['course_id']: item['student_count'] for item in result} == {python: 0, go: 1}
+    only_go = statistics(client, headers, '/api/courses/statistics', course_id=go)
+    assert [item['course_id'] for item in only_go] == [go]
+
+def test_module_statistics_default_to_last_year(client, activity):
+    headers, python, _ = activity
+    Assessment.query.update({'assessment_date': datetime(2020, 6, 1)})
+    db.session.commit()
+
+    recent = statistics(client, headers, '/api/courses/module-statistics', course_id=python)
+    assert [(item['module_count'], item['assessment_count']) for item in recent] == [(1, 0)]
+
+    all_time = statistics(client, headers, '/api/courses/module-statistics', course_id=python, **{'from': '2000-01-01'})
+    assert [(item['module_count'], item['assessment_count'], item['average_grade']) for item in all_time] == [(1, 1, 4.0)]
+
+def test_user_statistics_filter_by_course(client, activity):
+    headers, python, go = activity
+
+    performance = statistics(client, headers, '/api/statistics/user-performance', course_id=go)
+    assert [(item['completed_assessments'], item['average_grade']) for item in performance] == [(0, 0)]
+
+    activity_stats = statistics(client, headers, '/api/statistics/user-activity', course_id=python)
+    assert [(item['enrolled_courses'], item['completed_assessments'], item['completion_rate'])
+            for item in activity_stats] == [(1, 1, 100.0)]
+
+    active = statistics(client, headers, '/api/statistics/active-users', to='2020-12-31')
+    assert [item['enrolled_courses'] for item in active] == [1]
+
+def test_invalid_dates_are_rejected_everywhere(client, login):
+    headers = login()
+    for url in ('/api/courses/popular', '/api/courses/statistics', '/api/courses/module-statistics',
+                '/api/statistics/user-performance', '/api/statistics/user-activity', '/api/statistics/active-users'):
+        assert client.get(url, headers=headers, query_string={'from': '2024-13-01'}).status_code == 400, url
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+from flask_jwt_extended import decode_token
+from app import db
+from app.models import User, RevokedToken
+from app.revocation import blocklist
+
+def jti_of(headers):
+    return decode_token(headers['Authorization'].split()[1])['jti']
+
+def test_logout_revokes_only_current_token(client, login):
+    first = login()
+    second = login()
+
+    assert client.post('/auth/logout', headers=first).status_code == 200
+
+    assert client.get('/auth/profile', headers=first).status_code == 401
+    assert client.get('/auth/profile', headers=second).status_code == 200
+
+def test_admin_revokes_token_by_jti(client, login):
+    admin = login('admin@example.com', role='admin')
+    student = login()
+
+    response = client.post('/auth/revoke', headers=admin, json={'jti': jti_of(student)})
+
+    assert response.status_code == 200
+    assert client.get('/auth/profile', headers=student).status_code == 401
+
+def test_only_admin_can_revoke(client, login):
+    student = login()
+    response = client.post('/auth/revoke', headers=student, json={'jti': jti_of(student)})
+    assert response.status_code == 403
+    assert client.get('/auth/profile', headers=student).status_code == 200
+
+def test_revocation_from_other_process_applies_after_sync(app, client, login):
+    app.config['REVOCATION_SYNC_INTERVAL'] = 3600
+    student = login()
+    user_id = User.query.filter_by(email='student@example.com').one().id
+    assert client.get('/auth/profile', headers=student).status_code == 200
+
+    # Строки, записанные другим процессом, видны только после очередной синхронизации
+    now = datetime.utcnow()
+    db.session.add(RevokedToken(user_id=user_id, revoked_before=now + timedelta(seconds=5),
+                                expires_at=now + timedelta(days=1)))
+    db.session.commit()
+    assert client.get('/auth/profile', headers=student).status_code == 200
+
+    blocklist.sync(force=True)
+    assert client.get('/auth/profile', headers=student).status_code == 401
+
+def test_sync_reads_only_new_rows(app):
+    now = datetime.utcnow()
+    rows = [RevokedToken(jti=f'jti-{i}', expires_at=now + timedelta(days=1)) for i in range(3)]
+    db.session.add_all(rows)
+    db.session.commit()
+    blocklist.sync(force=True)
+    assert blocklist._high_water == rows[-1].id
+
+    db.session.add(RevokedToken(jti='jti-late', expires_at=now + timedelta(days=1)))
+    db.session.commit()
+    blocklist.sync(force=True)
+
+    assert blocklist.is_revoked({'jti': 'jti-late'})
+    assert blocklist.is_revoked({'jti': 'jti-0'})
+    assert not blocklist.is_revoked({'jti': 'unknown'})
+
+def test_expired_entries_are_pruned(app):
+    now = datetime.utcnow()
+    db.session.add(RevokedToken(jti='old', expires_at=now - timedelta(seconds=1)))
+    db.session.add(RevokedToken(jti='fresh', expires_at=now + timedelta(days=1)))
+    db.session.commit()
+
+    blocklist.sync(force=True)
+
+    assert 'old' not in blocklist._jtis
+    assert 'fresh' in blocklist._jtis
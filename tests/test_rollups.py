@@ -0,0 +1,96 @@
+from datetime import date, datetime, timedelta
+from app import db
+from app.models import ActivityRollup, Module
+from app.rollups import backfill_activity_rollups_command
+
+def rollup_counts():
+    return {
+        (r.granularity, r.bucket, r.course_id, r.event_type): r.count
+        for r in ActivityRollup.query.all() if r.count
+    }
+
+def today_count(event_type, course_id, granularity='day'):
+    day = datetime.utcnow().date()
+    bucket = day if granularity == 'day' else day - timedelta(days=day.weekday())
+    row = db.session.get(ActivityRollup, (granularity, bucket, course_id, event_type))
+    return row.count if row else 0
+
+def test_enroll_and_unenroll_update_counts(client, login, module):
+    course_id = module.course_id
+    first, second = login(), login('second@example.com')
+    client.post(f'/api/courses/{course_id}/enroll', headers=first)
+    client.post(f'/api/courses/{course_id}/enroll', headers=second)
+    assert today_count('enrollment', course_id) == 2
+    assert today_count('enrollment', course_id, 'week') == 2
+
+    client.delete(f'/api/courses/{course_id}/unenroll', headers=second)
+
+    db.session.expire_all()
+    assert today_count('enrollment', course_id) == 1
+    assert today_count('enrollment', course_id, 'week') == 1
+
+def test_regrading_counts_one_assessment(client, login, module):
+    headers = login()
+    client.post(f'/api/courses/{module.course_id}/enroll', headers=headers)
+    client.post(f'/api/modules/{module.id}/assessment', headers=headers, json={'grade': 3})
+    client.post(f'/api/modules/{module.id}/assessment', headers=headers, json={'grade': 5})
+    assert today_count('assessment', module.course_id) == 1
+
+def test_deleted_feedback_is_subtracted(client, login, module):
+    headers = login()
+    feedback_id = client.post(f'/api/courses/{module.course_id}/feedback', headers=headers,
+                              json={'rating': 4}).get_json()['feedback_id']
+    assert today_count('feedback', module.course_id) == 1
+
+    client.delete(f'/api/feedbacks/{feedback_id}', headers=headers)
+
+    db.session.expire_all()
+    assert today_count('feedback', module.course_id) == 0
+
+def test_counts_never_go_below_zero(app):
+    # Строка, созданная до появления счетчиков, удаляется: ячейки еще нет
+    ActivityRollup.record('upload', 1, datetime(2024, 1, 3), -1)
+    ActivityRollup.record('upload', 1, datetime(2024, 1, 3), -1)
+    db.session.commit()
+    assert db.session.get(ActivityRollup, ('day', date(2024, 1, 3), 1, 'upload')).count == 0
+    assert db.session.get(ActivityRollup, ('week', date(2024, 1, 1), 1, 'upload')).count == 0
+
+def test_backfill_matches_incremental_counts(app, client, login, module):
+    other = Module(course_id=module.course_id, title='Второй', content='')
+    db.session.add(other)
+    db.session.commit()
+    for email in ('a@example.com', 'b@example.com', 'c@example.com'):
+        headers = login(email)
+        client.post(f'/api/courses/{module.course_id}/enroll', headers=headers)
+        client.post(f'/api/modules/{module.id}/assessment', headers=headers, json={'grade': 4})
+        client.post(f'/api/modules/{other.id}/assessment', headers=headers, json={'grade': 2})
+        client.post(f'/api/courses/{module.course_id}/feedback', headers=headers, json={'rating': 5})
+    client.delete(f'/api/courses/{module.course_id}/unenroll', headers=headers)
+    incremental = rollup_counts()
+
+    result = app.test_cli_runner().invoke(backfill_activity_rollups_command, ['--batch-size', '2'])
+
+    assert result.exit_code == 0, result.output
+    db.session.expire_all()
+    assert rollup_counts() == incremental
+
+def test_timeseries_fills_empty_buckets(client, login):
+    headers = login()
+    for when in (datetime(2024, 1, 1), datetime(2024, 1, 3), datetime(2024, 1, 3)):
+        ActivityRollup.record('enrollment', 7, when)
+    ActivityRollup.record('enrollment', 8, datetime(2024, 1, 9))
+    db.session.commit()
+
+    days = client.get('/api/statistics/timeseries', headers=headers, query_string={
+        'metric': 'enrollment', 'from': '2024-01-01', 'to': '2024-01-04', 'course_id': 7
+    }).get_json()['points']
+    weeks = client.get('/api/statistics/timeseries', headers=headers, query_string={
+        'metric': 'enrollment', 'granularity': 'week', 'from': '2024-01-03', 'to': '2024-01-14'
+    }).get_json()['points']
+
+    assert [p['count'] for p in days] == [1, 0, 2, 0]
+    assert weeks == [{'bucket': '2024-01-01', 'count': 3}, {'bucket': '2024-01-08', 'count': 1}]
+
+def test_timeseries_validates_metric(client, login):
+    response = client.get('/api/statistics/timeseries', headers=login(), query_string={'metric': 'views'})
+    assert response.status_code == 400
@@ -0,0 +1,81 @@
+from sqlalchemy import text
+from app import db
+from app.models import Course
+from app.search import build_match_query, rebuild_search_index_command
+
+def search(client, query, **params):
+    response = client.get('/api/search', query_string={'q': query, **params})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+def ids(result, kind):
+    return {item['id'] for item in result['items'] if item['type'] == kind}
+
+def test_course_triggers_follow_insert_update_delete(client):
+    course = Course(title='Алгоритмы на графах', description='Поиск в ширину и глубину')
+    db.session.add(course)
+    db.session.commit()
+    assert ids(search(client, 'графах'), 'course') == {course.id}
+
+    course.title = 'Динамическое программирование'
+    db.session.commit()
+    assert ids(search(client, 'графах'), 'course') == set()
+    assert ids(search(client, 'динамическое'), 'course') == {course.id}
+
+    db.session.delete(course)
+    db.session.commit()
+    assert search(client, 'динамическое')['items'] == []
+
+def test_module_index_follows_api_changes(client, login, module):
+    headers = login()
+    response = client.post(f'/api/courses/{module.course_id}/modules', headers=headers,
+                           json={'title': 'Индексы', 'content': 'B-деревья и хеш-таблицы'})
+    module_id = response.get_json()['module_id']
+    assert ids(search(client, 'деревья', type='module'), 'module') == {module_id}
+
+    client.put(f'/api/modules/{module_id}', headers=headers, json={'content': 'Транзакции и блокировки'})
+    assert ids(search(client, 'деревья', type='module'), 'module') == set()
+    assert ids(search(client, 'блокировки', type='module'), 'module') == {module_id}
+
+    client.delete(f'/api/modules/{module_id}', headers=headers)
+    assert ids(search(client, 'блокировки', type='module'), 'module') == set()
+
+def test_russian_word_forms_match(client):
+    course = Course(title='Построение индексов', description='')
+    db.session.add(course)
+    db.session.commit()
+    for query in ('индексы', 'индексами', 'индекс'):
+        assert ids(search(client, query), 'course') == {course.id}, query
+
+def test_snippet_is_escaped_and_highlighted(client):
+    db.session.add(Course(title='Безопасность', description='Экранирование <script> в шаблонах'))
+    db.session.commit()
+    snippet = search(client, 'шаблонах')['items'][0]['snippet']
+    assert '&lt;script&gt;' in snippet
+    assert '<mark>' in snippet
+
+def test_query_operators_are_not_interpreted(client):
+    assert build_match_query('NEAR(a b) OR "x') == '"near"* AND "a"* AND "b"* AND "or"* AND "x"*'
+    assert search(client, 'title: OR AND')['items'] == []
+    assert client.get('/api/search', query_string={'q': '!!!'}).status_code == 400
+
+def test_pagination_reports_next_page(client):
+    db.session.add_all([Course(title=f'Python {i}', description='') for i in range(3)])
+    db.session.commit()
+    first = search(client, 'python', per_page=2)
+    last = search(client, 'python', per_page=2, page=2)
+    assert len(first['items']) == 2 and first['has_more']
+    assert len(last['items']) == 1 and not last['has_more']
+
+def test_rebuild_indexes_existing_rows(app, client, module):
+    # Строки, добавленные в обход триггеров и приложения (например, до появления индекса)
+    db.session.execute(text("INSERT INTO courses_fts(courses_fts) VALUES ('delete-all')"))
+    db.session.execute(text('DELETE FROM modules_fts'))
+    db.session.commit()
+    assert search(client, 'python')['items'] == []
+
+    result = app.test_cli_runner().invoke(rebuild_search_index_command, ['--batch-size', '1'])
+
+    assert result.exit_code == 0, result.output
+    assert ids(search(client, 'python'), 'course') == {module.course_id}
+    assert ids(search(client, 'введение'), 'module') == {module.id}
@@ -0,0 +1,76 @@
+import pytest
+from app import db
+from app.hll import HyperLogLog, RELATIVE_ERROR
+from app.models import ActivitySketch
+from app.sketches import rebuild_activity_sketches_command
+
+@pytest.mark.parametrize('cardinality', [1000, 20000, 200000])
+def test_estimate_within_error_bounds(cardinality):
+    hll = HyperLogLog()
+    for user_id in range(cardinality):
+        hll.add(user_id)
+    # Хеш детерминирован; 3 стандартные ошибки - запас сверх ~95% интервала
+    assert abs(hll.count() - cardinality) <= 3 * RELATIVE_ERROR * cardinality
+
+def test_small_cardinalities_are_exact():
+    hll = HyperLogLog()
+    for user_id in range(50):
+        hll.add(user_id)
+    assert hll.count() == 50
+    assert HyperLogLog().count() == 0
+
+def test_repeated_values_do_not_change_sketch():
+    hll = HyperLogLog()
+    assert hll.add(42)
+    assert not hll.add(42)
+    assert hll.count() == 1
+
+def test_merge_is_union():
+    left, right, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    for user_id in range(0, 6000):
+        left.add(user_id)
+        both.add(user_id)
+    for user_id in range(4000, 10000):
+        right.add(user_id)
+        both.add(user_id)
+
+    merged = HyperLogLog.from_bytes(left.to_bytes()).merge(right)
+
+    assert merged.registers == both.registers
+    assert abs(merged.count() - 10000) <= 3 * RELATIVE_ERROR * 10000
+
+def active_students(client, headers, **params):
+    response = client.get('/api/statistics/active-students', headers=headers, query_string=params)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+def test_activity_is_recorded_per_course_and_overall(client, login, module):
+    for i in range(5):
+        headers = login(f'user{i}@example.com')
+        client.post(f'/api/courses/{module.course_id}/enroll', headers=headers)
+        client.post(f'/api/modules/{module.id}/assessment', headers=headers, json={'grade': 4})
+
+    approximate = active_students(client, headers, course_id=module.course_id)
+    exact = active_students(client, headers, course_id=module.course_id, exact='1')
+    overall = active_students(client, headers)
+
+    assert approximate['approximate'] and approximate['sketch_days'] == 1
+    assert approximate['unique_students'] == exact['unique_students'] == 5
+    assert overall['unique_students'] == 5
+    assert active_students(client, headers, course_id=module.course_id + 1)['unique_students'] == 0
+
+def test_rebuild_matches_incremental_sketches(app, client, login, module):
+    for i in range(3):
+        headers = login(f'user{i}@example.com')
+        client.post(f'/api/courses/{module.course_id}/enroll', headers=headers)
+        client.post(f'/api/modules/{module.id}/assessment', headers=headers, json={'grade': 3})
+    incremental = {(s.course_id, s.day): HyperLogLog.from_bytes(s.registers).registers
+                   for s in ActivitySketch.query.all()}
+
+    result = app.test_cli_runner().invoke(rebuild_activity_sketches_command)
+
+    assert result.exit_code == 0, result.output
+    db.session.expire_all()
+    rebuilt = {(s.course_id, s.day): HyperLogLog.from_bytes(s.registers).registers
+               for s in ActivitySketch.query.all()}
+    assert rebuilt == incremental
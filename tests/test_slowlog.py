@@ -0,0 +1,59 @@
+import json
+import pytest
+from app import slowlog
+
+@pytest.fixture
+def app_config(app_config, tmp_path, request):
+    # Абсолютный путь: журнал пишется во временный каталог, а не в instance
+    return {**app_config, 'SLOW_QUERY_THRESHOLD_MS': 0, 'SLOW_QUERY_LOG': str(tmp_path / 'slow.log'),
+            **getattr(request, 'param', {})}
+
+@pytest.fixture
+def log_entries(app, tmp_path):
+    def read():
+        with open(tmp_path / 'slow.log', encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+    yield read
+    # Логгер общий для процесса - обработчик файла этого теста снимается
+    for handler in list(slowlog._logger.handlers):
+        slowlog._logger.removeHandler(handler)
+        handler.close()
+
+def test_normalize_strips_literals_and_list_lengths():
+    first = slowlog.normalize("SELECT * FROM users WHERE email = 'a@b.c' AND id IN (?, ?, ?)  LIMIT 10")
+    second = slowlog.normalize("SELECT * FROM users\n WHERE email = 'x''y' AND id IN (?, ?) LIMIT 5")
+
+    assert first == second == 'SELECT * FROM users WHERE email = ? AND id IN (?...) LIMIT ?'
+    assert slowlog.fingerprint(first) == slowlog.fingerprint(second)
+
+def test_parameter_shape_hides_values():
+    assert slowlog.parameter_shape({'email': 'a@b.c', 'id': 1}, False) == {'email': 'str', 'id': 'int'}
+    assert slowlog.parameter_shape([(1, 'x'), (2, 'y')], True) == {'rows': 2, 'row': ['int', 'str']}
+
+def test_slow_statements_are_logged_with_plan(client, module, log_entries):
+    client.get(f'/api/modules/{module.id}')
+
+    entries = [entry for entry in log_entries() if entry['endpoint'] == 'courses.get_module']
+    assert entries
+    select = next(entry for entry in entries if entry['statement'].startswith('SELECT'))
+    assert select['plan'] and select['duration_ms'] >= 0
+    assert 'Введение' not in json.dumps(entries, ensure_ascii=False)
+
+def test_top_queries_by_total_time(client, login, module, log_entries):
+    admin = login('admin@example.com', role='admin')
+    for _ in range(3):
+        client.get(f'/api/modules/{module.id}')
+
+    response = client.get('/api/slow-queries', headers=admin, query_string={'limit': 5})
+
+    assert response.status_code == 200
+    top = response.get_json()
+    assert len(top) == 5
+    assert [group['total_ms'] for group in top] == sorted((group['total_ms'] for group in top), reverse=True)
+    assert sum(group['count'] for group in top) <= len(log_entries())
+    assert client.get('/api/slow-queries', headers=login()).status_code == 403
+
+@pytest.mark.parametrize('app_config', [{'SLOW_QUERY_THRESHOLD_MS': None}], indirect=True)
+def test_disabled_log_returns_404(client, login):
+    response = client.get('/api/slow-queries', headers=login('admin@example.com', role='admin'))
+    assert response.status_code == 404
@@ -0,0 +1,89 @@
+import io
+import os
+from app import db
+from app import storage
+from app.models import Module, Attachment, Blob, StorageUsage
+
+def upload(client, headers, module_id, content, filename='notes.pdf'):
+    return client.post(
+        f'/api/modules/{module_id}/attachments',
+        headers=headers,
+        data={'file': (io.BytesIO(content), filename)},
+        content_type='multipart/form-data'
+    )
+
+def blob_file(app, digest):
+    return os.path.join(app.config['UPLOAD_FOLDER'], storage.blob_relative_path(digest))
+
+def test_identical_uploads_share_one_blob(app, client, login, module):
+    headers = login()
+    other = Module(course_id=module.course_id, title='Второй', content='')
+    db.session.add(other)
+    db.session.commit()
+
+    first = upload(client, headers, module.id, b'syllabus' * 100)
+    second = upload(client, headers, other.id, b'syllabus' * 100, 'copy.pdf')
+
+    assert first.status_code == 201 and second.status_code == 201
+    assert first.get_json()['file_path'] == second.get_json()['file_path']
+    blobs = Blob.query.all()
+    assert len(blobs) == 1
+    assert blobs[0].ref_count == 2 and blobs[0].size == 800
+    assert os.path.exists(blob_file(app, blobs[0].hash))
+    # Временные файлы не остаются
+    assert os.listdir(os.path.join(app.config['UPLOAD_FOLDER'], storage.TMP_DIR)) == []
+
+def test_blob_removed_with_last_reference(app, client, login, module):
+    headers = login()
+    upload(client, headers, module.id, b'shared')
+    upload(client, headers, module.id, b'shared', 'again.pdf')
+    digest = Blob.query.one().hash
+    first, second = Attachment.query.order_by(Attachment.id).all()
+
+    assert client.delete(f'/api/attachments/{first.id}', headers=headers).status_code == 200
+    db.session.expire_all()
+    assert db.session.get(Blob, digest).ref_count == 1
+    assert os.path.exists(blob_file(app, digest))
+
+    assert client.delete(f'/api/attachments/{second.id}', headers=headers).status_code == 200
+    db.session.expire_all()
+    assert db.session.get(Blob, digest) is None
+    assert not os.path.exists(blob_file(app, digest))
+
+def test_storage_usage_follows_uploads_and_deletes(client, login, module):
+    headers = login()
+    upload(client, headers, module.id, b'a' * 10)
+    upload(client, headers, module.id, b'b' * 30, 'b.pdf')
+    attachment = Attachment.query.filter_by(filename='b.pdf').one()
+    client.delete(f'/api/attachments/{attachment.id}', headers=headers)
+
+    db.session.expire_all()
+    module_usage = db.session.get(StorageUsage, ('module', module.id))
+    course_usage = db.session.get(StorageUsage, ('course', module.course_id))
+    assert (module_usage.total_bytes, module_usage.file_count) == (10, 1)
+    assert (course_usage.total_bytes, course_usage.file_count) == (10, 1)
+
+def test_module_quota_rejects_upload(app, client, login, module):
+    app.config['MODULE_STORAGE_QUOTA'] = 15
+    headers = login()
+    assert upload(client, headers, module.id, b'a' * 10).status_code == 201
+    assert upload(client, headers, module.id, b'b' * 10, 'b.pdf').status_code == 413
+    assert Attachment.query.count() == 1
+
+def test_dedupe_uploads_moves_legacy_files(app, module):
+    root = app.config['UPLOAD_FOLDER']
+    os.makedirs(os.path.join(root, f'module_{module.id}'))
+    for name in ('a.txt', 'b.txt'):
+        with open(os.path.join(root, f'module_{module.id}', name), 'wb') as f:
+            f.write(b'same content')
+        db.session.add(Attachment(module_id=module.id, filename=name,
+                                  file_path=os.path.join(f'module_{module.id}', name), file_size=12))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(storage.dedupe_uploads_command)
+
+    assert result.exit_code == 0, result.output
+    blob = Blob.query.one()
+    assert blob.ref_count == 2
+    assert {a.file_path for a in Attachment.query.all()} == {storage.blob_relative_path(blob.hash)}
+    assert not os.path.exists(os.path.join(root, f'module_{module.id}'))
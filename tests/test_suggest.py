@@ -0,0 +1,68 @@
+from app import db
+from app.models import Course
+from app.suggest import title_index
+
+def suggest(client, prefix, **params):
+    response = client.get('/api/courses/suggest', query_string={'prefix': prefix, **params})
+    assert response.status_code == 200, response.get_json()
+    return [(item['type'], item['title']) for item in response.get_json()]
+
+def create_course(client, headers, title):
+    return client.post('/api/courses', headers=headers, json={'title': title}).get_json()['course_id']
+
+def test_prefix_matches_any_word_case_insensitively(client, login):
+    headers = login()
+    create_course(client, headers, 'Машинное обучение')
+    create_course(client, headers, 'Python для анализа данных')
+
+    assert suggest(client, 'обу') == [('course', 'Машинное обучение')]
+    assert suggest(client, 'PYTHON  для') == [('course', 'Python для анализа данных')]
+    assert suggest(client, 'анализа д') == [('course', 'Python для анализа данных')]
+    assert suggest(client, 'нет такого') == []
+
+def test_results_ranked_by_enrollments(client, login):
+    headers = login()
+    quiet = create_course(client, headers, 'Python: основы')
+    popular = create_course(client, headers, 'Python: веб')
+    suggest(client, 'py')  # Индекс построен и ответ закеширован
+    for i in range(2):
+        client.post(f'/api/courses/{popular}/enroll', headers=login(f'user{i}@example.com'))
+
+    response = client.get('/api/courses/suggest', query_string={'prefix': 'py'}).get_json()
+
+    assert [item['id'] for item in response] == [popular, quiet]
+    assert response[0]['enrollment_count'] == 2
+
+def test_index_follows_course_and_module_changes(client, login):
+    headers = login()
+    suggest(client, 'x')
+    course_id = create_course(client, headers, 'Базы данных')
+    module_id = client.post(f'/api/courses/{course_id}/modules', headers=headers,
+                            json={'title': 'Индексы и планы', 'content': '...'}).get_json()['module_id']
+    assert suggest(client, 'инд', type='module') == [('module', 'Индексы и планы')]
+
+    client.put(f'/api/courses/{course_id}', headers=headers, json={'title': 'СУБД'})
+    assert suggest(client, 'баз') == []
+    assert suggest(client, 'суб') == [('course', 'СУБД')]
+
+    client.delete(f'/api/modules/{module_id}', headers=headers)
+    client.delete(f'/api/courses/{course_id}', headers=headers)
+    assert suggest(client, 'суб') == [] and suggest(client, 'инд') == []
+
+def test_changes_from_other_processes_after_refresh(app, client):
+    suggest(client, 'x')
+    # Курс добавлен в обход индекса этого процесса
+    db.session.add(Course(title='Теория графов', description=''))
+    db.session.commit()
+    assert suggest(client, 'граф') == []
+
+    app.config['SUGGEST_REFRESH_INTERVAL'] = 0
+    assert suggest(client, 'граф') == [('course', 'Теория графов')]
+
+def test_limit_and_type_validation(client, login):
+    headers = login()
+    for i in range(5):
+        create_course(client, headers, f'Курс {i}')
+    assert len(suggest(client, 'курс', limit=3)) == 3
+    assert client.get('/api/courses/suggest', query_string={'prefix': 'к', 'type': 'user'}).status_code == 400
+    assert title_index.suggest('   ') == []
@@ -0,0 +1,95 @@
+import io
+import os
+import time
+from datetime import datetime, timedelta
+from app import db
+from app import storage
+from app.models import Attachment, Blob, StorageUsage, UploadSession
+from app.sweeper import sweep_orphans, sweep_uploads_command
+
+def write_file(path, content=b'orphan', age=7200):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    past = time.time() - age
+    os.utime(path, (past, past))
+    return path
+
+def upload(client, headers, module_id, content, filename='notes.pdf'):
+    return client.post(f'/api/modules/{module_id}/attachments', headers=headers,
+                       data={'file': (io.BytesIO(content), filename)}, content_type='multipart/form-data')
+
+def test_unreferenced_blob_files_are_removed(app, client, login, module):
+    upload(client, login(), module.id, b'kept')
+    kept = storage.absolute_path(storage.blob_relative_path(Blob.query.one().hash))
+    os.utime(kept, (time.time() - 7200,) * 2)
+    orphan = write_file(storage.absolute_path(storage.blob_relative_path('ab' * 32)))
+    recent = write_file(storage.absolute_path(storage.blob_relative_path('cd' * 32)), age=0)
+
+    stats = sweep_orphans()
+
+    assert not os.path.exists(orphan)
+    assert os.path.exists(kept)
+    # Свежий файл может принадлежать еще не закоммиченной загрузке
+    assert os.path.exists(recent)
+    assert stats['removed_files'] == 1 and stats['reclaimed_bytes'] == len(b'orphan')
+
+def test_ref_counts_are_repaired(client, login, module):
+    headers = login()
+    upload(client, headers, module.id, b'same')
+    upload(client, headers, module.id, b'same', 'again.pdf')
+    Blob.query.update({Blob.ref_count: 5})
+    db.session.commit()
+
+    stats = sweep_orphans()
+
+    db.session.expire_all()
+    assert Blob.query.one().ref_count == 2
+    assert stats['fixed_ref_counts'] == 1
+
+def test_legacy_files_without_records_are_removed(app, module):
+    root = app.config['UPLOAD_FOLDER']
+    known = write_file(os.path.join(root, 'module_1', 'known.txt'))
+    orphan = write_file(os.path.join(root, 'module_1', 'orphan.txt'))
+    db.session.add(Attachment(module_id=module.id, filename='known.txt',
+                              file_path=os.path.join('module_1', 'known.txt'), file_size=6))
+    db.session.commit()
+
+    sweep_orphans()
+
+    assert os.path.exists(known)
+    assert not os.path.exists(orphan)
+
+def test_expired_upload_sessions_are_removed(client, login, module):
+    headers = login()
+    upload_id = client.post(f'/api/modules/{module.id}/uploads', headers=headers,
+                            json={'filename': 'big.pdf'}).get_json()['upload_id']
+    temp_path = storage.absolute_path(db.session.get(UploadSession, upload_id).temp_path)
+    UploadSession.query.update({UploadSession.updated_at: datetime.utcnow() - timedelta(days=2)})
+    db.session.commit()
+    stray = write_file(storage.absolute_path(os.path.join(storage.TMP_DIR, 'stray')))
+
+    stats = sweep_orphans()
+
+    db.session.expire_all()
+    assert db.session.get(UploadSession, upload_id) is None
+    assert not os.path.exists(temp_path) and not os.path.exists(stray)
+    assert stats['expired_sessions'] == 1
+
+def test_storage_usage_rebuild_matches_incremental(app, client, login, module):
+    headers = login()
+    for i, size in enumerate((10, 20, 30)):
+        upload(client, headers, module.id, bytes([i]) * size, f'{i}.pdf')
+    client.delete(f'/api/attachments/{Attachment.query.first().id}', headers=headers)
+    incremental = {(u.scope, u.scope_id): (u.total_bytes, u.file_count) for u in StorageUsage.query.all()}
+
+    storage.rebuild_storage_usage()
+
+    rebuilt = {(u.scope, u.scope_id): (u.total_bytes, u.file_count) for u in StorageUsage.query.all()}
+    assert rebuilt == incremental == {('module', module.id): (50, 2), ('course', module.course_id): (50, 2)}
+
+def test_sweep_command_reports_stats(app):
+    write_file(storage.absolute_path(storage.blob_relative_path('ef' * 32)))
+    result = app.test_cli_runner().invoke(sweep_uploads_command)
+    assert result.exit_code == 0, result.output
+    assert 'Удалено файлов: 1 (6 байт)' in result.output
@@ -0,0 +1,69 @@
+from sqlalchemy import text
+from app import db
+from app.models import Module, ModuleContent, Notification, User
+from app.textstore import encode_text, decode_text, migrate_text_columns_command, MIN_COMPRESSED_SIZE
+
+LONG_TEXT = 'Повторяющийся текст модуля. ' * 100
+
+def test_short_texts_and_disabled_compression_stay_raw(app):
+    assert encode_text('коротко') == ('none', 'коротко'.encode('utf-8'))
+    assert encode_text(None) == ('none', b'')
+    assert encode_text('x' * (MIN_COMPRESSED_SIZE - 1))[0] == 'none'
+
+    app.config['TEXT_COMPRESSION'] = 'none'
+    assert encode_text(LONG_TEXT) == ('none', LONG_TEXT.encode('utf-8'))
+
+def test_long_text_round_trips_compressed(app):
+    codec, data = encode_text(LONG_TEXT)
+
+    assert codec == 'zlib' and len(data) < len(LONG_TEXT.encode('utf-8'))
+    assert decode_text(codec, data) == LONG_TEXT
+
+def test_module_content_lives_in_side_table(app, module):
+    module.content = LONG_TEXT
+    db.session.commit()
+    db.session.expire_all()
+
+    stored = db.session.get(ModuleContent, module.id)
+    assert stored.codec == 'zlib'
+    assert db.session.get(Module, module.id).content == LONG_TEXT
+    assert db.session.get(Module, module.id).content_length == len(LONG_TEXT)
+
+def test_module_api_reads_compressed_content(client, module):
+    module.content = LONG_TEXT
+    db.session.commit()
+
+    response = client.get(f'/api/modules/{module.id}')
+
+    assert response.status_code == 200
+    assert response.get_json()['content'] == LONG_TEXT
+
+def test_migrate_moves_legacy_columns(app, login, module):
+    login()
+    user_id = User.query.one().id
+    # Схема до переноса: тексты в самих таблицах, побочных строк нет
+    db.session.execute(text("ALTER TABLE modules ADD COLUMN content TEXT NOT NULL DEFAULT ''"))
+    db.session.execute(text("ALTER TABLE notifications ADD COLUMN message TEXT NOT NULL DEFAULT ''"))
+    db.session.execute(text('DELETE FROM module_contents'))
+    db.session.execute(text('UPDATE modules SET content = :content, content_length = 0'), {'content': LONG_TEXT})
+    db.session.execute(text("""
+        INSERT INTO notifications (user_id, title, message, message_length, is_read)
+        VALUES (:user_id, 'Новость', 'Короткое сообщение', 0, 0)
+    """), {'user_id': user_id})
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(migrate_text_columns_command, ['--batch-size', '1'])
+
+    assert result.exit_code == 0, result.output
+    assert 'modules.content: колонка удалена.' in result.output
+    db.session.expire_all()
+    columns = {row[1] for row in db.session.execute(text('PRAGMA table_info(modules)'))}
+    assert 'content' not in columns
+    migrated = db.session.get(Module, module.id)
+    assert migrated.content == LONG_TEXT and migrated.content_length == len(LONG_TEXT)
+    notification = Notification.query.one()
+    assert notification.message == 'Короткое сообщение' and notification.body.codec == 'none'
+
+    # Повторный запуск ничего не переносит
+    again = app.test_cli_runner().invoke(migrate_text_columns_command)
+    assert again.exit_code == 0 and 'modules.content: уже перенесено.' in again.output
@@ -0,0 +1,106 @@
+import hashlib
+import os
+from app import db
+from app import attachments
+from app.models import Attachment, Blob, UploadSession
+
+DATA = bytes(range(256)) * 1200  # 307200 байт
+
+def start(client, headers, module_id, total_size=len(DATA)):
+    response = client.post(f'/api/modules/{module_id}/uploads', headers=headers,
+                           json={'filename': 'lecture.pdf', 'total_size': total_size})
+    assert response.status_code == 201
+    return response.get_json()['upload_id']
+
+def put(client, headers, upload_id, offset, chunk, checksum=None):
+    if checksum is not None:
+        headers = {**headers, 'X-Chunk-SHA256': checksum}
+    return client.put(f'/api/uploads/{upload_id}?offset={offset}', headers=headers, data=chunk)
+
+def test_chunks_are_accepted_in_order(client, login, module):
+    headers = login()
+    upload_id = start(client, headers, module.id)
+
+    response = put(client, headers, upload_id, 0, DATA[:100000])
+    assert response.get_json()['offset'] == 100000
+    assert response.get_json()['chunk_sha256'] == hashlib.sha256(DATA[:100000]).hexdigest()
+
+    # Повтор уже принятой части и пропуск вперед отклоняются с текущим смещением
+    for offset in (0, 200000):
+        response = put(client, headers, upload_id, offset, DATA[offset:offset + 1000])
+        assert response.status_code == 409
+        assert response.get_json()['offset'] == 100000
+
+    assert client.get(f'/api/uploads/{upload_id}', headers=headers).get_json()['offset'] == 100000
+
+def test_corrupted_chunk_is_discarded(client, login, module):
+    headers = login()
+    upload_id = start(client, headers, module.id)
+    put(client, headers, upload_id, 0, DATA[:100000])
+
+    response = put(client, headers, upload_id, 100000, DATA[100000:200000], checksum='0' * 64)
+
+    assert response.status_code == 400
+    assert response.get_json()['offset'] == 100000
+    upload = db.session.get(UploadSession, upload_id)
+    assert os.path.getsize(os.path.join(client.application.config['UPLOAD_FOLDER'], upload.temp_path)) == 100000
+
+def test_chunk_beyond_declared_size_is_rejected(client, login, module):
+    headers = login()
+    upload_id = start(client, headers, module.id, total_size=10)
+    assert put(client, headers, upload_id, 0, b'x' * 11).status_code == 400
+
+def test_finalize_requires_all_chunks(client, login, module):
+    headers = login()
+    upload_id = start(client, headers, module.id)
+    put(client, headers, upload_id, 0, DATA[:100000])
+
+    response = client.post(f'/api/uploads/{upload_id}/finalize', headers=headers)
+
+    assert response.status_code == 409
+    assert response.get_json()['offset'] == 100000
+
+def test_resumed_upload_produces_same_blob(client, login, module):
+    headers = login()
+    upload_id = start(client, headers, module.id)
+    put(client, headers, upload_id, 0, DATA[:100000])
+    # Следующие части принимает "другой процесс" без хеша в памяти
+    attachments._upload_hashers.clear()
+    put(client, headers, upload_id, 100000, DATA[100000:])
+
+    response = client.post(f'/api/uploads/{upload_id}/finalize', headers=headers,
+                           json={'sha256': hashlib.sha256(DATA).hexdigest()})
+
+    assert response.status_code == 201
+    attachment = Attachment.query.one()
+    assert attachment.content_hash == hashlib.sha256(DATA).hexdigest()
+    assert attachment.file_size == len(DATA)
+    assert Blob.query.one().ref_count == 1
+    assert db.session.get(UploadSession, upload_id) is None
+
+def test_finalize_rejects_wrong_file_checksum(client, login, module):
+    headers = login()
+    upload_id = start(client, headers, module.id)
+    put(client, headers, upload_id, 0, DATA)
+
+    response = client.post(f'/api/uploads/{upload_id}/finalize', headers=headers, json={'sha256': '0' * 64})
+
+    assert response.status_code == 400
+    assert Attachment.query.count() == 0
+
+def test_upload_belongs_to_its_owner(client, login, module):
+    upload_id = start(client, login(), module.id)
+    other = login('other@example.com')
+    assert client.get(f'/api/uploads/{upload_id}', headers=other).status_code == 403
+    assert put(client, other, upload_id, 0, b'x').status_code == 403
+
+def test_abort_removes_session_and_temp_file(client, login, module):
+    headers = login()
+    upload_id = start(client, headers, module.id)
+    put(client, headers, upload_id, 0, DATA[:1000])
+    temp_path = os.path.join(client.application.config['UPLOAD_FOLDER'], db.session.get(UploadSession, upload_id).temp_path)
+
+    assert client.delete(f'/api/uploads/{upload_id}', headers=headers).status_code == 200
+    db.session.expire_all()
+    assert db.session.get(UploadSession, upload_id) is None
+    assert not os.path.exists(temp_path)